@@ -1,8 +1,16 @@
 import os
+import hashlib
+import logging
+import math
+import secrets
+import threading
+import time
+from contextlib import contextmanager
 from sqlmodel import Session, create_engine
+from sqlalchemy import text
 from pydantic import BaseModel, Field, field_validator
-from fastapi import HTTPException,status,Depends
-from typing import Annotated,List
+from fastapi import HTTPException,status,Depends,Request
+from typing import Annotated,List,Optional
 
 
 
@@ -11,6 +19,116 @@ class Settings(BaseModel):
     ALLOWED_ORIGINS: List[str] = Field(default_factory=list)
     REQUEST_TIMEOUT: float = float(os.getenv("REQUEST_TIMEOUT", "5.0"))
     RETRIES: int = int(os.getenv("RETRIES", "2"))
+    # hilos para conciliaciones en lote: tope de lo que puede pedir un cliente; conciliar_lote
+    # además nunca usa más de la mitad del pool
+    CONCILIACION_WORKERS: int = int(os.getenv("CONCILIACION_WORKERS", "4"))
+    # cola de trabajos: espera entre sondeos, segundos sin latido para reencolar, cada cuánto
+    # late un trabajo en ejecución (muy por debajo de TRABAJOS_TIMEOUT) y reintentos
+    TRABAJOS_POLL: float = float(os.getenv("TRABAJOS_POLL", "2.0"))
+    TRABAJOS_TIMEOUT: int = int(os.getenv("TRABAJOS_TIMEOUT", "900"))
+    TRABAJOS_LATIDO: float = float(os.getenv("TRABAJOS_LATIDO", "30"))
+    TRABAJOS_MAX_INTENTOS: int = int(os.getenv("TRABAJOS_MAX_INTENTOS", "3"))
+    # cache de reportes: "memoria", "redis" o "ninguno"
+    REPORT_CACHE_BACKEND: str = os.getenv("REPORT_CACHE_BACKEND", "memoria")
+    REPORT_CACHE_URL: str = os.getenv("REPORT_CACHE_URL", "redis://localhost:6379/0")
+    REPORT_CACHE_MAX: int = int(os.getenv("REPORT_CACHE_MAX", "1024"))
+    REPORT_CACHE_TTL: int = int(os.getenv("REPORT_CACHE_TTL", "300"))
+    # outbox de eventos: destino del relay ("archivo" o "webhook"), tamaño de lote y retención
+    OUTBOX_SINK: str = os.getenv("OUTBOX_SINK", "archivo")
+    OUTBOX_WEBHOOK_URL: str = os.getenv("OUTBOX_WEBHOOK_URL", "")
+    OUTBOX_ARCHIVO: str = os.getenv("OUTBOX_ARCHIVO", "eventos_outbox.ndjson")
+    OUTBOX_LOTE: int = int(os.getenv("OUTBOX_LOTE", "200"))
+    OUTBOX_POLL: float = float(os.getenv("OUTBOX_POLL", "1.0"))
+    OUTBOX_RETENCION_DIAS: int = int(os.getenv("OUTBOX_RETENCION_DIAS", "7"))
+    # réplica de lectura (opcional): reportes y listados; después de escribir, el mismo cliente
+    # lee del primario durante REPLICA_VENTANA segundos (el registro de escrituras es de cada
+    # proceso: con varias réplicas de la API solo vale si el balanceador fija el cliente a un
+    # proceso); con más de REPLICA_MAX_LAG de atraso todo se lee del primario
+    POSTGRES_READ_URL: Optional[str] = os.getenv("POSTGRES_READ_URL") or None
+    REPLICA_VENTANA: float = float(os.getenv("REPLICA_VENTANA", "5"))
+    REPLICA_MAX_LAG: float = float(os.getenv("REPLICA_MAX_LAG", "10"))
+    # psycopg prepara en el servidor una sentencia después de N ejecuciones en la conexión;
+    # "none" lo desactiva
+    PG_PREPARE_THRESHOLD: Optional[int] = (
+        None if os.getenv("PG_PREPARE_THRESHOLD", "5").lower() in ("none", "")
+        else int(os.getenv("PG_PREPARE_THRESHOLD", "5"))
+    )
+    # detrás de PgBouncer en modo transaction: sin parámetros de sesión al conectar (todo el SQL
+    # va calificado con bancos.) y sin prepared statements, salvo que el pooler los maneje
+    # (PgBouncer >= 1.21 con max_prepared_statements > 0 => PGBOUNCER_PREPARED=1)
+    PGBOUNCER_MODE: bool = os.getenv("PGBOUNCER_MODE", "0") == "1"
+    PGBOUNCER_PREPARED: bool = os.getenv("PGBOUNCER_PREPARED", "0") == "1"
+    # proyección de caja: días entre emisión y cobro esperado de un cheque; horizonte máximo
+    FORECAST_DIAS_COBRO_CHEQUE: int = int(os.getenv("FORECAST_DIAS_COBRO_CHEQUE", "3"))
+    FORECAST_MAX_DIAS: int = int(os.getenv("FORECAST_MAX_DIAS", "365"))
+    # optimizador de pagos: facturas alrededor del corte del greedy que se resuelven con DP
+    # y cuántas unidades de capacidad usa la DP
+    OPTIMIZADOR_NUCLEO: int = int(os.getenv("OPTIMIZADOR_NUCLEO", "400"))
+    OPTIMIZADOR_RESOLUCION: int = int(os.getenv("OPTIMIZADOR_RESOLUCION", "20000"))
+    # exportación a Parquet/Arrow: filas por lote (= row group) y compresión (zstd, snappy, lz4, none)
+    EXPORT_FILAS_LOTE: int = int(os.getenv("EXPORT_FILAS_LOTE", "100000"))
+    EXPORT_COMPRESION: str = os.getenv("EXPORT_COMPRESION", "zstd")
+    # histórico de movimientos: filas por transacción al archivar
+    HISTORICO_LOTE: int = int(os.getenv("HISTORICO_LOTE", "5000"))
+    # búsqueda por texto: cuántas filas recientes se revisan (por el índice de fecha) antes de
+    # ir a los índices de trigramas
+    BUSQUEDA_VENTANA: int = int(os.getenv("BUSQUEDA_VENTANA", "2000"))
+    # control de admisión (services/admision.py): tasa por cliente (tokens/s y ráfaga; un reporte
+    # cuesta ADMISION_COSTO_REPORTE), requests simultáneos en total / por cliente / por ruta,
+    # cupos reservados a escrituras, espera máxima en cola por clase y espera del pool (s) desde
+    # la que se rechazan reportes (y lecturas al doble)
+    ADMISION_ACTIVA: bool = os.getenv("ADMISION_ACTIVA", "1") == "1"
+    ADMISION_RPS: float = float(os.getenv("ADMISION_RPS", "20"))
+    ADMISION_RAFAGA: float = float(os.getenv("ADMISION_RAFAGA", "40"))
+    ADMISION_COSTO_REPORTE: float = float(os.getenv("ADMISION_COSTO_REPORTE", "5"))
+    ADMISION_MAX_CONCURRENCIA: int = int(os.getenv("ADMISION_MAX_CONCURRENCIA", "15"))
+    ADMISION_RESERVA_ESCRITURAS: int = int(os.getenv("ADMISION_RESERVA_ESCRITURAS", "4"))
+    ADMISION_MAX_REPORTES: int = int(os.getenv("ADMISION_MAX_REPORTES", "4"))
+    ADMISION_MAX_POR_CLIENTE: int = int(os.getenv("ADMISION_MAX_POR_CLIENTE", "6"))
+    ADMISION_MAX_POR_RUTA: int = int(os.getenv("ADMISION_MAX_POR_RUTA", "10"))
+    ADMISION_ESPERA_ESCRITURA: float = float(os.getenv("ADMISION_ESPERA_ESCRITURA", "5"))
+    ADMISION_ESPERA_LECTURA: float = float(os.getenv("ADMISION_ESPERA_LECTURA", "1"))
+    ADMISION_ESPERA_REPORTE: float = float(os.getenv("ADMISION_ESPERA_REPORTE", "0.2"))
+    ADMISION_POOL_UMBRAL: float = float(os.getenv("ADMISION_POOL_UMBRAL", "0.25"))
+    # calentamiento al arrancar (services/arranque.py): si se hace y cuántas conexiones del pool
+    # se abren de antemano (no pasa del tamaño del pool); /ready responde 503 hasta terminar
+    ARRANQUE_CALENTAR: bool = os.getenv("ARRANQUE_CALENTAR", "1") == "1"
+    ARRANQUE_CONEXIONES: int = int(os.getenv("ARRANQUE_CONEXIONES", "5"))
+    # compresión de respuestas (services/compresion.py): tamaño mínimo en bytes y niveles; br
+    # solo si está instalado el paquete brotli
+    COMPRESION_ACTIVA: bool = os.getenv("COMPRESION_ACTIVA", "1") == "1"
+    COMPRESION_MINIMO: int = int(os.getenv("COMPRESION_MINIMO", "1024"))
+    COMPRESION_GZIP_NIVEL: int = int(os.getenv("COMPRESION_GZIP_NIVEL", "6"))
+    COMPRESION_BROTLI_CALIDAD: int = int(os.getenv("COMPRESION_BROTLI_CALIDAD", "4"))
+    # servicio de compras (services/compras_cliente.py): URL base, conexiones del pool, HTTP/2
+    # (necesita el paquete h2), TTL y tamaño del cache de proveedores, y circuito: fallas
+    # seguidas que lo abren y segundos abierto antes de probar de nuevo. Timeout y reintentos
+    # son REQUEST_TIMEOUT y RETRIES.
+    INVENTORY_URL: str = os.getenv("INVENTORY_URL", "http://localhost:8100")
+    COMPRAS_MAX_CONEXIONES: int = int(os.getenv("COMPRAS_MAX_CONEXIONES", "20"))
+    COMPRAS_HTTP2: bool = os.getenv("COMPRAS_HTTP2", "1") == "1"
+    COMPRAS_CACHE_TTL: float = float(os.getenv("COMPRAS_CACHE_TTL", "300"))
+    COMPRAS_CACHE_MAX: int = int(os.getenv("COMPRAS_CACHE_MAX", "5000"))
+    COMPRAS_CIRCUITO_FALLAS: int = int(os.getenv("COMPRAS_CIRCUITO_FALLAS", "5"))
+    COMPRAS_CIRCUITO_ESPERA: float = float(os.getenv("COMPRAS_CIRCUITO_ESPERA", "30"))
+    # sincronización incremental desde compras (function/fsincronizacion.py): cambios por
+    # página pedida al servicio (= filas por transacción)
+    SYNC_COMPRAS_LOTE: int = int(os.getenv("SYNC_COMPRAS_LOTE", "2000"))
+    # verificador de integridad (function/fverificacion.py): tramos por verificación, hilos
+    # (cada uno con su conexión) y hallazgos máximos por tramo
+    VERIFICACION_TRAMOS: int = int(os.getenv("VERIFICACION_TRAMOS", "16"))
+    VERIFICACION_WORKERS: int = int(os.getenv("VERIFICACION_WORKERS", "4"))
+    VERIFICACION_MAX_HALLAZGOS: int = int(os.getenv("VERIFICACION_MAX_HALLAZGOS", "1000"))
+    # importación masiva de facturas (function/fimportacion.py): tamaño máximo del archivo;
+    # hasta IMPORTACION_MEMORIA_MB se guarda en memoria y el resto en un temporal en disco;
+    # work_mem de la transacción de importación
+    IMPORTACION_MAX_MB: int = int(os.getenv("IMPORTACION_MAX_MB", "200"))
+    IMPORTACION_MEMORIA_MB: int = int(os.getenv("IMPORTACION_MEMORIA_MB", "8"))
+    IMPORTACION_WORK_MEM: str = os.getenv("IMPORTACION_WORK_MEM", "64MB")
+    # clave HMAC de los cursores de paginación (estado de cuenta); distinta de JWT_SECRET para
+    # que un cursor no sirva como token. Sin valor se genera una por proceso y los cursores
+    # solo valen en el proceso que los emitió: con varias réplicas de la API hay que fijarla
+    CURSOR_SECRET: str = os.getenv("CURSOR_SECRET") or secrets.token_hex(32)
 
     @field_validator("ALLOWED_ORIGINS", mode="before")
     @classmethod
@@ -35,14 +153,56 @@ def _normalize_url(u: str) -> str:
         u = u.replace("postgresql://", "postgresql+psycopg://", 1)
     return u
 
+def _connect_args(**extra) -> dict:
+    if settings.PGBOUNCER_MODE:
+        # el pooler rechaza/ignora "options" y el search_path no sobreviviría al cambio de conexión
+        umbral = settings.PG_PREPARE_THRESHOLD if settings.PGBOUNCER_PREPARED else None
+        return {"prepare_threshold": umbral, **extra}
+    return {"options": "-c search_path=bancos,public", "prepare_threshold": settings.PG_PREPARE_THRESHOLD, **extra}
+
 DB_URL = _normalize_url(settings.POSTGRES_URL) 
-engine = create_engine(DB_URL, pool_pre_ping=True, echo=False,connect_args={"options": "-c search_path=bancos,public"},)
+engine = create_engine(DB_URL, pool_pre_ping=True, echo=False,connect_args=_connect_args(),)
+# sin réplica configurada las lecturas van al mismo engine
+read_engine = (
+    create_engine(_normalize_url(settings.POSTGRES_READ_URL), pool_pre_ping=True, echo=False,
+                  # una réplica caída no debe colgar las lecturas: se cae al primario
+                  connect_args=_connect_args(connect_timeout=3),)
+    if settings.POSTGRES_READ_URL else engine
+)
+
+def conexiones_maximas(eng=engine) -> int:
+    """ conexiones que el pool puede tener abiertas a la vez (pool_size + max_overflow) """
+    return eng.pool.size() + max(0, getattr(eng.pool, "_max_overflow", 0))
+
+#---------------- espera del pool ----------------
+_espera_pool = {"valor": 0.0, "t": time.monotonic()}
+_ESPERA_POOL_TAU = 5.0   # segundos: sin muestras nuevas la medición se olvida sola
+
+
+def _abrir(session: Session) -> Session:
+    # toma la conexión de una vez (el endpoint la usaría igual) para medir cuánto esperó el pool
+    inicio = time.monotonic()
+    session.connection()
+    ahora = time.monotonic()
+    anterior = espera_pool(ahora)
+    _espera_pool["valor"], _espera_pool["t"] = anterior + 0.2 * ((ahora - inicio) - anterior), ahora
+    return session
+
+
+def espera_pool(ahora: Optional[float] = None) -> float:
+    """ promedio móvil de la espera por una conexión (s), decae con el tiempo sin requests """
+    ahora = time.monotonic() if ahora is None else ahora
+    return _espera_pool["valor"] * math.exp(-(ahora - _espera_pool["t"]) / _ESPERA_POOL_TAU)
+
 
 def get_session():
     try: 
     
         with Session(engine) as session:
-            yield session
+            yield _abrir(session)
+    except HTTPException:
+        # errores de negocio lanzados por el endpoint: se propagan tal cual
+        raise
     except Exception as e: 
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -51,3 +211,157 @@ def get_session():
         
 SessionDep = Annotated[Session,Depends(get_session)]
 
+
+#---------------- réplica de lectura ----------------
+log = logging.getLogger("bancos.db")
+
+_METODOS_LECTURA = {"GET", "HEAD", "OPTIONS"}
+_escrituras: dict[str, float] = {}   # cliente -> monotonic de su última escritura
+_escrituras_lock = threading.Lock()
+# lsn: hasta dónde había reproducido el WAL la réplica en la última medición
+_lag = {"valor": 0.0, "medido": -1.0, "lsn": 0}
+# posición del WAL del primario después de la última escritura de este proceso
+_lsn_escrito = {"valor": 0}
+_LSN_DESCONOCIDO = 2**64
+
+
+def _lsn_a_int(lsn: Optional[str]) -> int:
+    # pg_lsn "16/B374D848" -> entero comparable
+    if not lsn:
+        return 0
+    alto, _, bajo = lsn.partition("/")
+    return (int(alto, 16) << 32) + int(bajo, 16)
+
+
+def clave_cliente(request: Request) -> str:
+    # el token identifica al usuario sin decodificarlo; sin token, la IP
+    auth = request.headers.get("Authorization")
+    if auth:
+        return hashlib.sha1(auth.encode()).hexdigest()
+    return request.client.host if request.client else "anonimo"
+
+
+def es_escritura(request: Request) -> bool:
+    return read_engine is not engine and request.method not in _METODOS_LECTURA
+
+
+def registrar_escritura(request: Request) -> None:
+    """
+    Lo llama el middleware (en un hilo: consulta al primario) después de cada request de
+    escritura exitoso. Guarda cuándo escribió el cliente y la posición del WAL del primario,
+    con la que get_read_session decide si lo leído de la réplica ya incluye la escritura.
+    Ambos registros son del proceso: las escrituras de otros procesos no se ven aquí.
+    """
+    if not es_escritura(request):
+        return
+    ahora = time.monotonic()
+    with _escrituras_lock:
+        _escrituras[clave_cliente(request)] = ahora
+        if len(_escrituras) > 10000:
+            limite = ahora - settings.REPLICA_VENTANA
+            for k in [k for k, t in _escrituras.items() if t < limite]:
+                del _escrituras[k]
+    try:
+        with engine.connect() as cn:
+            lsn = _lsn_a_int(cn.execute(text("SELECT pg_current_wal_lsn()::text")).scalar())
+    except Exception as e:
+        log.warning("No se pudo leer la posición del WAL del primario: %s", e)
+        # sin la posición no se sabe cuándo la réplica la alcanza: nada se guarda en el cache
+        # desde la réplica hasta la próxima escritura registrada (su LSN es posterior)
+        with _escrituras_lock:
+            _lsn_escrito["valor"] = _LSN_DESCONOCIDO
+        return
+    with _escrituras_lock:
+        previo = _lsn_escrito["valor"]
+        _lsn_escrito["valor"] = lsn if previo == _LSN_DESCONOCIDO else max(previo, lsn)
+
+
+def _escribio_hace_poco(request: Request) -> bool:
+    t = _escrituras.get(clave_cliente(request))
+    return t is not None and time.monotonic() - t < settings.REPLICA_VENTANA
+
+
+def lag_replica() -> float:
+    """
+    Segundos de atraso aproximados de la réplica (para elegir de dónde leer), medido a lo más
+    una vez por segundo. Si ya aplicó todo el WAL recibido se toma como 0 aunque el primario
+    esté ocioso; si no responde, infinito. La misma medición guarda hasta qué LSN reprodujo.
+    """
+    ahora = time.monotonic()
+    if ahora - _lag["medido"] < 1.0:
+        return _lag["valor"]
+    try:
+        with read_engine.connect() as cn:
+            fila = cn.execute(text("""
+                SELECT CASE
+                           WHEN NOT pg_is_in_recovery() THEN 0
+                           WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+                           ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+                       END,
+                       COALESCE(pg_last_wal_replay_lsn(), pg_current_wal_lsn())::text
+            """)).one()
+        valor = float(fila[0] or 0)
+        _lag["lsn"] = max(_lag["lsn"], _lsn_a_int(fila[1]))
+    except Exception as e:
+        log.warning("Réplica de lectura no disponible: %s", e)
+        valor = float("inf")
+    _lag["valor"], _lag["medido"] = valor, ahora
+    return valor
+
+
+def replica_incluye_escrituras() -> bool:
+    """
+    La réplica ya reprodujo el WAL hasta la última escritura de este proceso. El LSN
+    reproducido solo avanza, así que una medición vieja a lo más dice que no cuando ya sí.
+    """
+    return _lag["lsn"] >= _lsn_escrito["valor"]
+
+
+def elegir_engine_lectura(request: Optional[Request] = None):
+    if read_engine is engine:
+        return engine
+    if request is not None and (request.headers.get("X-Leer-Primario") == "1" or _escribio_hace_poco(request)):
+        return engine
+    if lag_replica() > settings.REPLICA_MAX_LAG:
+        return engine
+    return read_engine
+
+
+def get_read_session(request: Request):
+    """ como get_session, pero puede leer de la réplica (ver elegir_engine_lectura) """
+    destino = elegir_engine_lectura(request)
+    en_replica = destino is not engine
+    request.state.origen_lectura = "replica" if en_replica else "primario"
+    try:
+        with Session(destino) as session:
+            # el cache de reportes no guarda lo leído de una réplica que no ha reproducido la
+            # última escritura (la clave del cache ya lleva la generación nueva)
+            session.info["al_dia"] = not en_replica or replica_incluye_escrituras()
+            yield _abrir(session)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error de conexión a la base de datos: {e}",
+        )
+
+ReadSessionDep = Annotated[Session,Depends(get_read_session)]
+
+@contextmanager
+def transaccion(session: Session):
+    """
+    Igual que `session.begin()`, pero si las validaciones previas ya abrieron la
+    transacción (autobegin) la reutiliza y hace commit/rollback al salir.
+    """
+    if not session.in_transaction():
+        with session.begin():
+            yield session
+        return
+    try:
+        yield session
+        session.commit()
+    except BaseException:
+        session.rollback()
+        raise
+
@@ -3,7 +3,7 @@ from typing import Optional, List,Literal
 from datetime import date, datetime
 from decimal import Decimal
 from sqlalchemy import UniqueConstraint, Index, Column
-from sqlalchemy.dialects.postgresql import UUID as SAUUID, ENUM as PGEnum
+from sqlalchemy.dialects.postgresql import UUID as SAUUID, ENUM as PGEnum, JSONB
 from sqlalchemy import Numeric, Boolean, text
 from pydantic import BaseModel, Field as PydField
 from enum import Enum
@@ -124,6 +124,22 @@ class MovimientoBancario(SQLModel, table=True):
     cuenta: "CuentaBancaria" = Relationship(back_populates="movimientos")
     
 
+class SaldoCuenta(SQLModel, table=True):
+    """Saldo mantenido por el trigger trg_mantener_saldo; no se escribe desde la app."""
+    __tablename__ = "saldos_cuenta"
+    __table_args__ = ({"schema": SCHEMA},)
+    id_cuenta_bancaria: int = Field(primary_key=True, foreign_key=f"{SCHEMA}.cuentas_bancarias.id_cuenta_bancaria")
+    saldo: Dinero = Field(sa_column=Column(Numeric(18, 2), nullable=False, server_default=text("0")))
+    actualizado_en: datetime = Field(default_factory=datetime.utcnow)
+    
+class TipoCambio(SQLModel, table=True):
+    __tablename__ = "tipos_cambio"
+    __table_args__ = ({"schema": SCHEMA},)
+    id_moneda_origen: int = Field(primary_key=True, foreign_key=f"{SCHEMA}.tipos_moneda.id_tipo_moneda")
+    id_moneda_destino: int = Field(primary_key=True, foreign_key=f"{SCHEMA}.tipos_moneda.id_tipo_moneda")
+    fecha: date = Field(default_factory=date.today, primary_key=True)
+    tasa: Decimal = Field(sa_column=Column(Numeric(18, 6), nullable=False))
+    
 # ---------- Cheques ----------
 class TipoCheque(SQLModel, table=True):
     __tablename__ = "tipos_cheque"
@@ -146,6 +162,17 @@ class Cheque(SQLModel, table=True):
     monto: Dinero = Field(sa_column=Column(Numeric(18, 2)))
     estado: str = Field(default="EMITIDO", max_length=12)
 
+class Chequera(SQLModel, table=True):
+    __tablename__ = "chequeras"
+    __table_args__ = ({"schema": SCHEMA},)
+    id_chequera: Optional[int] = Field(default=None, primary_key=True)
+    id_cuenta_bancaria: int = Field(foreign_key=f"{SCHEMA}.cuentas_bancarias.id_cuenta_bancaria")
+    numero_inicial: int
+    numero_final: int
+    siguiente_numero: int
+    activa: bool = Field(default=True)
+    fecha_alta: date = Field(default_factory=date.today)
+
 # ---------- Conciliaciones ----------
 class ConciliacionBancaria(SQLModel, table=True):
     __tablename__ = "conciliaciones_bancarias"
@@ -170,6 +197,8 @@ class Proveedor(SQLModel, table=True):
     telefono: Optional[str] = Field(default=None, max_length=8)
     correo: Optional[str] = Field(default=None, max_length=120)
     activo: bool = Field(default=True)
+    criticidad: int = Field(default=1, ge=1, le=5)
+    id_externo: Optional[int] = Field(default=None, unique=True)   # proveedor_id en el servicio de compras
 
     facturas: list["FacturaCompra"] = Relationship(back_populates="proveedor")
     
@@ -188,6 +217,16 @@ class FacturaCompra(SQLModel, table=True):
     moneda_id: int = Field(foreign_key=f"{SCHEMA}.tipos_moneda.id_tipo_moneda")
     monto_total: Dinero = Field(sa_column=Column(Numeric(18,2)))
     saldo_pendiente: Dinero = Field(sa_column=Column(Numeric(18,2)))
+    total_pagado: Dinero = Field(
+        default=Decimal("0.00"),
+        sa_column=Column(Numeric(18,2), nullable=False, server_default=text("0"))
+    )
+    fecha_ultimo_pago: Optional[datetime] = None
+    descuento_pronto_pago: Decimal = Field(
+        default=Decimal("0.00"),
+        sa_column=Column(Numeric(5,2), nullable=False, server_default=text("0"))
+    )
+    fecha_limite_descuento: Optional[date] = None
     
     #estado: str = Field(sa_column=EstadoFacturaCol)
     estado: EstadoFactura = Field(sa_column=EstadoFacturaCol)
@@ -212,6 +251,27 @@ class PagoProveedor(SQLModel, table=True):
     observacion: Optional[str] = Field(default=None, max_length=250)
     
     
+#---------- trabajos en segundo plano ----------
+
+class Trabajo(SQLModel, table=True):
+    __tablename__ = "trabajos"
+    __table_args__ = ({"schema": SCHEMA},)
+    id_trabajo: Optional[int] = Field(default=None, primary_key=True)
+    tipo: str = Field(max_length=60)
+    estado: str = Field(default="PENDIENTE", max_length=12)
+    parametros: dict = Field(default_factory=dict, sa_column=Column(JSONB, nullable=False, server_default=text("'{}'::jsonb")))
+    progreso: int = Field(default=0)
+    resultado: Optional[dict] = Field(default=None, sa_column=Column(JSONB))
+    error: Optional[str] = None
+    intentos: int = Field(default=0)
+    usuario_registro: Optional[str] = Field(default=None, max_length=60)
+    usuario_sub: Optional[str] = Field(default=None, max_length=60)
+    creado_en: datetime = Field(default_factory=datetime.utcnow)
+    iniciado_en: Optional[datetime] = None
+    actualizado_en: Optional[datetime] = None
+    terminado_en: Optional[datetime] = None
+    
+    
 #-------------mis dtos
 
 class MovimientoCreate(BaseModel):
@@ -249,18 +309,51 @@ class CuentaCreate(BaseModel):
     numero_cuenta: str = Field(min_length=4, max_length=30)
     titular: str = Field(min_length=2, max_length=120)
     
+class TipoCambioCreate(BaseModel):
+    id_moneda_origen: int
+    id_moneda_destino: int
+    tasa: Decimal = PydField(gt=0)
+    fecha: Optional[date] = None
+    
 class EmitirCheque(BaseModel):
     id_cuenta_bancaria: int
     id_tipo_cheque: int
-    numero_cheque: str = Field(min_length=1, max_length=30)
+    # si no viene, se toma el siguiente número de la chequera activa
+    numero_cheque: Optional[str] = Field(default=None, min_length=1, max_length=30)
+    beneficiario: str = Field(min_length=1, max_length=120)
+    monto: Decimal = Field(gt=0)
+    referencia: Optional[str] = None
+    observacion: Optional[str] = None
+    
+class ChequeraCreate(BaseModel):
+    id_cuenta_bancaria: int
+    numero_inicial: int = PydField(gt=0)
+    numero_final: int = PydField(gt=0)
+    
+class ChequeLoteItem(BaseModel):
     beneficiario: str = Field(min_length=1, max_length=120)
     monto: Decimal = Field(gt=0)
     referencia: Optional[str] = None
     
+class EmisionChequesLote(BaseModel):
+    id_cuenta_bancaria: int
+    id_tipo_cheque: int
+    cheques: List[ChequeLoteItem] = PydField(min_length=1, max_length=5000)
+    observacion: Optional[str] = None
+    
 
 class CobrarCheque(BaseModel):
  
     pass
+
+class ChequeCobroItem(BaseModel):
+    id_cuenta_bancaria: int
+    numero_cheque: str = Field(min_length=1, max_length=30)
+    monto: Decimal = Field(gt=0)
+    
+class CobroChequesLote(BaseModel):
+    items: List[ChequeCobroItem] = PydField(min_length=1, max_length=200000)
+    
 class AnularCheque(BaseModel):
     motivo: Optional[str] = None
     
@@ -273,6 +366,36 @@ class ConciliacionCreate(BaseModel):
     # Si preview=True solo calcula y NO marca movimientos ni inserta conciliación
     bandera: bool = False
     
+class ConciliacionLoteItem(BaseModel):
+    id_cuenta_bancaria: int
+    saldo_banco: Decimal = Field(gt=Decimal("0"))
+    fecha_conciliacion: Optional[date] = None
+    observaciones: Optional[str] = None
+
+class ConciliacionLote(BaseModel):
+    items: List[ConciliacionLoteItem] = PydField(min_length=1, max_length=5000)
+    bandera: bool = False
+    # conciliar_lote lo recorta a CONCILIACION_WORKERS y a la mitad de pool_size + max_overflow
+    max_workers: Optional[int] = PydField(default=None, ge=1, le=32)
+    
+class PesosOptimizacion(BaseModel):
+    # objetivo "prioridad": valor = saldo * (1 + urgencia*u + criticidad*c) + descuento*ahorro
+    urgencia: float = PydField(default=1.0, ge=0)
+    criticidad: float = PydField(default=0.5, ge=0)
+    descuento: float = PydField(default=1.0, ge=0)
+
+class OptimizarPagos(BaseModel):
+    id_cuenta_bancaria: int
+    # por defecto el saldo actual de la cuenta
+    monto_disponible: Optional[Decimal] = PydField(default=None, ge=0)
+    objetivo: Literal["prioridad", "monto", "cantidad"] = "prioridad"
+    pesos: PesosOptimizacion = PydField(default_factory=PesosOptimizacion)
+    # solo facturas que vencen hasta esta fecha (las vencidas siempre entran)
+    vencen_hasta: Optional[date] = None
+    proveedor_ids: Optional[List[int]] = None
+    # pagar parcialmente la factura que no cabe completa (solo prioridad y monto)
+    permitir_parcial: bool = False
+    
 class ConciliacionQuery(BaseModel):
     id_cuenta_bancaria: int
     desde: Optional[date] = None
@@ -289,6 +412,10 @@ class FacturaCreate(BaseModel):
 class FacturaAnular(BaseModel):
     motivo: Optional[str] = None
     
+class TrabajoCreate(BaseModel):
+    tipo: str = Field(min_length=1, max_length=60)
+    parametros: dict = PydField(default_factory=dict)
+    
 #--------------------------
 class AuthUsuario(BaseModel):
     sub: str 
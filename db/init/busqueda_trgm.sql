@@ -0,0 +1,30 @@
+-- búsqueda por texto (ILIKE '%...%') en movimientos, cheques y proveedores:
+-- los índices GIN de trigramas resuelven el ILIKE sin recorrer la tabla
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+CREATE INDEX IF NOT EXISTS idx_movs_referencia_trgm
+ON bancos.movimientos_bancarios USING gin (referencia gin_trgm_ops);
+
+CREATE INDEX IF NOT EXISTS idx_movs_descripcion_trgm
+ON bancos.movimientos_bancarios USING gin (descripcion gin_trgm_ops);
+
+CREATE INDEX IF NOT EXISTS idx_movs_ref_externa_trgm
+ON bancos.movimientos_bancarios USING gin (referencia_externa gin_trgm_ops);
+
+CREATE INDEX IF NOT EXISTS idx_cheques_beneficiario_trgm
+ON bancos.cheques USING gin (beneficiario gin_trgm_ops);
+
+CREATE INDEX IF NOT EXISTS idx_proveedores_nombre_trgm
+ON bancos.proveedores USING gin (nombre gin_trgm_ops);
+
+CREATE INDEX IF NOT EXISTS idx_proveedores_nit_trgm
+ON bancos.proveedores USING gin (nit gin_trgm_ops);
+
+-- ventana de las filas más recientes (primer paso de la búsqueda) cuando no se filtra por
+-- cuenta (con cuenta usa idx_movs_cuenta_fecha); las coincidencias de términos raros no se
+-- ordenan por aquí sino después del bitmap de los GIN
+CREATE INDEX IF NOT EXISTS idx_movs_fecha_id
+ON bancos.movimientos_bancarios (fecha DESC, id_movimiento DESC);
+
+CREATE INDEX IF NOT EXISTS idx_cheques_emision_id
+ON bancos.cheques (fecha_emision DESC, id_cheque DESC);
@@ -0,0 +1,23 @@
+-- ===============================
+-- Chequeras: rangos de numeración por cuenta
+-- ===============================
+CREATE EXTENSION IF NOT EXISTS btree_gist;
+
+CREATE TABLE IF NOT EXISTS bancos.chequeras (
+  id_chequera        BIGINT GENERATED ALWAYS AS IDENTITY PRIMARY KEY,
+  id_cuenta_bancaria INTEGER NOT NULL REFERENCES bancos.cuentas_bancarias(id_cuenta_bancaria),
+  numero_inicial     BIGINT NOT NULL CHECK (numero_inicial > 0),
+  numero_final       BIGINT NOT NULL,
+  siguiente_numero   BIGINT NOT NULL,
+  activa             BOOLEAN NOT NULL DEFAULT TRUE,
+  fecha_alta         DATE NOT NULL DEFAULT CURRENT_DATE,
+
+  CONSTRAINT chk_chequera_rango CHECK (numero_final >= numero_inicial),
+  CONSTRAINT chk_chequera_siguiente CHECK (siguiente_numero BETWEEN numero_inicial AND numero_final + 1),
+  -- dos chequeras de la misma cuenta no pueden compartir números
+  CONSTRAINT ex_chequera_traslape EXCLUDE USING gist (
+    id_cuenta_bancaria WITH =,
+    int8range(numero_inicial, numero_final, '[]') WITH &&
+  )
+);
+CREATE INDEX IF NOT EXISTS idx_chequeras_cuenta_activa ON bancos.chequeras(id_cuenta_bancaria, id_chequera) WHERE activa;
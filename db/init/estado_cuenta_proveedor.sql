@@ -0,0 +1,13 @@
+-- ===============================
+-- Estado de cuenta del proveedor (function/fproveedores_facturas.py)
+-- ===============================
+
+-- facturas y pagos del proveedor en orden (fecha, id): la página es un rango del índice y el
+-- saldo antes de `desde` se suma sin ir a la tabla (INCLUDE)
+CREATE INDEX IF NOT EXISTS idx_facturas_prov_emision
+  ON bancos.facturas_compra (proveedor_id, fecha_emision, factura_id)
+  INCLUDE (moneda_id, monto_total, estado);
+
+CREATE INDEX IF NOT EXISTS idx_pagos_prov_fecha_id
+  ON bancos.pagos_proveedor (proveedor_id, fecha_pago, pago_id)
+  INCLUDE (id_cuenta_bancaria, monto_pagado);
@@ -0,0 +1,20 @@
+-- Outbox transaccional: los eventos se insertan en la misma transacción que el cambio
+-- (movimientos, transferencias, pagos, cheques). main/relay.py los publica y
+-- GET /admin/eventos los sirve con cursor.
+CREATE TABLE IF NOT EXISTS bancos.eventos_outbox (
+  id_evento       BIGINT GENERATED ALWAYS AS IDENTITY PRIMARY KEY,
+  tipo            VARCHAR(60) NOT NULL,
+  agregado        VARCHAR(30) NOT NULL,
+  id_agregado     VARCHAR(60) NOT NULL,
+  datos           JSONB NOT NULL DEFAULT '{}'::jsonb,
+  -- el id de evento se asigna antes del commit, así que dos transacciones pueden hacerse
+  -- visibles fuera de orden; el feed ordena por transacción y solo entrega las que ya
+  -- son anteriores a todo lo que sigue en curso (pg_snapshot_xmin)
+  id_transaccion  XID8 NOT NULL DEFAULT pg_current_xact_id(),
+  creado_en       TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  publicado_en    TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_outbox_orden ON bancos.eventos_outbox (id_transaccion, id_evento);
+CREATE INDEX IF NOT EXISTS idx_outbox_pendientes ON bancos.eventos_outbox (id_transaccion, id_evento)
+  WHERE publicado_en IS NULL;
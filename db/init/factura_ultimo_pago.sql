@@ -0,0 +1,25 @@
+-- Totales de pago mantenidos en la factura (los actualiza pago_a_proveedor)
+ALTER TABLE bancos.facturas_compra
+  ADD COLUMN IF NOT EXISTS total_pagado      NUMERIC(18,2) NOT NULL DEFAULT 0,
+  ADD COLUMN IF NOT EXISTS fecha_ultimo_pago TIMESTAMP;
+
+-- carga inicial desde los pagos existentes
+UPDATE bancos.facturas_compra fc
+SET total_pagado = agg.total_pagado,
+    fecha_ultimo_pago = agg.fecha_ultimo_pago
+FROM (
+  SELECT factura_id, SUM(monto_pagado) AS total_pagado, MAX(fecha_pago) AS fecha_ultimo_pago
+  FROM bancos.pagos_proveedor
+  WHERE factura_id IS NOT NULL
+  GROUP BY factura_id
+) agg
+WHERE agg.factura_id = fc.factura_id;
+
+-- reporte de facturas pagadas: rango por fecha de último pago + paginado por (fecha, id)
+CREATE INDEX IF NOT EXISTS idx_facturas_pagadas_ultimo_pago
+  ON bancos.facturas_compra (fecha_ultimo_pago DESC, factura_id DESC)
+  WHERE estado = 'PAGADA';
+
+CREATE INDEX IF NOT EXISTS idx_facturas_pagadas_prov_ultimo_pago
+  ON bancos.facturas_compra (proveedor_id, fecha_ultimo_pago DESC, factura_id DESC)
+  WHERE estado = 'PAGADA';
@@ -0,0 +1,15 @@
+-- Datos para priorizar pagos (POST /admin/bancos/pagos/optimizar)
+-- criticidad del proveedor: 1 (normal) .. 5 (sin él se detiene la operación)
+ALTER TABLE bancos.proveedores
+  ADD COLUMN IF NOT EXISTS criticidad SMALLINT NOT NULL DEFAULT 1 CHECK (criticidad BETWEEN 1 AND 5);
+
+-- descuento por pronto pago: porcentaje sobre el saldo si se paga a más tardar en la fecha límite
+ALTER TABLE bancos.facturas_compra
+  ADD COLUMN IF NOT EXISTS descuento_pronto_pago NUMERIC(5,2) NOT NULL DEFAULT 0
+    CHECK (descuento_pronto_pago >= 0 AND descuento_pronto_pago < 100),
+  ADD COLUMN IF NOT EXISTS fecha_limite_descuento DATE;
+
+-- candidatas del optimizador: abiertas por moneda
+CREATE INDEX IF NOT EXISTS idx_facturas_abiertas_moneda
+  ON bancos.facturas_compra (moneda_id, fecha_vencimiento)
+  WHERE estado IN ('PENDIENTE','PARCIAL');
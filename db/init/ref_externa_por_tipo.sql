@@ -0,0 +1,7 @@
+-- La referencia externa se reutiliza con ids de distintas entidades (pago_id en RETIRO,
+-- id_cheque en CHEQUE_EMITIDO); la unicidad global hacía chocar pago 1 con cheque 1.
+-- La idempotencia se mantiene por tipo de movimiento.
+DROP INDEX IF EXISTS bancos.uq_mov_ref_externa;
+CREATE UNIQUE INDEX IF NOT EXISTS uq_mov_ref_externa
+ON bancos.movimientos_bancarios (tipo_mov, referencia_externa)
+WHERE referencia_externa IS NOT NULL;
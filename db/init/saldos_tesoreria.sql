@@ -0,0 +1,59 @@
+-- ===============================
+-- Saldo mantenido por cuenta (lo actualiza el trigger en cada movimiento)
+-- ===============================
+CREATE TABLE IF NOT EXISTS bancos.saldos_cuenta (
+  id_cuenta_bancaria INTEGER PRIMARY KEY REFERENCES bancos.cuentas_bancarias(id_cuenta_bancaria),
+  saldo              NUMERIC(18,2) NOT NULL DEFAULT 0,
+  actualizado_en     TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+-- mismo signo que vw_extracto
+CREATE OR REPLACE FUNCTION bancos.fn_importe(p_tipo bancos.tipo_mov, p_monto NUMERIC)
+RETURNS NUMERIC LANGUAGE sql IMMUTABLE AS $$
+  SELECT CASE
+    WHEN p_tipo IN ('DEPOSITO','TRANSFERENCIA_IN','CHEQUE_COBRADO') THEN  p_monto
+    WHEN p_tipo IN ('RETIRO','TRANSFERENCIA_OUT','CHEQUE_EMITIDO')   THEN -p_monto
+    ELSE 0
+  END
+$$;
+
+CREATE OR REPLACE FUNCTION bancos.fn_mantener_saldo()
+RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+  IF TG_OP IN ('UPDATE','DELETE') THEN
+    INSERT INTO bancos.saldos_cuenta AS s (id_cuenta_bancaria, saldo, actualizado_en)
+    VALUES (OLD.id_cuenta_bancaria, -bancos.fn_importe(OLD.tipo_mov, OLD.monto), CURRENT_TIMESTAMP)
+    ON CONFLICT (id_cuenta_bancaria)
+    DO UPDATE SET saldo = s.saldo + EXCLUDED.saldo, actualizado_en = EXCLUDED.actualizado_en;
+  END IF;
+  IF TG_OP IN ('INSERT','UPDATE') THEN
+    INSERT INTO bancos.saldos_cuenta AS s (id_cuenta_bancaria, saldo, actualizado_en)
+    VALUES (NEW.id_cuenta_bancaria, bancos.fn_importe(NEW.tipo_mov, NEW.monto), CURRENT_TIMESTAMP)
+    ON CONFLICT (id_cuenta_bancaria)
+    DO UPDATE SET saldo = s.saldo + EXCLUDED.saldo, actualizado_en = EXCLUDED.actualizado_en;
+  END IF;
+  RETURN NULL;
+END
+$$;
+
+DROP TRIGGER IF EXISTS trg_mantener_saldo ON bancos.movimientos_bancarios;
+CREATE TRIGGER trg_mantener_saldo
+AFTER INSERT OR DELETE OR UPDATE OF id_cuenta_bancaria, tipo_mov, monto
+ON bancos.movimientos_bancarios
+FOR EACH ROW EXECUTE FUNCTION bancos.fn_mantener_saldo();
+
+-- carga inicial desde el extracto
+INSERT INTO bancos.saldos_cuenta (id_cuenta_bancaria, saldo)
+SELECT id_cuenta_bancaria, saldo_calculado FROM bancos.vw_saldo_cuenta
+ON CONFLICT (id_cuenta_bancaria) DO UPDATE SET saldo = EXCLUDED.saldo, actualizado_en = CURRENT_TIMESTAMP;
+
+-- ===============================
+-- Tipos de cambio (se registran localmente, uno por día y par de monedas)
+-- ===============================
+CREATE TABLE IF NOT EXISTS bancos.tipos_cambio (
+  id_moneda_origen   INTEGER NOT NULL REFERENCES bancos.tipos_moneda(id_tipo_moneda),
+  id_moneda_destino  INTEGER NOT NULL REFERENCES bancos.tipos_moneda(id_tipo_moneda),
+  fecha              DATE NOT NULL DEFAULT CURRENT_DATE,
+  tasa               NUMERIC(18,6) NOT NULL CHECK (tasa > 0),
+  PRIMARY KEY (id_moneda_origen, id_moneda_destino, fecha)
+);
@@ -0,0 +1,37 @@
+-- ===============================
+-- Sincronización incremental de proveedores y facturas desde el servicio de compras
+-- (function/fsincronizacion.py)
+-- ===============================
+
+-- id del proveedor en compras: el proveedor_id local es IDENTITY y no coincide
+ALTER TABLE bancos.proveedores
+  ADD COLUMN IF NOT EXISTS id_externo BIGINT;
+CREATE UNIQUE INDEX IF NOT EXISTS uq_proveedores_id_externo ON bancos.proveedores (id_externo);
+
+-- marca de agua por recurso: el último cambio aplicado, como (actualizado_en, id) en compras.
+-- Se actualiza en la misma transacción que las filas de la página.
+CREATE TABLE IF NOT EXISTS bancos.sincronizacion (
+  recurso         VARCHAR(40) PRIMARY KEY,            -- 'proveedores' | 'facturas'
+  marca           TIMESTAMP,                          -- NULL: todavía no se sincronizó nada
+  marca_id        BIGINT NOT NULL DEFAULT 0,
+  filas           BIGINT NOT NULL DEFAULT 0,          -- cambios recibidos desde el inicio
+  actualizado_en  TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+INSERT INTO bancos.sincronizacion (recurso) VALUES ('proveedores'), ('facturas')
+ON CONFLICT (recurso) DO NOTHING;
+
+-- registros que compras mandó y no se pudieron aplicar (factura de un proveedor que aún no
+-- llega, datos inválidos, monto menor que lo ya pagado...). La marca pasa de largo, así que
+-- quedan aquí con su motivo y sus datos; cada corrida los vuelve a intentar antes de pedir
+-- cambios y se borran cuando se aplican (o llega una versión que sí se aplica)
+CREATE TABLE IF NOT EXISTS bancos.sincronizacion_rechazos (
+  recurso         VARCHAR(40) NOT NULL,
+  id_externo      BIGINT NOT NULL,                    -- id del registro en compras
+  motivo          VARCHAR(40) NOT NULL,
+  datos           JSONB NOT NULL,                     -- el registro como llegó
+  intentos        INTEGER NOT NULL DEFAULT 1,
+  registrado_en   TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  actualizado_en  TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  PRIMARY KEY (recurso, id_externo)
+);
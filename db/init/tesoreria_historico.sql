@@ -0,0 +1,71 @@
+-- (va después de saldos_tesoreria.sql: reemplaza fn_mantener_saldo y vw_saldo_cuenta)
+-- ===============================
+-- Histórico de movimientos: los conciliados anteriores al último cierre de cada cuenta salen
+-- de movimientos_bancarios (y de todos sus índices) a esta tabla de solo inserción
+-- ===============================
+CREATE TABLE IF NOT EXISTS bancos.movimientos_historico (
+  id_movimiento       BIGINT PRIMARY KEY,          -- el mismo id que tenía en movimientos_bancarios
+  id_cuenta_bancaria  INTEGER NOT NULL,
+  fecha               TIMESTAMP NOT NULL,
+  tipo_mov            bancos.tipo_mov NOT NULL,
+  monto               NUMERIC(18,2) NOT NULL,
+  referencia          VARCHAR(60),
+  descripcion         VARCHAR(250),
+  referencia_externa  VARCHAR(60),
+  transferencia_id    UUID,
+  usuario_registro    VARCHAR(60),
+  usuario_registro_rol VARCHAR(60),
+  conciliado          BOOLEAN NOT NULL DEFAULT TRUE,
+  archivado_en        TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+-- nunca se actualiza: páginas llenas; filas de más de 128 bytes se comprimen (TOAST)
+) WITH (fillfactor = 100, toast_tuple_target = 128);
+
+-- BDs donde la tabla se creó sin el rol de quien registró
+ALTER TABLE bancos.movimientos_historico ADD COLUMN IF NOT EXISTS usuario_registro_rol VARCHAR(60);
+
+-- solo lo que usan extracto y búsqueda: cuenta+fecha, y BRIN por fecha (se inserta en orden)
+CREATE INDEX IF NOT EXISTS idx_movs_hist_cuenta_fecha ON bancos.movimientos_historico (id_cuenta_bancaria, fecha, id_movimiento);
+CREATE INDEX IF NOT EXISTS idx_movs_hist_fecha_brin   ON bancos.movimientos_historico USING brin (fecha);
+
+-- saldo arrastrado: suma con signo de lo que ya está en el histórico, por cuenta
+CREATE TABLE IF NOT EXISTS bancos.saldos_arrastre (
+  id_cuenta_bancaria INTEGER PRIMARY KEY REFERENCES bancos.cuentas_bancarias(id_cuenta_bancaria),
+  saldo              NUMERIC(18,2) NOT NULL DEFAULT 0,
+  hasta              DATE NOT NULL,              -- cierre hasta el que se archivó (inclusive)
+  movimientos        BIGINT NOT NULL DEFAULT 0,
+  actualizado_en     TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+-- el borrado del archivado no cambia el saldo de la cuenta: el movimiento sigue contando, ahora
+-- desde el histórico (el job hace SET LOCAL bancos.archivando = '1')
+CREATE OR REPLACE FUNCTION bancos.fn_mantener_saldo()
+RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+  IF TG_OP = 'DELETE' AND current_setting('bancos.archivando', true) = '1' THEN
+    RETURN NULL;
+  END IF;
+  IF TG_OP IN ('UPDATE','DELETE') THEN
+    INSERT INTO bancos.saldos_cuenta AS s (id_cuenta_bancaria, saldo, actualizado_en)
+    VALUES (OLD.id_cuenta_bancaria, -bancos.fn_importe(OLD.tipo_mov, OLD.monto), CURRENT_TIMESTAMP)
+    ON CONFLICT (id_cuenta_bancaria)
+    DO UPDATE SET saldo = s.saldo + EXCLUDED.saldo, actualizado_en = EXCLUDED.actualizado_en;
+  END IF;
+  IF TG_OP IN ('INSERT','UPDATE') THEN
+    INSERT INTO bancos.saldos_cuenta AS s (id_cuenta_bancaria, saldo, actualizado_en)
+    VALUES (NEW.id_cuenta_bancaria, bancos.fn_importe(NEW.tipo_mov, NEW.monto), CURRENT_TIMESTAMP)
+    ON CONFLICT (id_cuenta_bancaria)
+    DO UPDATE SET saldo = s.saldo + EXCLUDED.saldo, actualizado_en = EXCLUDED.actualizado_en;
+  END IF;
+  RETURN NULL;
+END
+$$;
+
+-- saldo derivado = movimientos vivos + arrastre
+CREATE OR REPLACE VIEW bancos.vw_saldo_cuenta AS
+SELECT
+  c.id_cuenta_bancaria,
+  (COALESCE(SUM(e.importe), 0) + COALESCE(MAX(a.saldo), 0))::NUMERIC(18,2) AS saldo_calculado
+FROM bancos.cuentas_bancarias c
+LEFT JOIN bancos.vw_extracto e USING (id_cuenta_bancaria)
+LEFT JOIN bancos.saldos_arrastre a USING (id_cuenta_bancaria)
+GROUP BY c.id_cuenta_bancaria;
@@ -0,0 +1,24 @@
+-- Cola de trabajos en segundo plano (la toma main/worker.py con FOR UPDATE SKIP LOCKED)
+CREATE TABLE IF NOT EXISTS bancos.trabajos (
+  id_trabajo        BIGINT GENERATED ALWAYS AS IDENTITY PRIMARY KEY,
+  tipo              VARCHAR(60) NOT NULL,
+  estado            VARCHAR(12) NOT NULL DEFAULT 'PENDIENTE'
+                      CHECK (estado IN ('PENDIENTE','EN_PROCESO','COMPLETADO','FALLIDO')),
+  parametros        JSONB NOT NULL DEFAULT '{}'::jsonb,
+  progreso          SMALLINT NOT NULL DEFAULT 0 CHECK (progreso BETWEEN 0 AND 100),
+  resultado         JSONB,
+  error             TEXT,
+  intentos          INTEGER NOT NULL DEFAULT 0,
+  usuario_registro  VARCHAR(60),
+  creado_en         TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  iniciado_en       TIMESTAMP,
+  actualizado_en    TIMESTAMP,
+  terminado_en      TIMESTAMP
+);
+
+-- quién lo encoló (sub del token): solo él o un ADMIN ven su estado y su resultado
+ALTER TABLE bancos.trabajos ADD COLUMN IF NOT EXISTS usuario_sub VARCHAR(60);
+
+-- solo los pendientes, es lo que barre el worker
+CREATE INDEX IF NOT EXISTS idx_trabajos_pendientes ON bancos.trabajos (id_trabajo) WHERE estado = 'PENDIENTE';
+CREATE INDEX IF NOT EXISTS idx_trabajos_en_proceso ON bancos.trabajos (actualizado_en) WHERE estado = 'EN_PROCESO';
@@ -0,0 +1,6 @@
+-- Verificador de integridad (function/fverificacion.py): las transferencias se revisan por
+-- rangos de transferencia_id y el histórico no tenía índice por esa columna (cada tramo lo
+-- recorría entero). Parcial: solo las filas de transferencias.
+CREATE INDEX IF NOT EXISTS idx_movs_hist_transfer_id
+  ON bancos.movimientos_historico (transferencia_id)
+  WHERE transferencia_id IS NOT NULL;
@@ -0,0 +1,5 @@
+#!/bin/bash
+# Permite que el servicio db_replica (perfil "replica" de docker-compose) se clone con
+# pg_basebackup y quede como réplica en streaming. wal_level=replica es el default.
+set -e
+echo "host replication all all scram-sha-256" >> "$PGDATA/pg_hba.conf"
@@ -0,0 +1,105 @@
+from functools import lru_cache
+from typing import Any, Iterable, Iterator, Optional, Sequence
+
+from fastapi import HTTPException, status
+from sqlalchemy import text
+from sqlalchemy.sql.elements import TextClause
+from sqlmodel import Session
+
+# Consultas con filtros opcionales. Antes cada llamada armaba el SQL con f-strings y lo
+# envolvía en text(): SQLAlchemy volvía a parsear los :parametros y a compilar, y el texto
+# cambiaba por cualquier detalle del armado. Aquí hay una sentencia por combinación de
+# filtros, creada una vez y reutilizada; como el texto es estable, SQLAlchemy la encuentra
+# en su cache de compilación y psycopg la prepara en el servidor después de
+# PG_PREPARE_THRESHOLD ejecuciones en la misma conexión (se planifica una sola vez).
+#
+# Campos (`fields=a,b` en los listados): si la consulta declara `columnas`, el SELECT se arma
+# solo con las pedidas; el conjunto se normaliza al orden de declaración para que cada
+# combinación sea una sola variante cacheada.
+
+
+def campos_pedidos(fields: Optional[str], disponibles: Sequence[str], siempre: Iterable[str] = ()) -> Optional[tuple[str, ...]]:
+    """
+    `fields=a,b` -> ('a', 'b') en el orden de `disponibles`, más los de `siempre` (p. ej. los
+    del cursor de paginado). None si no se pidió nada: todas las columnas.
+    """
+    if not fields or not fields.strip():
+        return None
+    pedidos = {f.strip() for f in fields.split(",") if f.strip()}
+    desconocidos = pedidos - set(disponibles)
+    if desconocidos:
+        raise HTTPException(status.HTTP_400_BAD_REQUEST,
+                            f"Campos desconocidos: {', '.join(sorted(desconocidos))}. Disponibles: {', '.join(disponibles)}")
+    pedidos |= set(siempre)
+    return tuple(c for c in disponibles if c in pedidos)
+
+
+class ConsultaDinamica:
+    def __init__(self, nombre: str, sql: str, filtros: dict[str, str], fijos: Iterable[str] = (),
+                 columnas: Optional[dict[str, str]] = None, max_variantes: int = 64):
+        '''
+        `sql` lleva un `{where}` donde se insertan las condiciones; `filtros` mapea el nombre
+        del filtro a su condición (con sus :parametros); `fijos` son condiciones que siempre van.
+        `columnas` (nombre en la respuesta -> expresión) va en un `{columnas}` del SELECT.
+        '''
+        self.nombre = nombre
+        self._sql = sql
+        self._filtros = filtros
+        self._fijos = tuple(fijos)
+        self._columnas = columnas
+        self._sentencia = lru_cache(maxsize=max_variantes)(self._armar)
+
+    @property
+    def columnas(self) -> tuple[str, ...]:
+        return tuple(self._columnas or ())
+
+    def _armar(self, activos: frozenset[str], campos: Optional[tuple[str, ...]]) -> TextClause:
+        condiciones = list(self._fijos) + [self._filtros[f] for f in self._filtros if f in activos]
+        where = ("WHERE " + " AND ".join(condiciones)) if condiciones else ""
+        columnas = ""
+        if self._columnas is not None:
+            columnas = ",\n        ".join(f"{self._columnas[c]} AS {c}" for c in (campos or self._columnas))
+        return text(self._sql.format(where=where, columnas=columnas))
+
+    def sentencia(self, *activos: str, campos: Optional[Iterable[str]] = None) -> TextClause:
+        desconocidos = set(activos) - set(self._filtros)
+        if desconocidos:
+            raise ValueError(f"{self.nombre}: filtros no definidos {sorted(desconocidos)}")
+        if campos is not None:
+            if self._columnas is None:
+                raise ValueError(f"{self.nombre}: la consulta no declara columnas")
+            pedidos = set(campos)
+            if pedidos - set(self._columnas):
+                raise ValueError(f"{self.nombre}: columnas no definidas {sorted(pedidos - set(self._columnas))}")
+            campos = tuple(c for c in self._columnas if c in pedidos) or None
+        return self._sentencia(frozenset(activos), campos)
+
+    def ejecutar(self, session: Session, filtros: dict[str, Optional[dict[str, Any]]],
+                 campos: Optional[Iterable[str]] = None, **params: Any) -> list[dict]:
+        '''
+        `filtros`: nombre -> parámetros del filtro, o None si no aplica. `params` son los que
+        usa siempre la consulta (límite, cuenta...). `campos`: solo esas columnas (None = todas).
+        '''
+        activos = [f for f, p in filtros.items() if p is not None]
+        for f in activos:
+            params.update(filtros[f])
+        filas = session.exec(self.sentencia(*activos, campos=campos), params=params).all()
+        return [dict(r._mapping) for r in filas]
+
+    def iterar(self, session: Session, filtros: dict[str, Optional[dict[str, Any]]], lote: int = 1000,
+               campos: Optional[Iterable[str]] = None, **params: Any) -> Iterator[dict]:
+        '''
+        Como `ejecutar`, pero con cursor del servidor: las filas llegan de a `lote` y nunca
+        están todas en memoria (para respuestas en streaming).
+        '''
+        activos = [f for f, p in filtros.items() if p is not None]
+        for f in activos:
+            params.update(filtros[f])
+        resultado = session.execute(self.sentencia(*activos, campos=campos), params,
+                                    execution_options={"yield_per": lote})
+        for fila in resultado:
+            yield dict(fila._mapping)
+
+    def variantes(self) -> dict:
+        info = self._sentencia.cache_info()
+        return {"consulta": self.nombre, "variantes": info.currsize, "hits": info.hits, "misses": info.misses}
@@ -7,8 +7,14 @@ from sqlalchemy.exc import IntegrityError
 from typing import List,Optional
 from datetime import date, timedelta
 
+from function.fcache import cache_reportes
+from function.foutbox import registrar_evento
+from connection.data.db import transaccion
 from connection.models.modelos import(MovimientoBancario, MovimientoCreate,TransferenciaCreate, PagoProveedorCreate,CuentaBancaria, FacturaCompra,PagoProveedor)
 
+SALDO_CUENTA = text("SELECT saldo FROM bancos.saldos_cuenta WHERE id_cuenta_bancaria = :id")
+
+
 def verificar_cuenta_activa(session:Session,id_cuenta:int)-> None: 
   
     cuenta = session.get(CuentaBancaria, id_cuenta)
@@ -18,6 +24,34 @@ def verificar_cuenta_activa(session:Session,id_cuenta:int)-> None:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Cuenta bancaria no está activa")
     
     
+def bloquear_cuentas(session: Session, *ids: int) -> None:
+    '''
+    SELECT ... FOR UPDATE de las cuentas, en orden de id, validando que existan y estén activas.
+    Todo camino que valida saldo antes de escribir la toma primero dentro de su transacción: dos
+    retiros concurrentes no pueden leer el mismo saldo, y el orden fijo evita el bloqueo en cruz.
+    '''
+    estados = dict(session.exec(
+        text("""
+            SELECT id_cuenta_bancaria, estado FROM bancos.cuentas_bancarias
+            WHERE id_cuenta_bancaria = ANY(:ids)
+            ORDER BY id_cuenta_bancaria
+            FOR UPDATE
+        """),
+        params={"ids": sorted(set(ids))},
+    ).all())
+    for id_cuenta in ids:
+        if id_cuenta not in estados:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Cuenta bancaria no existe")
+        if estados[id_cuenta] != "ACTIVA":
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Cuenta bancaria no está activa")
+
+
+def saldo_bloqueado(session: Session, id_cuenta: int) -> Decimal:
+    ''' saldo de una cuenta ya bloqueada con bloquear_cuentas (sin volver a validarla) '''
+    req = session.exec(SALDO_CUENTA, params={"id": id_cuenta}).first()
+    return req[0] if req else Decimal("0.00")
+
+
 def buscar_factura(session:Session,factura_id:int, proveedor_id:int)->FacturaCompra:
    
     factura = session.get(FacturaCompra, factura_id)
@@ -38,7 +72,7 @@ def facturas_abiertas_por_proveedor(session:Session, proveedor_id:int,limite: in
                     ORDER BY fecha_vencimiento NULLS LAST
                     LIMIT :lim
             """)
-    fila = session.exec(req, {"prov": proveedor_id, "lim":limite}).all()
+    fila = session.exec(req, params={"prov": proveedor_id, "lim":limite}).all()
     return [dict(r._mapping) for r in fila]
     
     
@@ -46,10 +80,8 @@ def obtener_saldo(session:Session,id_cuenta:int)->Decimal:
        
     verificar_cuenta_activa(session, id_cuenta)
         
-    req = session.exec(
-        text("SELECT saldo_calculado FROM  bancos.vw_saldo_cuenta WHERE id_cuenta_bancaria = :id"),
-        {"id": id_cuenta}
-    ).first()
+    # saldo mantenido por trigger (antes se sumaba todo el extracto con vw_saldo_cuenta)
+    req = session.exec(SALDO_CUENTA, params={"id": id_cuenta}).first()
     # retorna el saldo o 0.00 si la cuenta no tiene movimientos
     return req[0] if req else Decimal("0.00")
    
@@ -62,7 +94,8 @@ def crear_movimiento(session:Session, mov:MovimientoCreate,usuario:Optional[str]
         # Verificar si ya existe un movimiento con la misma referencia externa
         existente = session.exec(
             select(MovimientoBancario.id_movimiento).where(
-                MovimientoBancario.referencia_externa == mov.referencia_externa
+                MovimientoBancario.tipo_mov == mov.tipo_mov,
+                MovimientoBancario.referencia_externa == mov.referencia_externa,
             )
         ).first()
         if existente:
@@ -80,6 +113,15 @@ def crear_movimiento(session:Session, mov:MovimientoCreate,usuario:Optional[str]
     
     try: 
         session.add(movi)
+        session.flush()
+        registrar_evento(session, "movimiento.registrado", "movimiento", movi.id_movimiento, {
+            "id_movimiento": movi.id_movimiento,
+            "id_cuenta_bancaria": movi.id_cuenta_bancaria,
+            "tipo_mov": movi.tipo_mov,
+            "monto": movi.monto,
+            "referencia": movi.referencia,
+            "referencia_externa": movi.referencia_externa,
+        })
         session.commit()
         session.refresh(movi)
         return movi.id_movimiento
@@ -92,17 +134,6 @@ def transferencia_interna(session:Session,trans:TransferenciaCreate,usuario:Opti
     if trans.origen == trans.destino:
         raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Cuenta origen y destino no pueden ser iguales")
     
-    #origen
-    verificar_cuenta_activa(session, trans.origen)
-    #destino
-    verificar_cuenta_activa(session, trans.destino)
-    
-    #validar saldo haste de hacer la transaccion 
-    saldo_origen = obtener_saldo(session, trans.origen)
-    if saldo_origen < trans.monto:
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, 
-                            detail=f"Saldo insuficiente ({saldo_origen}) en cuenta origen {trans.origen}.")
-    
     id_trans = str(uuid4())
     
     display_user = (
@@ -113,7 +144,14 @@ def transferencia_interna(session:Session,trans:TransferenciaCreate,usuario:Opti
     try: 
         #transaccion atomica
         
-        with session.begin(): 
+        with transaccion(session): 
+            # origen y destino bloqueadas: el saldo leído no cambia hasta el commit
+            bloquear_cuentas(session, trans.origen, trans.destino)
+            saldo_origen = saldo_bloqueado(session, trans.origen)
+            if saldo_origen < trans.monto:
+                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, 
+                                    detail=f"Saldo insuficiente ({saldo_origen}) en cuenta origen {trans.origen}.")
+
             #se retira de la cuenta origen 
             salida = MovimientoBancario(
                 id_cuenta_bancaria=trans.origen,
@@ -126,7 +164,6 @@ def transferencia_interna(session:Session,trans:TransferenciaCreate,usuario:Opti
                 usuario_registro=(usuario[:60] if usuario else None),
                 usuario_registro_rol=(usuario_rol[:60] if usuario_rol else None),
             )
-            session.add(salida)
             #se deposita a la cuenta destino 
             entrada= MovimientoBancario (
                 id_cuenta_bancaria=trans.destino,
@@ -139,7 +176,20 @@ def transferencia_interna(session:Session,trans:TransferenciaCreate,usuario:Opti
                 usuario_registro=(display_user[:60] if display_user else None),
                 usuario_registro_rol=(display_user[:60] if display_user else None),
             )
-            session.add(entrada)
+            # el trigger de saldos bloquea la fila de cada cuenta al insertar; se inserta siempre
+            # en orden de cuenta para que A->B y B->A simultáneas no se bloqueen en cruz
+            for m in sorted((salida, entrada), key=lambda m: m.id_cuenta_bancaria):
+                session.add(m)
+            session.flush()
+            registrar_evento(session, "transferencia.realizada", "transferencia", id_trans, {
+                "transferencia_id": id_trans,
+                "origen": trans.origen,
+                "destino": trans.destino,
+                "monto": trans.monto,
+                "referencia": trans.referencia,
+                "id_movimiento_salida": salida.id_movimiento,
+                "id_movimiento_entrada": entrada.id_movimiento,
+            })
             
             return id_trans
     except IntegrityError as e:
@@ -148,14 +198,6 @@ def transferencia_interna(session:Session,trans:TransferenciaCreate,usuario:Opti
     
 def pago_a_proveedor(session:Session,pago:PagoProveedorCreate,usuario:str, usuario_rol: str)-> int:
     
-    verificar_cuenta_activa(session, pago.id_cuenta_bancaria)
-    
-    #validar saldo 
-    saldo_cuenta = obtener_saldo(session, pago.id_cuenta_bancaria)
-    if saldo_cuenta < pago.monto_pagado:
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, 
-                            detail=f"Saldo insuficiente ({saldo_cuenta}) para realizar el pago.")
-    
     factura: Optional[FacturaCompra] = None
     
     if pago.factura_id:
@@ -171,7 +213,13 @@ def pago_a_proveedor(session:Session,pago:PagoProveedorCreate,usuario:str, usuar
     
     
     try: 
-        with session.begin(): 
+        with transaccion(session): 
+            # cuenta bloqueada antes de validar saldo: los pagos concurrentes se esperan
+            bloquear_cuentas(session, pago.id_cuenta_bancaria)
+            saldo_cuenta = saldo_bloqueado(session, pago.id_cuenta_bancaria)
+            if saldo_cuenta < pago.monto_pagado:
+                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, 
+                                    detail=f"Saldo insuficiente ({saldo_cuenta}) para realizar el pago.")
             
             #registro del pago al proveedor
             
@@ -218,13 +266,31 @@ def pago_a_proveedor(session:Session,pago:PagoProveedorCreate,usuario:str, usuar
                 ).one()
                 fact.saldo_pendiente = (fact.saldo_pendiente - pago.monto_pagado).quantize(Decimal("0.01"))
                 fact.estado = ("PAGADA" if fact.saldo_pendiente == 0 else "PARCIAL")
+                # acumulados que usa el reporte de facturas pagadas (evita el GROUP BY sobre pagos)
+                fact.total_pagado = ((fact.total_pagado or Decimal("0")) + pago.monto_pagado).quantize(Decimal("0.01"))
+                fact.fecha_ultimo_pago = registrar_pago.fecha_pago
+            
+            pago_id = registrar_pago.pago_id
+            registrar_evento(session, "pago.registrado", "pago", pago_id, {
+                "pago_id": pago_id,
+                "proveedor_id": pago.proveedor_id,
+                "factura_id": pago.factura_id if factura else None,
+                "id_cuenta_bancaria": pago.id_cuenta_bancaria,
+                "monto_pagado": pago.monto_pagado,
+                "forma": pago.forma,
+                "id_movimiento": mov.id_movimiento,
+                "estado_factura": fact.estado if factura else None,
+                "saldo_pendiente_factura": fact.saldo_pendiente if factura else None,
+            })
                 
         # pago_id = session.exec(
         #     select(PagoProveedor.pago_id).order_by(PagoProveedor.pago_id.desc()).limit(1)
         # ).first()[0]
         # return pago_id
         
-        return registrar_pago.pago_id
+        # ya confirmado: los reportes de pagos/facturas cacheados quedan viejos
+        cache_reportes.invalidar("pagos_proveedor", "facturas_compra")
+        return pago_id
     except IntegrityError as e:
         
         raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="datos invalidos o pago duplicado") from e
@@ -254,5 +320,5 @@ def historial_pagos(session: Session,
         ORDER BY p.fecha_pago DESC
         LIMIT :limit
     """)
-    rows = session.exec(sql, params).all()
+    rows = session.exec(sql, params=params).all()
     return [dict(r._mapping) for r in rows]
@@ -0,0 +1,261 @@
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from typing import Optional
+
+from fastapi import HTTPException, status
+from sqlmodel import Session
+
+from connection.data.db import settings
+from function.consultas import ConsultaDinamica
+
+# Búsqueda por texto libre con ILIKE '%término%'. Las páginas van por llave (como
+# facturas_pagadas), nunca OFFSET. Movimientos y cheques se buscan en dos pasos:
+#   1) entre las BUSQUEDA_VENTANA filas más recientes que cumplen los demás filtros (un rango
+#      del índice por fecha): si ahí sale la página completa, es la respuesta, porque todo lo
+#      que quedó fuera es más viejo. Resuelve los términos comunes con costo acotado.
+#   2) si no, el término es raro: los índices GIN de trigramas (db/init/busqueda_trgm.sql)
+#      dan las coincidencias en un CTE MATERIALIZED y afuera se ordenan y se corta la página.
+#      La barrera es a propósito: con ORDER BY fecha ... LIMIT en la misma consulta el planner
+#      puede preferir recorrer el índice por fecha filtrando el ILIKE fila por fila, que con un
+#      término raro recorre la tabla entera.
+
+MIN_TERMINO = 3   # con menos de 3 letras no hay trigramas y el índice no sirve
+
+
+def _patron(termino: str) -> str:
+    t = termino.strip()
+    if len(t) < MIN_TERMINO:
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, f"El término de búsqueda debe tener al menos {MIN_TERMINO} caracteres")
+    # el texto del usuario se busca literal: % y _ no son comodines
+    t = t.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{t}%"
+
+
+_FILTROS_MOVIMIENTO = {
+    "texto": "(m.referencia ILIKE :patron OR m.descripcion ILIKE :patron OR m.referencia_externa ILIKE :patron)",
+    "referencia": "m.referencia ILIKE :patron",
+    "descripcion": "m.descripcion ILIKE :patron",
+    "referencia_externa": "m.referencia_externa ILIKE :patron",
+    "cuenta": "m.id_cuenta_bancaria = :cuenta",
+    "desde": "m.fecha >= :desde",
+    "hasta": "m.fecha < :hasta",
+    "tipos": "m.tipo_mov = ANY(CAST(:tipos AS bancos.tipo_mov[]))",
+    "monto_min": "m.monto >= :monto_min",
+    "monto_max": "m.monto <= :monto_max",
+    "despues": "(m.fecha, m.id_movimiento) < (:despues_fecha, :despues_id)",
+}
+_COLUMNAS_MOVIMIENTO = """m.id_movimiento, m.id_cuenta_bancaria, m.fecha, m.tipo_mov, m.monto,
+           m.referencia, m.descripcion, m.referencia_externa, m.usuario_registro, m.usuario_registro_rol"""
+
+CAMPOS_MOVIMIENTO = ("texto", "referencia", "descripcion", "referencia_externa")
+
+# paso 1, una por campo: la ventana lleva los filtros que no son de texto
+_MOVIMIENTOS_RECIENTES = {
+    campo: ConsultaDinamica(
+        f"buscar_movimientos_recientes_{campo}",
+        f"""
+        SELECT {_COLUMNAS_MOVIMIENTO}, 'vivo' AS origen
+        FROM (
+            SELECT *
+            FROM bancos.movimientos_bancarios m
+            {{where}}
+            ORDER BY m.fecha DESC, m.id_movimiento DESC
+            LIMIT :ventana
+        ) m
+        WHERE {_FILTROS_MOVIMIENTO[campo]}
+        ORDER BY m.fecha DESC, m.id_movimiento DESC
+        LIMIT :limite
+        """,
+        filtros={f: c for f, c in _FILTROS_MOVIMIENTO.items() if f not in CAMPOS_MOVIMIENTO},
+    )
+    for campo in CAMPOS_MOVIMIENTO
+}
+
+# paso 2
+_MOVIMIENTOS = ConsultaDinamica(
+    "buscar_movimientos",
+    f"""
+    WITH encontrados AS MATERIALIZED (
+        SELECT {_COLUMNAS_MOVIMIENTO}
+        FROM bancos.movimientos_bancarios m
+        {{where}}
+    )
+    SELECT *, 'vivo' AS origen
+    FROM encontrados
+    ORDER BY fecha DESC, id_movimiento DESC
+    LIMIT :limite
+    """,
+    filtros=_FILTROS_MOVIMIENTO,
+)
+
+# con el histórico (sin los dos pasos): cada rama trae su mejor página y se mezclan (el
+# histórico no tiene índices de trigramas, conviene acotar por cuenta o fechas)
+_MOVIMIENTOS_CON_HISTORICO = ConsultaDinamica(
+    "buscar_movimientos_historico",
+    f"""
+    WITH encontrados AS MATERIALIZED (
+        SELECT {_COLUMNAS_MOVIMIENTO}
+        FROM bancos.movimientos_bancarios m
+        {{where}}
+    )
+    SELECT * FROM (
+        (SELECT *, 'vivo' AS origen
+         FROM encontrados
+         ORDER BY fecha DESC, id_movimiento DESC
+         LIMIT :limite)
+        UNION ALL
+        (SELECT {_COLUMNAS_MOVIMIENTO}, 'historico' AS origen
+         FROM bancos.movimientos_historico m
+         {{where}}
+         ORDER BY m.fecha DESC, m.id_movimiento DESC
+         LIMIT :limite)
+    ) t
+    ORDER BY t.fecha DESC, t.id_movimiento DESC
+    LIMIT :limite
+    """,
+    filtros=_FILTROS_MOVIMIENTO,
+)
+
+
+def buscar_movimientos(session: Session, q: str, campo: str = "texto", cuenta_id: Optional[int] = None,
+                       desde: Optional[date] = None, hasta: Optional[date] = None,
+                       tipos: Optional[list[str]] = None, monto_min: Optional[Decimal] = None,
+                       monto_max: Optional[Decimal] = None, limite: int = 50,
+                       despues_fecha: Optional[datetime] = None, despues_id: Optional[int] = None,
+                       incluir_historico: bool = False) -> dict:
+    """
+    Movimientos cuyo `campo` (o referencia/descripcion/referencia_externa si campo="texto")
+    contiene `q`, más recientes primero. Para la siguiente página se envía `siguiente`.
+    Con `incluir_historico` también busca en los movimientos archivados.
+    """
+    if campo not in CAMPOS_MOVIMIENTO:
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, f"campo debe ser uno de {', '.join(CAMPOS_MOVIMIENTO)}")
+    filtros = {c: None for c in CAMPOS_MOVIMIENTO}
+    filtros[campo] = {"patron": _patron(q)}
+    filtros.update({
+        "cuenta": {"cuenta": cuenta_id} if cuenta_id is not None else None,
+        "desde": {"desde": desde} if desde is not None else None,
+        "hasta": {"hasta": hasta + timedelta(days=1)} if hasta is not None else None,
+        "tipos": {"tipos": tipos} if tipos else None,
+        "monto_min": {"monto_min": monto_min} if monto_min is not None else None,
+        "monto_max": {"monto_max": monto_max} if monto_max is not None else None,
+        "despues": ({"despues_fecha": despues_fecha, "despues_id": despues_id}
+                    if despues_fecha is not None and despues_id is not None else None),
+    })
+    if incluir_historico:
+        filas = _MOVIMIENTOS_CON_HISTORICO.ejecutar(session, filtros, limite=limite)
+    else:
+        filas = _MOVIMIENTOS_RECIENTES[campo].ejecutar(
+            session, {f: p for f, p in filtros.items() if f not in CAMPOS_MOVIMIENTO},
+            patron=filtros[campo]["patron"], limite=limite, ventana=settings.BUSQUEDA_VENTANA)
+        if len(filas) < limite:
+            filas = _MOVIMIENTOS.ejecutar(session, filtros, limite=limite)
+    siguiente = None
+    if len(filas) == limite:
+        siguiente = {"despues_fecha": filas[-1]["fecha"], "despues_id": filas[-1]["id_movimiento"]}
+    return {"movimientos": filas, "siguiente": siguiente}
+
+
+_FILTROS_CHEQUE = {
+    "cuenta": "c.id_cuenta_bancaria = :cuenta",
+    "desde": "c.fecha_emision >= :desde",
+    "hasta": "c.fecha_emision <= :hasta",
+    "estado": "c.estado = :estado",
+    "monto_min": "c.monto >= :monto_min",
+    "monto_max": "c.monto <= :monto_max",
+    "despues": "(c.fecha_emision, c.id_cheque) < (:despues_fecha, :despues_id)",
+}
+_COLUMNAS_CHEQUE = """c.id_cheque, c.id_cuenta_bancaria, c.numero_cheque, c.fecha_emision, c.beneficiario,
+           c.monto, c.estado"""
+
+# los mismos dos pasos que movimientos
+_CHEQUES_RECIENTES = ConsultaDinamica(
+    "buscar_cheques_recientes",
+    f"""
+    SELECT {_COLUMNAS_CHEQUE}
+    FROM (
+        SELECT *
+        FROM bancos.cheques c
+        {{where}}
+        ORDER BY c.fecha_emision DESC, c.id_cheque DESC
+        LIMIT :ventana
+    ) c
+    WHERE c.beneficiario ILIKE :patron
+    ORDER BY c.fecha_emision DESC, c.id_cheque DESC
+    LIMIT :limite
+    """,
+    filtros=_FILTROS_CHEQUE,
+)
+
+_CHEQUES = ConsultaDinamica(
+    "buscar_cheques",
+    f"""
+    WITH encontrados AS MATERIALIZED (
+        SELECT {_COLUMNAS_CHEQUE}
+        FROM bancos.cheques c
+        {{where}}
+    )
+    SELECT * FROM encontrados
+    ORDER BY fecha_emision DESC, id_cheque DESC
+    LIMIT :limite
+    """,
+    filtros=_FILTROS_CHEQUE,
+    fijos=["c.beneficiario ILIKE :patron"],
+)
+
+
+def buscar_cheques(session: Session, q: str, cuenta_id: Optional[int] = None, desde: Optional[date] = None,
+                   hasta: Optional[date] = None, estado: Optional[str] = None,
+                   monto_min: Optional[Decimal] = None, monto_max: Optional[Decimal] = None, limite: int = 50,
+                   despues_fecha: Optional[date] = None, despues_id: Optional[int] = None) -> dict:
+    """ Cheques por beneficiario, más recientes primero """
+    filtros = {
+        "cuenta": {"cuenta": cuenta_id} if cuenta_id is not None else None,
+        "desde": {"desde": desde} if desde is not None else None,
+        "hasta": {"hasta": hasta} if hasta is not None else None,
+        "estado": {"estado": estado} if estado is not None else None,
+        "monto_min": {"monto_min": monto_min} if monto_min is not None else None,
+        "monto_max": {"monto_max": monto_max} if monto_max is not None else None,
+        "despues": ({"despues_fecha": despues_fecha, "despues_id": despues_id}
+                    if despues_fecha is not None and despues_id is not None else None),
+    }
+    patron = _patron(q)
+    filas = _CHEQUES_RECIENTES.ejecutar(session, filtros, patron=patron, limite=limite,
+                                        ventana=settings.BUSQUEDA_VENTANA)
+    if len(filas) < limite:
+        filas = _CHEQUES.ejecutar(session, filtros, patron=patron, limite=limite)
+    siguiente = None
+    if len(filas) == limite:
+        siguiente = {"despues_fecha": filas[-1]["fecha_emision"], "despues_id": filas[-1]["id_cheque"]}
+    return {"cheques": filas, "siguiente": siguiente}
+
+
+_PROVEEDORES = ConsultaDinamica(
+    "buscar_proveedores",
+    """
+    SELECT pr.proveedor_id, pr.nombre, pr.nit, pr.telefono, pr.correo, pr.activo
+    FROM bancos.proveedores pr
+    {where}
+    ORDER BY pr.nombre, pr.proveedor_id
+    LIMIT :limite
+    """,
+    filtros={
+        "activo": "pr.activo = :activo",
+        "despues": "(pr.nombre, pr.proveedor_id) > (:despues_nombre, :despues_id)",
+    },
+    fijos=["(pr.nombre ILIKE :patron OR pr.nit ILIKE :patron)"],
+)
+
+
+def buscar_proveedores(session: Session, q: str, activo: Optional[bool] = None, limite: int = 50,
+                       despues_nombre: Optional[str] = None, despues_id: Optional[int] = None) -> dict:
+    """ Proveedores por nombre o NIT, en orden alfabético """
+    filas = _PROVEEDORES.ejecutar(session, {
+        "activo": {"activo": activo} if activo is not None else None,
+        "despues": ({"despues_nombre": despues_nombre, "despues_id": despues_id}
+                    if despues_nombre is not None and despues_id is not None else None),
+    }, patron=_patron(q), limite=limite)
+    siguiente = None
+    if len(filas) == limite:
+        siguiente = {"despues_nombre": filas[-1]["nombre"], "despues_id": filas[-1]["proveedor_id"]}
+    return {"proveedores": filas, "siguiente": siguiente}
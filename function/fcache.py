@@ -0,0 +1,188 @@
+import functools
+import hashlib
+import inspect
+import json
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Callable, Iterable, Optional
+
+from connection.data.db import settings
+
+# Cache de resultados de reportes.
+# La clave lleva el "número de generación" de cada tabla que lee el reporte; una escritura en
+# esa tabla incrementa la generación y las entradas viejas simplemente dejan de encontrarse
+# (se van por LRU/TTL). Con el backend de memoria la generación es por proceso: con varias
+# réplicas el TTL acota lo desactualizado; con redis la generación es compartida.
+
+
+class BackendMemoria:
+    def __init__(self, maximo: int, ttl: int):
+        self.maximo = maximo
+        self.ttl = ttl
+        self._datos: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+        self._generaciones: dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def obtener(self, clave: str) -> Optional[Any]:
+        with self._lock:
+            item = self._datos.get(clave)
+            if item is None:
+                return None
+            vence, valor = item
+            if vence < time.monotonic():
+                del self._datos[clave]
+                return None
+            self._datos.move_to_end(clave)
+            return valor
+
+    def guardar(self, clave: str, valor: Any) -> None:
+        with self._lock:
+            self._datos[clave] = (time.monotonic() + self.ttl, valor)
+            self._datos.move_to_end(clave)
+            while len(self._datos) > self.maximo:
+                self._datos.popitem(last=False)
+
+    def generacion(self, tabla: str) -> int:
+        return self._generaciones.get(tabla, 0)
+
+    def incrementar(self, tabla: str) -> None:
+        with self._lock:
+            self._generaciones[tabla] = self._generaciones.get(tabla, 0) + 1
+
+    def tamanio(self) -> int:
+        return len(self._datos)
+
+
+class BackendRedis:
+    ''' cualquier servidor compatible con redis (redis, valkey, dragonfly...) '''
+
+    def __init__(self, url: str, ttl: int):
+        try:
+            import redis
+        except ImportError as e:
+            raise RuntimeError("REPORT_CACHE_BACKEND=redis requiere el paquete 'redis'") from e
+        self.ttl = ttl
+        self._r = redis.Redis.from_url(url)
+
+    def obtener(self, clave: str) -> Optional[Any]:
+        crudo = self._r.get(f"bancos:rep:{clave}")
+        return pickle.loads(crudo) if crudo is not None else None
+
+    def guardar(self, clave: str, valor: Any) -> None:
+        self._r.set(f"bancos:rep:{clave}", pickle.dumps(valor), ex=self.ttl)
+
+    def generacion(self, tabla: str) -> int:
+        return int(self._r.get(f"bancos:gen:{tabla}") or 0)
+
+    def incrementar(self, tabla: str) -> None:
+        self._r.incr(f"bancos:gen:{tabla}")
+
+    def tamanio(self) -> int:
+        return -1  # el servidor comparte keyspace; no se cuenta
+
+
+def _normalizar(valor: Any) -> Any:
+    if isinstance(valor, (date, datetime)):
+        return valor.isoformat()
+    if isinstance(valor, Decimal):
+        return str(valor.normalize())
+    if isinstance(valor, (list, tuple, set, frozenset)):
+        return [_normalizar(v) for v in valor]
+    return valor
+
+
+class CacheReportes:
+    def __init__(self, backend: Optional[Any]):
+        self.backend = backend
+        self._lock = threading.Lock()
+        self._hits: dict[str, int] = {}
+        self._misses: dict[str, int] = {}
+
+    @property
+    def activo(self) -> bool:
+        return self.backend is not None
+
+    def clave(self, nombre: str, params: dict, tablas: Iterable[str]) -> str:
+        gens = {t: self.backend.generacion(t) for t in tablas}
+        normal = {k: _normalizar(v) for k, v in sorted(params.items()) if v is not None}
+        crudo = json.dumps({"g": gens, "p": normal}, sort_keys=True, separators=(",", ":"))
+        return f"{nombre}:{hashlib.sha1(crudo.encode()).hexdigest()}"
+
+    def obtener_o_calcular(self, nombre: str, params: dict, tablas: Iterable[str], calcular: Callable[[], Any],
+                           guardar: bool = True) -> Any:
+        if not self.activo:
+            return calcular()
+        clave = self.clave(nombre, params, tablas)
+        valor = self.backend.obtener(clave)
+        if valor is not None:
+            self._contar(self._hits, nombre)
+            return valor
+        self._contar(self._misses, nombre)
+        valor = calcular()
+        if guardar:
+            self.backend.guardar(clave, valor)
+        return valor
+
+    def invalidar(self, *tablas: str) -> None:
+        if not self.activo:
+            return
+        for t in tablas:
+            self.backend.incrementar(t)
+
+    def _contar(self, contador: dict[str, int], nombre: str) -> None:
+        with self._lock:
+            contador[nombre] = contador.get(nombre, 0) + 1
+
+    def metricas(self) -> dict:
+        nombres = sorted(set(self._hits) | set(self._misses))
+        por_reporte = {}
+        for n in nombres:
+            h, m = self._hits.get(n, 0), self._misses.get(n, 0)
+            por_reporte[n] = {"hits": h, "misses": m, "hit_ratio": round(h / (h + m), 4) if h + m else 0.0}
+        hits, misses = sum(self._hits.values()), sum(self._misses.values())
+        return {
+            "backend": settings.REPORT_CACHE_BACKEND,
+            "entradas": self.backend.tamanio() if self.activo else 0,
+            "hits": hits,
+            "misses": misses,
+            "hit_ratio": round(hits / (hits + misses), 4) if hits + misses else 0.0,
+            "reportes": por_reporte,
+        }
+
+
+def _crear_cache() -> CacheReportes:
+    tipo = settings.REPORT_CACHE_BACKEND
+    if tipo == "memoria":
+        return CacheReportes(BackendMemoria(settings.REPORT_CACHE_MAX, settings.REPORT_CACHE_TTL))
+    if tipo == "redis":
+        return CacheReportes(BackendRedis(settings.REPORT_CACHE_URL, settings.REPORT_CACHE_TTL))
+    return CacheReportes(None)
+
+
+cache_reportes = _crear_cache()
+
+
+def cacheado(nombre: str, tablas: tuple[str, ...]):
+    '''
+    Decorador para funciones de reporte `fn(session, ...)`: la clave se arma con los argumentos
+    (con defaults aplicados, sin la sesión) y las generaciones de `tablas`.
+    '''
+    def _decorador(fn):
+        firma = inspect.signature(fn)
+
+        @functools.wraps(fn)
+        def _envoltura(session, *args, **kwargs):
+            ligados = firma.bind(session, *args, **kwargs)
+            ligados.apply_defaults()
+            params = {k: v for k, v in ligados.arguments.items() if k != "session"}
+            return cache_reportes.obtener_o_calcular(
+                nombre, params, tablas, lambda: fn(session, *args, **kwargs),
+                # leído de una réplica atrasada: se responde pero no se guarda
+                guardar=session.info.get("al_dia", True),
+            )
+        return _envoltura
+    return _decorador
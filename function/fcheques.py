@@ -1,32 +1,97 @@
 from sqlmodel import Session,select
-from connection.models.modelos import Cheque, MovimientoBancario, TipoCheque
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError
+from connection.data.db import transaccion
+from connection.models.modelos import Cheque, Chequera, MovimientoBancario, TipoCheque, ChequeCobroItem, EmisionChequesLote
 from fastapi import HTTPException, status
 from decimal import Decimal
-from function.fbancos import verificar_cuenta_activa, obtener_saldo
+from function.fbancos import verificar_cuenta_activa, bloquear_cuentas, saldo_bloqueado
+from function.foutbox import registrar_evento, registrar_eventos
+from function.consultas import ConsultaDinamica
 
-def emitir_cheque(session: Session, id_cuenta: int, id_tipo: int, numero: str,
+def _asignar_numeros(session: Session, id_cuenta: int, cantidad: int) -> list[str]:
+    '''
+    Reserva `cantidad` números consecutivos de la primera chequera activa con espacio.
+    El UPDATE ... FOR UPDATE serializa a los que emiten en la misma cuenta; debe correr
+    dentro de la transacción que inserta los cheques.
+    '''
+    desde = session.exec(
+        text("""
+            UPDATE bancos.chequeras
+            SET siguiente_numero = siguiente_numero + :n,
+                activa = (siguiente_numero + :n <= numero_final)
+            WHERE id_chequera = (
+                SELECT id_chequera FROM bancos.chequeras
+                WHERE id_cuenta_bancaria = :c
+                  AND activa
+                  AND numero_final - siguiente_numero + 1 >= :n
+                ORDER BY id_chequera
+                LIMIT 1
+                FOR UPDATE
+            )
+            RETURNING siguiente_numero - :n AS desde
+        """),
+        params={"c": id_cuenta, "n": cantidad},
+    ).scalar()
+    if desde is None:
+        raise HTTPException(status.HTTP_409_CONFLICT, f"No hay chequera activa con {cantidad} números disponibles para la cuenta")
+    return [str(desde + i) for i in range(cantidad)]
+
+
+def crear_chequera(session: Session, id_cuenta: int, numero_inicial: int, numero_final: int) -> int:
+    verificar_cuenta_activa(session, id_cuenta)
+    if numero_final < numero_inicial:
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, "El número final debe ser mayor o igual al inicial")
+
+    ch = Chequera(id_cuenta_bancaria=id_cuenta, numero_inicial=numero_inicial,
+                  numero_final=numero_final, siguiente_numero=numero_inicial, activa=True)
+    try:
+        session.add(ch); session.commit(); session.refresh(ch)
+        return ch.id_chequera
+    except IntegrityError as e:
+        session.rollback()
+        raise HTTPException(status.HTTP_409_CONFLICT, "El rango se traslapa con otra chequera de la cuenta") from e
+
+
+def listar_chequeras(session: Session, id_cuenta: int | None = None) -> list[dict]:
+    q = select(Chequera)
+    if id_cuenta is not None:
+        q = q.where(Chequera.id_cuenta_bancaria == id_cuenta)
+    rows = session.exec(q.order_by(Chequera.id_chequera.desc())).all()
+    return [
+        {**r.model_dump(), "disponibles": max(0, r.numero_final - r.siguiente_numero + 1)}
+        for r in rows
+    ]
+
+
+def emitir_cheque(session: Session, id_cuenta: int, id_tipo: int, numero: str | None,
                   beneficiario: str, monto: Decimal, referencia: str | None, observacion: str | None) -> int:
     verificar_cuenta_activa(session, id_cuenta)
-    
-    #validar saldo 
-    saldo_actual = obtener_saldo(session, id_cuenta)
-    if saldo_actual < monto:
-        raise HTTPException(status.HTTP_400_BAD_REQUEST, f"Saldo insuficiente ({saldo_actual}) para emitir cheque de {monto}.")
-    
+
     if not session.get(TipoCheque, id_tipo):
         raise HTTPException(status.HTTP_404_NOT_FOUND, "Tipo de cheque no existe")
 
-    # Validar que el número no exista en esa cuenta
-    exist = session.exec(
-        select(Cheque.id_cheque).where(
-            Cheque.id_cuenta_bancaria == id_cuenta,
-            Cheque.numero_cheque == numero
-        )
-    ).first()
-    if exist:
-        raise HTTPException(status.HTTP_409_CONFLICT, "Número de cheque ya existe en la cuenta")
+    # Validar que el número no exista en esa cuenta (los de chequera ya son únicos)
+    if numero is not None:
+        exist = session.exec(
+            select(Cheque.id_cheque).where(
+                Cheque.id_cuenta_bancaria == id_cuenta,
+                Cheque.numero_cheque == numero
+            )
+        ).first()
+        if exist:
+            raise HTTPException(status.HTTP_409_CONFLICT, "Número de cheque ya existe en la cuenta")
 
-    with session.begin():
+    with transaccion(session):
+        # mismo bloqueo que emitir_cheques_lote, pago_a_proveedor y transferencia_interna
+        bloquear_cuentas(session, id_cuenta)
+        saldo_actual = saldo_bloqueado(session, id_cuenta)
+        if saldo_actual < monto:
+            raise HTTPException(status.HTTP_400_BAD_REQUEST, f"Saldo insuficiente ({saldo_actual}) para emitir cheque de {monto}.")
+
+        if numero is None:
+            numero = _asignar_numeros(session, id_cuenta, 1)[0]
+        
         #registrar cheque 
         ch = Cheque(
             id_cuenta_bancaria=id_cuenta,
@@ -52,6 +117,10 @@ def emitir_cheque(session: Session, id_cuenta: int, id_tipo: int, numero: str,
         
         mov.referencia_externa = str(ch.id_cheque)
         session.add(mov)
+        registrar_evento(session, "cheque.emitido", "cheque", ch.id_cheque, {
+            "id_cheque": ch.id_cheque, "id_cuenta_bancaria": id_cuenta, "numero_cheque": numero,
+            "beneficiario": beneficiario, "monto": monto, "id_movimiento": mov.id_movimiento,
+        })
         return ch.id_cheque
 
 def cobrar_cheque(session: Session, id_cheque: int) -> None:
@@ -61,7 +130,7 @@ def cobrar_cheque(session: Session, id_cheque: int) -> None:
     if ch.estado != "EMITIDO":
         raise HTTPException(status.HTTP_400_BAD_REQUEST, "Solo cheques EMITIDOS se pueden cobrar")
     
-    with session.begin():
+    with transaccion(session):
         #actualizar estado del cheque
         ch.estado = "COBRADO"
         session.add(ch)
@@ -79,6 +148,10 @@ def cobrar_cheque(session: Session, id_cheque: int) -> None:
         
         mov_asociado.conciliado = True
         session.add(mov_asociado)
+        registrar_evento(session, "cheque.cobrado", "cheque", ch.id_cheque, {
+            "id_cheque": ch.id_cheque, "id_cuenta_bancaria": ch.id_cuenta_bancaria,
+            "numero_cheque": ch.numero_cheque, "monto": ch.monto,
+        })
         
         
 
@@ -89,7 +162,7 @@ def anular_cheque(session: Session, id_cheque: int,motivo: str | None) -> None:
     if ch.estado != "EMITIDO":
         raise HTTPException(status.HTTP_400_BAD_REQUEST, "Solo cheques EMITIDOS se pueden anular")
     
-    with session.begin():
+    with transaccion(session):
         ch.estado = "ANULADO"
         session.add(ch)
         
@@ -115,4 +188,195 @@ def anular_cheque(session: Session, id_cheque: int,motivo: str | None) -> None:
         
         if mov_original:
             mov_original.conciliado = True # Lo concilio para que no salga como pendiente
-            session.add(mov_original)
\ No newline at end of file
+            session.add(mov_original)
+        registrar_evento(session, "cheque.anulado", "cheque", ch.id_cheque, {
+            "id_cheque": ch.id_cheque, "id_cuenta_bancaria": ch.id_cuenta_bancaria,
+            "numero_cheque": ch.numero_cheque, "monto": ch.monto, "motivo": motivo,
+        })
+
+def emitir_cheques_lote(session: Session, dto: EmisionChequesLote) -> dict:
+    '''
+    Emite N cheques (planilla) con una sola validación de saldo y una sola transacción:
+    bloquea la cuenta, reserva N números de la chequera e inserta cheques y movimientos en bloque.
+    '''
+    n = len(dto.cheques)
+    total = sum((c.monto for c in dto.cheques), Decimal("0.00"))
+
+    with transaccion(session):
+        # el bloqueo de la cuenta serializa esta emisión con las demás que validan saldo en la
+        # misma cuenta (emitir_cheque, pago_a_proveedor, transferencia_interna)
+        bloquear_cuentas(session, dto.id_cuenta_bancaria)
+        if not session.get(TipoCheque, dto.id_tipo_cheque):
+            raise HTTPException(status.HTTP_404_NOT_FOUND, "Tipo de cheque no existe")
+
+        saldo = saldo_bloqueado(session, dto.id_cuenta_bancaria)
+        if saldo < total:
+            raise HTTPException(status.HTTP_400_BAD_REQUEST, f"Saldo insuficiente ({saldo}) para emitir {n} cheques por {total}.")
+
+        numeros = _asignar_numeros(session, dto.id_cuenta_bancaria, n)
+        beneficiarios = [c.beneficiario for c in dto.cheques]
+        montos = [c.monto for c in dto.cheques]
+        referencias = [
+            (c.referencia or f"Cheque {num} a {c.beneficiario}")[:60]
+            for c, num in zip(dto.cheques, numeros)
+        ]
+
+        try:
+            emitidos = session.exec(text("""
+                INSERT INTO bancos.cheques (id_cuenta_bancaria, id_tipo_cheque, numero_cheque, beneficiario, monto, estado)
+                SELECT :c, :t, x.numero, x.beneficiario, x.monto, 'EMITIDO'
+                FROM unnest(CAST(:numeros AS varchar[]), CAST(:beneficiarios AS varchar[]), CAST(:montos AS numeric[]))
+                     AS x(numero, beneficiario, monto)
+                RETURNING id_cheque, numero_cheque
+            """), params={"c": dto.id_cuenta_bancaria, "t": dto.id_tipo_cheque, "numeros": numeros,
+                   "beneficiarios": beneficiarios, "montos": montos}).all()
+        except IntegrityError as e:
+            raise HTTPException(status.HTTP_409_CONFLICT, "Algún número de la chequera ya fue usado manualmente en la cuenta") from e
+
+        id_por_numero = {r.numero_cheque: r.id_cheque for r in emitidos}
+        ids = [id_por_numero[num] for num in numeros]
+
+        session.exec(text("""
+            INSERT INTO bancos.movimientos_bancarios (id_cuenta_bancaria, tipo_mov, monto, referencia, descripcion, referencia_externa)
+            SELECT :c, CAST('CHEQUE_EMITIDO' AS bancos.tipo_mov), x.monto, x.referencia, :obs, x.id_cheque::text
+            FROM unnest(CAST(:ids AS bigint[]), CAST(:montos AS numeric[]), CAST(:referencias AS varchar[]))
+                 AS x(id_cheque, monto, referencia)
+        """), params={"c": dto.id_cuenta_bancaria, "obs": dto.observacion, "ids": ids,
+               "montos": montos, "referencias": referencias})
+
+        registrar_eventos(session, "cheque.emitido", "cheque", ids, [
+            {"id_cheque": i, "id_cuenta_bancaria": dto.id_cuenta_bancaria, "numero_cheque": num,
+             "beneficiario": c.beneficiario, "monto": c.monto}
+            for i, num, c in zip(ids, numeros, dto.cheques)
+        ])
+
+    return {
+        "id_cuenta_bancaria": dto.id_cuenta_bancaria,
+        "cantidad": n,
+        "total": str(total),
+        "cheques": [
+            {"id_cheque": i, "numero_cheque": num, "beneficiario": c.beneficiario, "monto": str(c.monto)}
+            for i, num, c in zip(ids, numeros, dto.cheques)
+        ],
+    }
+
+
+# archivo de compensación como tabla: un unnest por columna, así el match es un solo join
+_ARCHIVO_CTE = """
+    WITH archivo AS (
+        SELECT *
+        FROM unnest(
+            CAST(:filas AS integer[]),
+            CAST(:cuentas AS integer[]),
+            CAST(:numeros AS varchar[]),
+            CAST(:montos AS numeric[])
+        ) AS a(fila, id_cuenta_bancaria, numero_cheque, monto)
+    )
+"""
+
+def cobrar_cheques_lote(session: Session, items: list[ChequeCobroItem], filas_origen: list[int] | None = None) -> dict:
+    '''
+    Compensa en bloque los cheques del archivo del banco. Se cobran solo los que existen,
+    están EMITIDOS y el monto coincide; el resto se devuelve como rechazado con el motivo.
+    `fila` de cada rechazo es la posición del item (desde 1) o, con `filas_origen`, el número
+    que el llamador le dio (la línea del CSV).
+    '''
+    rechazados: list[dict] = []
+    vistos: set[tuple[int, str]] = set()
+    filas, cuentas, numeros, montos = [], [], [], []
+    for n, it in zip(filas_origen or range(1, len(items) + 1), items):
+        llave = (it.id_cuenta_bancaria, it.numero_cheque.strip())
+        if llave in vistos:
+            rechazados.append({"fila": n, "id_cuenta_bancaria": llave[0], "numero_cheque": llave[1],
+                               "motivo": "DUPLICADO_EN_ARCHIVO"})
+            continue
+        vistos.add(llave)
+        filas.append(n); cuentas.append(llave[0]); numeros.append(llave[1]); montos.append(it.monto)
+    params = {"filas": filas, "cuentas": cuentas, "numeros": numeros, "montos": montos}
+
+    with transaccion(session):
+        cobrados = session.exec(text(_ARCHIVO_CTE + """
+            UPDATE bancos.cheques ch
+            SET estado = 'COBRADO'
+            FROM archivo a
+            WHERE ch.id_cuenta_bancaria = a.id_cuenta_bancaria
+              AND ch.numero_cheque = a.numero_cheque
+              AND ch.estado = 'EMITIDO'
+              AND ch.monto = a.monto
+            RETURNING a.fila, ch.id_cheque, ch.id_cuenta_bancaria, ch.numero_cheque, ch.monto
+        """), params=params).all()
+
+        refs = [str(c.id_cheque) for c in cobrados]
+        con_movimiento = set()
+        if refs:
+            con_movimiento = set(session.exec(text("""
+                UPDATE bancos.movimientos_bancarios
+                SET conciliado = true
+                WHERE tipo_mov = 'CHEQUE_EMITIDO'
+                  AND referencia_externa = ANY(CAST(:refs AS varchar[]))
+                RETURNING referencia_externa
+            """), params={"refs": refs}).scalars().all())
+
+        registrar_eventos(session, "cheque.cobrado", "cheque", [c.id_cheque for c in cobrados], [
+            {"id_cheque": c.id_cheque, "id_cuenta_bancaria": c.id_cuenta_bancaria,
+             "numero_cheque": c.numero_cheque, "monto": c.monto}
+            for c in cobrados
+        ])
+
+        filas_cobradas = [c.fila for c in cobrados]
+        pendientes = session.exec(text(_ARCHIVO_CTE + """
+            SELECT a.fila, a.id_cuenta_bancaria, a.numero_cheque, a.monto AS monto_archivo,
+                   ch.id_cheque, ch.monto AS monto_cheque, ch.estado
+            FROM archivo a
+            LEFT JOIN bancos.cheques ch
+              ON ch.id_cuenta_bancaria = a.id_cuenta_bancaria
+             AND ch.numero_cheque = a.numero_cheque
+            WHERE a.fila <> ALL(CAST(:cobradas AS integer[]))
+            ORDER BY a.fila
+        """), params={**params, "cobradas": filas_cobradas}).all()
+
+    for p in pendientes:
+        if p.id_cheque is None:
+            motivo = "NO_ENCONTRADO"
+        elif p.estado != "EMITIDO":
+            motivo = f"ESTADO_{p.estado}"
+        else:
+            motivo = "MONTO_DISTINTO"
+        rechazados.append({
+            "fila": p.fila, "id_cuenta_bancaria": p.id_cuenta_bancaria, "numero_cheque": p.numero_cheque,
+            "id_cheque": p.id_cheque, "monto_archivo": str(p.monto_archivo),
+            "monto_cheque": str(p.monto_cheque) if p.monto_cheque is not None else None,
+            "motivo": motivo,
+        })
+    rechazados.sort(key=lambda r: r["fila"])
+
+    return {
+        "recibidos": len(items),
+        "cobrados": len(cobrados),
+        "rechazados": len(rechazados),
+        # cobrados cuyo CHEQUE_EMITIDO no se encontró (no debería pasar, pero se reporta)
+        "sin_movimiento": [c.id_cheque for c in cobrados if str(c.id_cheque) not in con_movimiento],
+        "detalle_rechazados": rechazados,
+    }
+
+
+_CHEQUES = ConsultaDinamica(
+    "listar_cheques",
+    """
+    SELECT {columnas} FROM bancos.cheques
+    {where}
+    ORDER BY id_cheque DESC LIMIT 200
+    """,
+    filtros={"cuenta": "id_cuenta_bancaria = :c", "estado": "estado = :e"},
+    columnas={c: c for c in ("id_cheque", "id_cuenta_bancaria", "id_tipo_cheque", "numero_cheque",
+                             "fecha_emision", "beneficiario", "monto", "estado")},
+)
+COLUMNAS_CHEQUES = _CHEQUES.columnas
+
+
+def consultar_cheques(session: Session, cuenta_id: int | None = None, estado: str | None = None,
+                      campos: tuple[str, ...] | None = None) -> list[dict]:
+    return _CHEQUES.ejecutar(session, {
+        "cuenta": {"c": cuenta_id} if cuenta_id is not None else None,
+        "estado": {"e": estado} if estado is not None else None,
+    }, campos=campos)
@@ -1,17 +1,30 @@
 from sqlmodel import Session
 from sqlalchemy import text
 from datetime import date
-from connection.models.modelos import ConciliacionBancaria
+from time import perf_counter
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+from connection.data.db import conexiones_maximas, engine, settings, transaccion
+from connection.models.modelos import ConciliacionBancaria, ConciliacionLoteItem
 from fastapi import HTTPException, status
 from decimal import Decimal,ROUND_HALF_UP
-from typing import List, Dict, Union
+from typing import Callable, Iterator, List, Dict, Union
 from function.fbancos import verificar_cuenta_activa
+from function.fhistorico import arrastre_cuenta
+from function.consultas import ConsultaDinamica
 
 def _calcular_saldo_movimientos(session: Session, id_cuenta: int, hasta: date, solo_no_conciliados: bool = False) -> Decimal:
     """Calcula el saldo de los movimientos (Débito/Crédito) hasta una fecha dada.
     Si solo_no_conciliados es True, solo suma los movimientos con conciliado=False."""
 
     condicion_conciliado = "AND conciliado = false" if solo_no_conciliados else ""
+    # lo archivado está conciliado: solo cuenta para el saldo total, como arrastre
+    arrastre = Decimal("0.00")
+    if not solo_no_conciliados:
+        arrastre, archivado_hasta = arrastre_cuenta(session, id_cuenta)
+        if archivado_hasta is not None and hasta < archivado_hasta:
+            raise HTTPException(status.HTTP_409_CONFLICT,
+                                f"La cuenta {id_cuenta} está archivada hasta {archivado_hasta}; no se puede conciliar antes")
     
     sum_sql = text(f"""
         SELECT COALESCE(SUM(
@@ -27,17 +40,11 @@ def _calcular_saldo_movimientos(session: Session, id_cuenta: int, hasta: date, s
           {condicion_conciliado}
     """)
     
-    row = session.exec(sum_sql, {"id": id_cuenta, "hasta": hasta}).first()
-    return row[0] if row else Decimal("0.00")
+    row = session.exec(sum_sql, params={"id": id_cuenta, "hasta": hasta}).first()
+    return (row[0] if row else Decimal("0.00")) + arrastre
   
 
-def _seguimiento_bandera(session: Session, id_cuenta: int, f: date, saldo_banco: Decimal) -> dict:
-    """
-    Calcula y devuelve el seguimiento de la conciliación sin marcar movimientos ni insertar registros.
-    """
-    
-    verificar_cuenta_activa(session, id_cuenta)
-   
+def _calcular_seguimiento(session: Session, id_cuenta: int, f: date, saldo_banco: Decimal) -> dict:
     saldo_no_conc = _calcular_saldo_movimientos(session, id_cuenta, f, solo_no_conciliados=True)
     saldo_libros = _calcular_saldo_movimientos(session, id_cuenta, f, solo_no_conciliados=False)
 
@@ -52,115 +59,48 @@ def _seguimiento_bandera(session: Session, id_cuenta: int, f: date, saldo_banco:
     }
 
 
+def _seguimiento_bandera(session: Session, id_cuenta: int, f: date, saldo_banco: Decimal) -> dict:
+    """
+    Calcula y devuelve el seguimiento de la conciliación sin marcar movimientos ni insertar registros.
+    """
+    
+    verificar_cuenta_activa(session, id_cuenta)
+    return _calcular_seguimiento(session, id_cuenta, f, saldo_banco)
+
+
 #--------------------------------------------------------------------------------
 
 
-def crear_conciliacion(session: Session, id_cuenta: int, fecha_conciliacion: date | None,
-                       saldo_banco: Decimal, observaciones: str | None) -> int:
-  
-    verificar_cuenta_activa(session, id_cuenta)
-    
-    f = fecha_conciliacion or date.today()
+def _registrar_conciliacion(session: Session, id_cuenta: int, f: date,
+                            saldo_banco: Decimal, observaciones: str | None) -> int:
+    """Marca los movimientos e inserta la conciliación; la transacción la abre quien llama."""
     
     saldo_libros = _calcular_saldo_movimientos(session, id_cuenta, f, solo_no_conciliados=False)
     
     # La diferencia se calcula entre el saldo del banco y el saldo total de libros
     diferencia = (saldo_banco - saldo_libros).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
 
-    #Marcar como conciliados y registrar conciliación en una sola transacción
-    with session.begin():
-      #Actualizar movimientos no conciliados
-        upd = text("""
-            UPDATE bancos.movimientos_bancarios
-            SET conciliado = true
-            WHERE id_cuenta_bancaria = :id
-              AND fecha::date <= :hasta
-              AND conciliado = false
-        """)
-        session.exec(upd, {"id": id_cuenta, "hasta": f})
-
-        c = ConciliacionBancaria(
-            id_cuenta_bancaria=id_cuenta,
-            fecha_conciliacion=f,
-            saldo_libros=saldo_libros,
-            saldo_banco=saldo_banco,
-            diferencia=diferencia,
-            observaciones=observaciones
-        )
-        session.add(c)
-        session.flush()
-        return c.id_conciliacion
-    
-
-def listar_conciliaciones(session: Session, id_cuenta: int, desde: date | None, hasta: date | None, limit: int):
-    verificar_cuenta_activa(session, id_cuenta)
-    sql = """
-      SELECT id_conciliacion, id_cuenta_bancaria, fecha_conciliacion,
-             saldo_libros, saldo_banco, diferencia, observaciones
-      FROM bancos.conciliaciones_bancarias
-      WHERE id_cuenta_bancaria = :id
-    """
-    params = {"id": id_cuenta, "limit": limit}
-    if desde:
-        sql += " AND fecha_conciliacion >= :desde"
-        params["desde"] = desde
-    if hasta:
-        sql += " AND fecha_conciliacion <= :hasta"
-        params["hasta"] = hasta
-    sql += " ORDER BY fecha_conciliacion DESC LIMIT :limit"
-
-    rows = session.exec(text(sql), params).all()
-    return [dict(r._mapping) for r in rows]
-
-
-
-
-def _calcular_saldo_movimientos(session: Session, id_cuenta: int, hasta: date, solo_no_conciliados: bool = False) -> Decimal:
-    """Calcula el saldo de los movimientos (Débito/Crédito) hasta una fecha dada.
-    Si solo_no_conciliados es True, solo suma los movimientos con conciliado=False."""
-
-    condicion_conciliado = "AND conciliado = false" if solo_no_conciliados else ""
-    
-    sum_sql = text(f"""
-        SELECT COALESCE(SUM(
-          CASE 
-            WHEN tipo_mov IN ('DEPOSITO','TRANSFERENCIA_IN','CHEQUE_COBRADO') THEN monto
-            WHEN tipo_mov IN ('RETIRO','TRANSFERENCIA_OUT','CHEQUE_EMITIDO') THEN -monto
-            ELSE 0
-          END
-        ), 0)::numeric(18,2) AS saldo
-        FROM bancos.movimientos_bancarios
+    #Actualizar movimientos no conciliados
+    upd = text("""
+        UPDATE bancos.movimientos_bancarios
+        SET conciliado = true
         WHERE id_cuenta_bancaria = :id
           AND fecha::date <= :hasta
-          {condicion_conciliado}
+          AND conciliado = false
     """)
-    
-    row = session.exec(sum_sql, {"id": id_cuenta, "hasta": hasta}).first()
-    return row[0] if row else Decimal("0.00")
-  
-
-def _seguimiento_bandera(session: Session, id_cuenta: int, f: date, saldo_banco: Decimal) -> dict:
-    """
-    Calcula y devuelve el seguimiento de la conciliación sin marcar movimientos ni insertar registros.
-    """
-    
-    verificar_cuenta_activa(session, id_cuenta)
-   
-    saldo_no_conc = _calcular_saldo_movimientos(session, id_cuenta, f, solo_no_conciliados=True)
-    saldo_libros = _calcular_saldo_movimientos(session, id_cuenta, f, solo_no_conciliados=False)
-
-    diferencia = (saldo_banco - saldo_libros).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
-
-    return {
-        "fecha_conciliacion": str(f),
-        "saldo_banco": str(saldo_banco),
-        "saldo_libros_total": str(saldo_libros),
-        "saldo_no_conciliado_hasta_fecha": str(saldo_no_conc),
-        "diferencia_proyectada": str(diferencia),
-    }
+    session.exec(upd, params={"id": id_cuenta, "hasta": f})
 
-
-#--------------------------------------------------------------------------------
+    c = ConciliacionBancaria(
+        id_cuenta_bancaria=id_cuenta,
+        fecha_conciliacion=f,
+        saldo_libros=saldo_libros,
+        saldo_banco=saldo_banco,
+        diferencia=diferencia,
+        observaciones=observaciones
+    )
+    session.add(c)
+    session.flush()
+    return c.id_conciliacion
 
 
 def crear_conciliacion(session: Session, id_cuenta: int, fecha_conciliacion: date | None,
@@ -169,56 +109,145 @@ def crear_conciliacion(session: Session, id_cuenta: int, fecha_conciliacion: dat
     verificar_cuenta_activa(session, id_cuenta)
     
     f = fecha_conciliacion or date.today()
-    
-    saldo_libros = _calcular_saldo_movimientos(session, id_cuenta, f, solo_no_conciliados=False)
-    
-    # La diferencia se calcula entre el saldo del banco y el saldo total de libros
-    diferencia = (saldo_banco - saldo_libros).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
 
     #Marcar como conciliados y registrar conciliación en una sola transacción
-    with session.begin():
-      #Actualizar movimientos no conciliados
-        upd = text("""
-            UPDATE bancos.movimientos_bancarios
-            SET conciliado = true
-            WHERE id_cuenta_bancaria = :id
-              AND fecha::date <= :hasta
-              AND conciliado = false
-        """)
-        session.exec(upd, {"id": id_cuenta, "hasta": f})
-
-        c = ConciliacionBancaria(
-            id_cuenta_bancaria=id_cuenta,
-            fecha_conciliacion=f,
-            saldo_libros=saldo_libros,
-            saldo_banco=saldo_banco,
-            diferencia=diferencia,
-            observaciones=observaciones
-        )
-        session.add(c)
-        session.flush()
-        return c.id_conciliacion
+    with transaccion(session):
+        return _registrar_conciliacion(session, id_cuenta, f, saldo_banco, observaciones)
     
 
-def listar_conciliaciones(session: Session, id_cuenta: int, desde: date | None, hasta: date | None, limit: int):
-    verificar_cuenta_activa(session, id_cuenta)
-    sql = """
+def conciliar_lote(items: List[ConciliacionLoteItem], bandera: bool = False, max_workers: int | None = None,
+                   al_avanzar: Callable[[int, int], None] | None = None) -> dict:
+    """
+    Concilia varias cuentas en paralelo. Cada cuenta corre en su propia sesión y transacción,
+    así un error en una no revierte las demás. Devuelve el reporte combinado con tiempos.
+    `al_avanzar(hechas, total)` se llama al terminar cada cuenta (lo usa la cola de trabajos).
+    """
+    inicio = perf_counter()
+    avance = {"hechas": 0}
+    candado = Lock()
+    # cada hilo ocupa una conexión del mismo pool que la API: el cliente puede pedir menos hilos
+    # que CONCILIACION_WORKERS pero no más, y nunca más de la mitad del pool para que las demás
+    # peticiones sigan teniendo conexión mientras corre el lote
+    tope = min(settings.CONCILIACION_WORKERS, max(1, conexiones_maximas() // 2))
+    workers = max(1, min(max_workers or tope, tope, len(items)))
+
+    # una sola consulta para validar todas las cuentas del lote
+    ids = sorted({i.id_cuenta_bancaria for i in items})
+    with Session(engine) as session:
+        estados = dict(session.exec(
+            text("""
+                SELECT id_cuenta_bancaria, estado
+                FROM bancos.cuentas_bancarias
+                WHERE id_cuenta_bancaria = ANY(:ids)
+            """),
+            params={"ids": ids},
+        ).all())
+
+    def _procesar(item: ConciliacionLoteItem) -> dict:
+        t0 = perf_counter()
+        f = item.fecha_conciliacion or date.today()
+        res = {"id_cuenta_bancaria": item.id_cuenta_bancaria, "fecha_conciliacion": str(f), "ok": False}
+        estado = estados.get(item.id_cuenta_bancaria)
+        try:
+            if estado is None:
+                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Cuenta bancaria no existe")
+            if estado != "ACTIVA":
+                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Cuenta bancaria no está activa")
+
+            with Session(engine) as s, s.begin():
+                # bloquea la cuenta para que dos entradas de la misma cuenta no se crucen
+                s.exec(
+                    text("SELECT 1 FROM bancos.cuentas_bancarias WHERE id_cuenta_bancaria = :id FOR UPDATE"),
+                    params={"id": item.id_cuenta_bancaria},
+                )
+                if bandera:
+                    res.update(_calcular_seguimiento(s, item.id_cuenta_bancaria, f, item.saldo_banco))
+                else:
+                    res["id_conciliacion"] = _registrar_conciliacion(
+                        s, item.id_cuenta_bancaria, f, item.saldo_banco, item.observaciones
+                    )
+            res["ok"] = True
+        except HTTPException as e:
+            res["error"] = e.detail
+        except Exception as e:
+            res["error"] = f"Error al conciliar: {e}"
+        res["duracion_ms"] = round((perf_counter() - t0) * 1000, 2)
+        if al_avanzar:
+            with candado:
+                avance["hechas"] += 1
+                hechas = avance["hechas"]
+            al_avanzar(hechas, len(items))
+        return res
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        resultados = list(pool.map(_procesar, items))
+
+    exitosas = sum(1 for r in resultados if r["ok"])
+    return {
+        "bandera": bandera,
+        "total": len(resultados),
+        "exitosas": exitosas,
+        "fallidas": len(resultados) - exitosas,
+        "workers": workers,
+        "duracion_ms": round((perf_counter() - inicio) * 1000, 2),
+        "resultados": resultados,
+    }
+
+
+_CONCILIACIONES = ConsultaDinamica(
+    "listar_conciliaciones",
+    """
       SELECT id_conciliacion, id_cuenta_bancaria, fecha_conciliacion,
              saldo_libros, saldo_banco, diferencia, observaciones
       FROM bancos.conciliaciones_bancarias
-      WHERE id_cuenta_bancaria = :id
-    """
-    params = {"id": id_cuenta, "limit": limit}
-    if desde:
-        sql += " AND fecha_conciliacion >= :desde"
-        params["desde"] = desde
-    if hasta:
-        sql += " AND fecha_conciliacion <= :hasta"
-        params["hasta"] = hasta
-    sql += " ORDER BY fecha_conciliacion DESC LIMIT :limit"
-
-    rows = session.exec(text(sql), params).all()
-    return [dict(r._mapping) for r in rows]
+      {where}
+      ORDER BY fecha_conciliacion DESC LIMIT :limit
+    """,
+    filtros={"desde": "fecha_conciliacion >= :desde", "hasta": "fecha_conciliacion <= :hasta"},
+    fijos=["id_cuenta_bancaria = :id"],
+)
+
+
+def listar_conciliaciones(session: Session, id_cuenta: int, desde: date | None, hasta: date | None, limit: int):
+    verificar_cuenta_activa(session, id_cuenta)
+    return _CONCILIACIONES.ejecutar(session, {
+        "desde": {"desde": desde} if desde else None,
+        "hasta": {"hasta": hasta} if hasta else None,
+    }, id=id_cuenta, limit=limit)
+
+# partidas pendientes: movimientos en libros no conciliados (sin cheques, que van aparte)
+_PARTIDAS_MOVIMIENTOS = text("""
+    SELECT 
+        id_movimiento AS id,
+        fecha,
+        tipo_mov,
+        monto,
+        descripcion
+    FROM bancos.movimientos_bancarios
+    WHERE 
+        id_cuenta_bancaria = :id_cuenta
+        AND fecha::date <= :hasta
+        AND conciliado = FALSE
+        AND tipo_mov NOT IN ('CHEQUE_EMITIDO', 'CHEQUE_COBRADO')
+    ORDER BY fecha
+""")
+
+# cheques emitidos y no cobrados (pendientes de presentación al banco)
+_PARTIDAS_CHEQUES = text("""
+    SELECT 
+        id_cheque AS id,
+        fecha_emision AS fecha,
+        'CHEQUE_EMITIDO' AS tipo_mov,
+        monto,
+        beneficiario AS descripcion
+    FROM bancos.cheques
+    WHERE 
+        id_cuenta_bancaria = :id_cuenta
+        AND fecha_emision <= :hasta
+        AND estado = 'EMITIDO' 
+    ORDER BY fecha_emision
+""")
+
 
 def listar_partidas_pendientes(session: Session, id_cuenta: int, hasta: date) -> Dict[str, List[Dict[str, Union[int, str, Decimal]]]]:
     
@@ -251,52 +280,32 @@ def listar_partidas_pendientes(session: Session, id_cuenta: int, hasta: date) ->
     # Excluye CHEQUE_EMITIDO, ya que se maneja por separado en la tabla Cheque.
     # Se busca cualquier movimiento en la cuenta, antes o en la fecha límite, que NO esté conciliado.
     
-    #Movimientos en Libros No Conciliados (Excluye Cheques)
-    sql_movimientos = text("""
-        SELECT 
-            id_movimiento AS id,
-            fecha,
-            tipo_mov,
-            monto,
-            descripcion
-        FROM bancos.movimientos_bancarios
-        WHERE 
-            id_cuenta_bancaria = :id_cuenta
-            AND fecha::date <= :hasta
-            AND conciliado = FALSE
-            AND tipo_mov NOT IN ('CHEQUE_EMITIDO', 'CHEQUE_COBRADO')
-        ORDER BY fecha
-    """)
-    
     movimientos_pendientes = session.exec(
-        sql_movimientos, 
-        {"id_cuenta": id_cuenta, "hasta": hasta}
+        _PARTIDAS_MOVIMIENTOS, 
+        params={"id_cuenta": id_cuenta, "hasta": hasta}
     ).all()
 
     # 2. Cheques Emitidos y No Cobrados (Pendientes de Presentación al Banco)
     # Estos son un caso especial de "retiro" que aún no impacta el banco.
-    sql_cheques = text("""
-        SELECT 
-            id_cheque AS id,
-            fecha_emision AS fecha,
-            'CHEQUE_EMITIDO' AS tipo_mov,
-            monto,
-            beneficiario AS descripcion
-        FROM bancos.cheques
-        WHERE 
-            id_cuenta_bancaria = :id_cuenta
-            AND fecha_emision <= :hasta
-            AND estado = 'EMITIDO' 
-        ORDER BY fecha_emision
-    """)
-    
     cheques_pendientes = session.exec(
-        sql_cheques, 
-        {"id_cuenta": id_cuenta, "hasta": hasta}
+        _PARTIDAS_CHEQUES, 
+        params={"id_cuenta": id_cuenta, "hasta": hasta}
     ).all()
 
     return {
         "movimientos_pendientes": [dict(r._mapping) for r in movimientos_pendientes],
         "cheques_pendientes": [dict(r._mapping) for r in cheques_pendientes],
     }
+
+
+def iterar_partidas_pendientes(session: Session, id_cuenta: int, hasta: date, lote: int = 1000) -> Iterator[dict]:
+    """
+    Las mismas partidas que listar_partidas_pendientes, una por una y con cursor del servidor
+    (para NDJSON): primero los movimientos y después los cheques, cada una con `partida`.
+    La cuenta se valida antes de empezar a responder.
+    """
+    params = {"id_cuenta": id_cuenta, "hasta": hasta}
+    for partida, sentencia in (("movimiento", _PARTIDAS_MOVIMIENTOS), ("cheque", _PARTIDAS_CHEQUES)):
+        for fila in session.execute(sentencia, params, execution_options={"yield_per": lote}):
+            yield {"partida": partida, **fila._mapping}
     
@@ -0,0 +1,186 @@
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from typing import Callable, Optional
+
+from fastapi import HTTPException, status
+from sqlalchemy import text
+from sqlmodel import Session
+
+from connection.data.db import settings, transaccion
+from function.fbancos import verificar_cuenta_activa
+
+# Histórico de movimientos. Lo conciliado antes del último cierre de cada cuenta ya no cambia:
+# se mueve a movimientos_historico (sin los índices de escritura de movimientos_bancarios) y su
+# suma queda en saldos_arrastre. saldos_cuenta no cambia (el trigger ignora el borrado del
+# archivado), la conciliación suma el arrastre y el extracto y la búsqueda leen el histórico
+# cuando el rango lo toca. Los CHEQUE_EMITIDO de cheques aún EMITIDOS no se archivan: cobrar o
+# anular el cheque tiene que encontrar su movimiento.
+
+_ARCHIVAR = text("""
+    WITH sel AS (
+        SELECT m.id_movimiento
+        FROM bancos.movimientos_bancarios m
+        WHERE m.id_cuenta_bancaria = :cuenta
+          AND m.fecha < :limite
+          AND m.conciliado
+          AND NOT (m.tipo_mov = 'CHEQUE_EMITIDO' AND EXISTS (
+                SELECT 1 FROM bancos.cheques ch
+                WHERE ch.id_cheque::text = m.referencia_externa AND ch.estado = 'EMITIDO'))
+        ORDER BY m.fecha, m.id_movimiento
+        LIMIT :lote
+        FOR UPDATE SKIP LOCKED
+    ), borrados AS (
+        DELETE FROM bancos.movimientos_bancarios m
+        USING sel
+        WHERE m.id_movimiento = sel.id_movimiento
+        RETURNING m.*
+    ), copiados AS (
+        INSERT INTO bancos.movimientos_historico
+            (id_movimiento, id_cuenta_bancaria, fecha, tipo_mov, monto, referencia, descripcion,
+             referencia_externa, transferencia_id, usuario_registro, usuario_registro_rol, conciliado)
+        SELECT id_movimiento, id_cuenta_bancaria, fecha, tipo_mov, monto, referencia, descripcion,
+               referencia_externa, transferencia_id, usuario_registro, usuario_registro_rol, conciliado
+        FROM borrados
+        ORDER BY fecha, id_movimiento
+        RETURNING 1
+    ), arrastre AS (
+        INSERT INTO bancos.saldos_arrastre AS a (id_cuenta_bancaria, saldo, hasta, movimientos, actualizado_en)
+        SELECT :cuenta, COALESCE(SUM(bancos.fn_importe(tipo_mov, monto)), 0), CAST(:corte AS date),
+               COUNT(*), CURRENT_TIMESTAMP
+        FROM borrados
+        ON CONFLICT (id_cuenta_bancaria) DO UPDATE
+        SET saldo = a.saldo + EXCLUDED.saldo,
+            hasta = GREATEST(a.hasta, EXCLUDED.hasta),
+            movimientos = a.movimientos + EXCLUDED.movimientos,
+            actualizado_en = EXCLUDED.actualizado_en
+        RETURNING 1
+    )
+    SELECT (SELECT COUNT(*) FROM copiados) AS movidos
+""")
+
+
+def archivar_movimientos(session: Session, id_cuenta: Optional[int] = None, hasta: Optional[date] = None,
+                         lote: Optional[int] = None, al_avanzar: Optional[Callable[[int, int], None]] = None) -> dict:
+    """
+    Archiva por cuenta los movimientos conciliados con fecha <= último cierre (o `hasta`, si es
+    anterior). Va en transacciones de `lote` filas para no bloquear la cuenta mucho tiempo.
+    El espacio de los índices lo recupera autovacuum después.
+    """
+    lote = lote or settings.HISTORICO_LOTE
+    filtro = "WHERE id_cuenta_bancaria = :cuenta" if id_cuenta is not None else ""
+    cierres = session.exec(text(f"""
+        SELECT id_cuenta_bancaria, MAX(fecha_conciliacion) AS cierre
+        FROM bancos.conciliaciones_bancarias
+        {filtro}
+        GROUP BY id_cuenta_bancaria
+        ORDER BY id_cuenta_bancaria
+    """), params={"cuenta": id_cuenta}).all()
+
+    detalle = []
+    for n, c in enumerate(cierres, start=1):
+        corte = min(c.cierre, hasta) if hasta else c.cierre
+        limite = datetime.combine(corte + timedelta(days=1), time.min)
+        movidos = 0
+        while True:
+            with transaccion(session):
+                session.exec(text("SELECT set_config('bancos.archivando', '1', true)"))
+                cantidad = session.exec(_ARCHIVAR, params={
+                    "cuenta": c.id_cuenta_bancaria, "limite": limite, "corte": corte, "lote": lote,
+                }).scalar_one()
+            movidos += cantidad
+            if cantidad < lote:
+                break
+        detalle.append({"id_cuenta_bancaria": c.id_cuenta_bancaria, "hasta": str(corte), "archivados": movidos})
+        if al_avanzar:
+            al_avanzar(n, len(cierres))
+
+    return {"cuentas": len(detalle), "archivados": sum(d["archivados"] for d in detalle), "detalle": detalle}
+
+
+def arrastre_cuenta(session: Session, id_cuenta: int) -> tuple[Decimal, Optional[date]]:
+    """ (saldo archivado, fecha hasta la que se archivó) o (0, None) si la cuenta no tiene histórico """
+    fila = session.exec(
+        text("SELECT saldo, hasta FROM bancos.saldos_arrastre WHERE id_cuenta_bancaria = :c"),
+        params={"c": id_cuenta},
+    ).first()
+    return (fila.saldo, fila.hasta) if fila else (Decimal("0.00"), None)
+
+
+# movimientos después de la posición (fecha, id) -> el saldo antes de la página es el saldo
+# actual menos todo lo posterior, en la misma sentencia (mismo snapshot que saldos_cuenta)
+_EXTRACTO = """
+    WITH m AS (
+        SELECT id_movimiento, fecha, tipo_mov, monto, referencia, descripcion, referencia_externa,
+               usuario_registro, usuario_registro_rol, conciliado, 'vivo' AS origen
+        FROM bancos.movimientos_bancarios
+        WHERE id_cuenta_bancaria = :cuenta AND (fecha, id_movimiento) > (:pos_fecha, :pos_id)
+        {historico}
+    ), pagina AS (
+        SELECT * FROM m
+        WHERE fecha < :fin
+        ORDER BY fecha, id_movimiento
+        LIMIT :limite
+    ), inicial AS (
+        SELECT COALESCE((SELECT saldo FROM bancos.saldos_cuenta WHERE id_cuenta_bancaria = :cuenta), 0)
+             - COALESCE((SELECT SUM(bancos.fn_importe(tipo_mov, monto)) FROM m), 0) AS saldo_inicial
+    )
+    SELECT i.saldo_inicial, p.id_movimiento, p.fecha, p.tipo_mov, p.monto,
+           bancos.fn_importe(p.tipo_mov, p.monto) AS importe,
+           i.saldo_inicial + SUM(bancos.fn_importe(p.tipo_mov, p.monto))
+               OVER (ORDER BY p.fecha, p.id_movimiento) AS saldo,
+           p.referencia, p.descripcion, p.referencia_externa, p.usuario_registro, p.usuario_registro_rol,
+           p.conciliado, p.origen
+    FROM inicial i
+    LEFT JOIN pagina p ON true
+    ORDER BY p.fecha, p.id_movimiento
+"""
+_EXTRACTO_VIVO = text(_EXTRACTO.format(historico=""))
+_EXTRACTO_CON_HISTORICO = text(_EXTRACTO.format(historico="""
+        UNION ALL
+        SELECT id_movimiento, fecha, tipo_mov, monto, referencia, descripcion, referencia_externa,
+               usuario_registro, usuario_registro_rol, conciliado, 'historico' AS origen
+        FROM bancos.movimientos_historico
+        WHERE id_cuenta_bancaria = :cuenta AND (fecha, id_movimiento) > (:pos_fecha, :pos_id)
+"""))
+
+
+def extracto_cuenta(session: Session, id_cuenta: int, desde: date, hasta: Optional[date] = None, limite: int = 200,
+                    despues_fecha: Optional[datetime] = None, despues_id: Optional[int] = None) -> dict:
+    """
+    Movimientos de la cuenta en [desde, hasta] con saldo corrido, del más antiguo al más
+    reciente. Si el rango toca lo archivado se lee también del histórico. Página siguiente:
+    `despues_fecha` y `despues_id` de `siguiente`.
+    """
+    verificar_cuenta_activa(session, id_cuenta)
+    hasta = hasta or date.today()
+    if hasta < desde:
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, "hasta debe ser mayor o igual que desde")
+    _, archivado_hasta = arrastre_cuenta(session, id_cuenta)
+    if despues_fecha is not None and despues_id is not None:
+        pos_fecha, pos_id = despues_fecha, despues_id
+    else:
+        pos_fecha, pos_id = datetime.combine(desde, time.min), 0
+    con_historico = archivado_hasta is not None and pos_fecha.date() <= archivado_hasta
+
+    filas = session.exec(_EXTRACTO_CON_HISTORICO if con_historico else _EXTRACTO_VIVO, params={
+        "cuenta": id_cuenta, "pos_fecha": pos_fecha, "pos_id": pos_id,
+        "fin": datetime.combine(hasta + timedelta(days=1), time.min), "limite": limite,
+    }).all()
+    saldo_inicial = filas[0].saldo_inicial
+    movimientos = [
+        {k: v for k, v in f._mapping.items() if k != "saldo_inicial"}
+        for f in filas if f.id_movimiento is not None
+    ]
+    siguiente = None
+    if len(movimientos) == limite:
+        siguiente = {"despues_fecha": movimientos[-1]["fecha"], "despues_id": movimientos[-1]["id_movimiento"]}
+    return {
+        "id_cuenta_bancaria": id_cuenta,
+        "desde": str(desde),
+        "hasta": str(hasta),
+        "saldo_inicial": str(saldo_inicial),
+        "saldo_final": str(movimientos[-1]["saldo"] if movimientos else saldo_inicial),
+        "incluye_historico": con_historico,
+        "movimientos": movimientos,
+        "siguiente": siguiente,
+    }
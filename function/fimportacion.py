@@ -0,0 +1,259 @@
+import csv
+import io
+import json
+import time
+from typing import IO, Iterator
+
+from fastapi import HTTPException, status
+from sqlalchemy import text
+from sqlmodel import Session
+
+from connection.data.db import settings, transaccion
+from function.fcache import cache_reportes
+
+# Importación masiva de facturas de compra (CSV, NDJSON o arreglo JSON). En Python solo se
+# parte el archivo en campos de texto; las filas van con COPY a una tabla temporal de texto
+# (ON COMMIT DROP) y todo lo demás es por conjuntos en la BD, en la misma transacción:
+#   1) una sola sentencia marca cada fila con su motivo de rechazo: formato de cada campo
+#      (pg_input_is_valid), proveedor y moneda (un join a cada tabla), factura ya existente
+#      (un join por la UNIQUE proveedor_id + numero_factura), reglas de la tabla y repetidas
+#      dentro del archivo (queda la primera válida)
+#   2) INSERT ... SELECT de las válidas con ON CONFLICT DO NOTHING; las que pierden contra una
+#      carga concurrente quedan como DUPLICADA
+# En vez de, por factura, el get del proveedor + SELECT de unicidad + INSERT + refresh de
+# crear_factura.
+
+CAMPOS = ("proveedor_id", "numero_factura", "fecha_emision", "fecha_vencimiento", "moneda_id",
+          "monto_total", "descuento_pronto_pago", "fecha_limite_descuento")
+OBLIGATORIOS = ("proveedor_id", "numero_factura", "moneda_id", "monto_total")
+
+_STAGING = text("""
+    CREATE TEMP TABLE facturas_importacion (
+      fila                   INTEGER NOT NULL,
+      proveedor_id           TEXT,
+      numero_factura         TEXT,
+      fecha_emision          TEXT,
+      fecha_vencimiento      TEXT,
+      moneda_id              TEXT,
+      monto_total            TEXT,
+      descuento_pronto_pago  TEXT,
+      fecha_limite_descuento TEXT,
+      motivo                 TEXT,
+      campo                  TEXT
+    ) ON COMMIT DROP
+""")
+
+_COPY = f"COPY facturas_importacion (fila, {', '.join(CAMPOS)}) FROM STDIN"
+
+# campo -> tipo con el que se valida y se castea
+_TIPOS = {
+    "proveedor_id": "bigint",
+    "fecha_emision": "date",
+    "fecha_vencimiento": "date",
+    "moneda_id": "integer",
+    "monto_total": "numeric(18,2)",
+    "descuento_pronto_pago": "numeric(5,2)",
+    "fecha_limite_descuento": "date",
+}
+
+
+def _formato() -> str:
+    # primer campo obligatorio vacío o con formato inválido, en el orden de CAMPOS
+    casos = []
+    for c in CAMPOS:
+        if c in OBLIGATORIOS:
+            casos.append(f"WHEN s.{c} IS NULL THEN '{c}'")
+        if c in _TIPOS:
+            casos.append(f"WHEN NOT pg_input_is_valid(s.{c}, '{_TIPOS[c]}') THEN '{c}'")
+        elif c == "numero_factura":
+            casos.append("WHEN length(btrim(s.numero_factura)) NOT BETWEEN 1 AND 40 THEN 'numero_factura'")
+    return "CASE " + " ".join(casos) + " END"
+
+
+def _tipado(c: str) -> str:
+    # el cast solo se evalúa si el texto es válido para el tipo
+    return f"CASE WHEN pg_input_is_valid(s.{c}, '{_TIPOS[c]}') THEN CAST(s.{c} AS {_TIPOS[c]}) END AS {c}"
+
+
+_VALIDAR = text(f"""
+    UPDATE facturas_importacion s
+    SET motivo = v.motivo, campo = v.campo
+    FROM (
+        SELECT fila, campo,
+               COALESCE(motivo, CASE WHEN row_number() OVER (
+                                          PARTITION BY proveedor_id, numero_factura, motivo IS NULL
+                                          ORDER BY fila) > 1
+                                     THEN 'DUPLICADA_EN_ARCHIVO' END) AS motivo
+        FROM (
+            SELECT t.fila, t.proveedor_id, t.numero_factura, t.campo,
+                   CASE WHEN t.campo IS NOT NULL THEN 'CAMPO_INVALIDO'
+                        WHEN p.proveedor_id IS NULL THEN 'PROVEEDOR_NO_EXISTE'
+                        WHEN m.id_tipo_moneda IS NULL THEN 'MONEDA_NO_EXISTE'
+                        WHEN t.monto_total < 0 THEN 'MONTO_NEGATIVO'
+                        WHEN t.fecha_vencimiento < COALESCE(t.fecha_emision, CURRENT_DATE) THEN 'VENCE_ANTES_DE_EMITIRSE'
+                        WHEN t.descuento_pronto_pago < 0 OR t.descuento_pronto_pago >= 100 THEN 'DESCUENTO_INVALIDO'
+                        WHEN f.factura_id IS NOT NULL THEN 'DUPLICADA'
+                   END AS motivo
+            FROM (
+                SELECT s.fila, {_formato()} AS campo, btrim(s.numero_factura) AS numero_factura,
+                       {', '.join(_tipado(c) for c in _TIPOS)}
+                FROM facturas_importacion s
+            ) t
+            LEFT JOIN bancos.proveedores p ON p.proveedor_id = t.proveedor_id
+            LEFT JOIN bancos.tipos_moneda m ON m.id_tipo_moneda = t.moneda_id
+            LEFT JOIN bancos.facturas_compra f
+              ON f.proveedor_id = t.proveedor_id AND f.numero_factura = t.numero_factura
+        ) x
+    ) v
+    WHERE s.fila = v.fila AND v.motivo IS NOT NULL
+""")
+
+_INSERTAR = text("""
+    WITH ins AS (
+        INSERT INTO bancos.facturas_compra
+            (proveedor_id, numero_factura, fecha_emision, fecha_vencimiento, moneda_id, monto_total,
+             saldo_pendiente, estado, descuento_pronto_pago, fecha_limite_descuento)
+        SELECT CAST(proveedor_id AS bigint), btrim(numero_factura),
+               COALESCE(CAST(fecha_emision AS date), CURRENT_DATE), CAST(fecha_vencimiento AS date),
+               CAST(moneda_id AS integer), CAST(monto_total AS numeric(18,2)), CAST(monto_total AS numeric(18,2)),
+               'PENDIENTE', COALESCE(CAST(descuento_pronto_pago AS numeric(5,2)), 0),
+               CAST(fecha_limite_descuento AS date)
+        FROM facturas_importacion
+        WHERE motivo IS NULL
+        ON CONFLICT (proveedor_id, numero_factura) DO NOTHING
+        RETURNING proveedor_id, numero_factura
+    ),
+    carrera AS (
+        UPDATE facturas_importacion s
+        SET motivo = 'DUPLICADA'
+        -- solo si alguna no entró: sin carreras no se hace el anti join
+        WHERE (SELECT COUNT(*) FROM ins) < (SELECT COUNT(*) FROM facturas_importacion WHERE motivo IS NULL)
+          AND s.motivo IS NULL
+          AND NOT EXISTS (SELECT 1 FROM ins
+                          WHERE ins.proveedor_id = CAST(s.proveedor_id AS bigint)
+                            AND ins.numero_factura = btrim(s.numero_factura))
+        RETURNING 1
+    )
+    SELECT (SELECT COUNT(*) FROM ins) AS insertadas, (SELECT COUNT(*) FROM carrera) AS carrera
+""")
+
+_RECHAZADAS = text("""
+    SELECT fila, motivo, campo, proveedor_id, numero_factura
+    FROM facturas_importacion
+    WHERE motivo IS NOT NULL
+    ORDER BY fila
+""")
+
+
+#---------------- lectura del archivo ----------------
+
+def _valor(v) -> str | None:
+    if v is None:
+        return None
+    v = str(v).strip()
+    return v or None
+
+
+def _desde_csv(archivo: IO[bytes], errores: list[dict]) -> Iterator[tuple]:
+    lector = csv.reader(io.TextIOWrapper(archivo, encoding="utf-8-sig", newline=""))
+    encabezado = [c.strip() for c in next(lector, [])]
+    desconocidos = set(encabezado) - set(CAMPOS)
+    faltan = set(OBLIGATORIOS) - set(encabezado)
+    if desconocidos or faltan:
+        raise HTTPException(status.HTTP_400_BAD_REQUEST,
+                            f"Encabezado inválido (desconocidas: {', '.join(sorted(desconocidos)) or '-'}; "
+                            f"faltan: {', '.join(sorted(faltan)) or '-'}). Columnas: {', '.join(CAMPOS)}")
+    posiciones = [encabezado.index(c) if c in encabezado else None for c in CAMPOS]
+    for campos in lector:
+        if not campos:
+            continue
+        if len(campos) != len(encabezado):
+            errores.append({"fila": lector.line_num, "motivo": "LINEA_INVALIDA",
+                            "detalle": f"{len(campos)} columnas, se esperaban {len(encabezado)}"})
+            continue
+        yield (lector.line_num, *(_valor(campos[i]) if i is not None else None for i in posiciones))
+
+
+def _desde_objetos(objetos: Iterator[tuple[int, object]], errores: list[dict]) -> Iterator[tuple]:
+    for fila, obj in objetos:
+        if not isinstance(obj, dict):
+            errores.append({"fila": fila, "motivo": "LINEA_INVALIDA", "detalle": "se esperaba un objeto"})
+            continue
+        yield (fila, *(_valor(obj.get(c)) for c in CAMPOS))
+
+
+def _desde_ndjson(archivo: IO[bytes], errores: list[dict]) -> Iterator[tuple]:
+    def objetos():
+        for n, linea in enumerate(archivo, start=1):
+            if not linea.strip():
+                continue
+            try:
+                yield n, json.loads(linea)
+            except ValueError as e:
+                errores.append({"fila": n, "motivo": "LINEA_INVALIDA", "detalle": str(e)})
+    return _desde_objetos(objetos(), errores)
+
+
+def _desde_json(archivo: IO[bytes], errores: list[dict]) -> Iterator[tuple]:
+    try:
+        datos = json.load(archivo)
+    except ValueError as e:
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, f"JSON inválido: {e}")
+    if isinstance(datos, dict):
+        datos = datos.get("items")
+    if not isinstance(datos, list):
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, 'Se esperaba un arreglo de facturas o {"items": [...]}')
+    return _desde_objetos(enumerate(datos, start=1), errores)
+
+
+_LECTORES = {"csv": _desde_csv, "ndjson": _desde_ndjson, "json": _desde_json}
+
+
+#---------------- importación ----------------
+
+def importar_facturas(session: Session, archivo: IO[bytes], formato: str, bandera: bool = False) -> dict:
+    """
+    Importa facturas desde `archivo` (binario, posicionado al inicio). `formato`: csv (con
+    encabezado), ndjson o json. `fila` en los rechazos es la línea del archivo (csv/ndjson) o la
+    posición en el arreglo (json). Con bandera=True solo valida: no inserta nada.
+    """
+    if formato not in _LECTORES:
+        raise HTTPException(status.HTTP_415_UNSUPPORTED_MEDIA_TYPE, f"Formatos: {', '.join(_LECTORES)}")
+    inicio = time.perf_counter()
+    errores: list[dict] = []
+    filas = _LECTORES[formato](archivo, errores)
+
+    with transaccion(session):
+        # los sorts de la validación (repetidas en el archivo) y del anti join no bajan a disco
+        session.exec(text("SELECT set_config('work_mem', :wm, true)"), params={"wm": settings.IMPORTACION_WORK_MEM})
+        session.exec(_STAGING)
+        # COPY en la misma conexión (y transacción) de la sesión
+        with session.connection().connection.driver_connection.cursor() as cur:
+            with cur.copy(_COPY) as copia:
+                for fila in filas:
+                    copia.write_row(fila)
+            recibidas = cur.execute("SELECT COUNT(*) FROM facturas_importacion").fetchone()[0]
+            # tabla temporal: autovacuum no la analiza y sin estadísticas los joins salen mal
+            cur.execute("ANALYZE facturas_importacion")
+        session.exec(_VALIDAR)
+        insertadas = 0
+        if not bandera:
+            insertadas = session.exec(_INSERTAR).one().insertadas
+        # con bandera no se escribió nada fuera de la tabla temporal, que se borra en el commit
+        rechazadas = [dict(f._mapping) for f in session.exec(_RECHAZADAS)]
+
+    if insertadas:
+        cache_reportes.invalidar("facturas_compra")
+    rechazadas = sorted(errores + rechazadas, key=lambda r: r["fila"])
+    segundos = time.perf_counter() - inicio
+    total = recibidas + len(errores)
+    return {
+        "recibidas": total,
+        "validas": recibidas - (len(rechazadas) - len(errores)),
+        "insertadas": insertadas,
+        "rechazadas": len(rechazadas),
+        "bandera": bandera,
+        "segundos": round(segundos, 3),
+        "filas_por_segundo": round(total / segundos) if total else 0,
+        "detalle_rechazadas": rechazadas,
+    }
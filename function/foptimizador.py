@@ -0,0 +1,197 @@
+from datetime import date
+from decimal import Decimal
+from time import perf_counter
+from typing import Optional
+
+import numpy as np
+from fastapi import HTTPException, status
+from sqlalchemy import text
+from sqlmodel import Session
+
+from connection.data.db import settings
+from connection.models.modelos import OptimizarPagos
+from function.fbancos import verificar_cuenta_activa, obtener_saldo
+from function.ftesoreria import texto_centavos
+
+# Selección de facturas a pagar con un monto limitado (mochila 0/1).
+# 1) greedy por densidad valor/monto, vectorizado (argsort + cumsum) -> índice de corte b
+# 2) las facturas muy por encima del corte quedan adentro y las muy por debajo afuera; las
+#    OPTIMIZADOR_NUCLEO alrededor de b se resuelven exacto con DP sobre la capacidad restante
+#    (en unidades de OPTIMIZADOR_RESOLUCION; los montos se redondean hacia arriba, así que
+#    lo que elige la DP siempre cabe)
+# 3) se completa con las que aún quepan y se queda con la mejor entre greedy y núcleo+DP
+
+
+def _candidatas(session: Session, dto: OptimizarPagos, id_moneda: int):
+    filtros, params = [
+        "fc.estado IN ('PENDIENTE','PARCIAL')",
+        "fc.saldo_pendiente > 0",
+        "fc.moneda_id = :moneda",
+    ], {"moneda": id_moneda}
+    if dto.vencen_hasta is not None:
+        filtros.append("(fc.fecha_vencimiento IS NULL OR fc.fecha_vencimiento <= :hasta)")
+        params["hasta"] = dto.vencen_hasta
+    if dto.proveedor_ids:
+        filtros.append("fc.proveedor_id = ANY(CAST(:provs AS bigint[]))"); params["provs"] = dto.proveedor_ids
+    where_clause = " AND ".join(filtros)
+    # una fila con un arreglo por columna (centavos, días al vencimiento, % de descuento vigente,
+    # criticidad): pasar de ahí a numpy no recorre filas en Python
+    fila = session.exec(text(f"""
+        SELECT COALESCE(array_agg(fc.factura_id), '{{}}') AS ids,
+               COALESCE(array_agg(ROUND(fc.saldo_pendiente * 100)::bigint), '{{}}') AS centavos,
+               COALESCE(array_agg(COALESCE(fc.fecha_vencimiento - CURRENT_DATE, 0)), '{{}}') AS dias,
+               COALESCE(array_agg(CASE WHEN fc.descuento_pronto_pago > 0
+                         AND (fc.fecha_limite_descuento IS NULL OR fc.fecha_limite_descuento >= CURRENT_DATE)
+                    THEN fc.descuento_pronto_pago::float8 ELSE 0 END), '{{}}') AS descuento,
+               COALESCE(array_agg(pr.criticidad), '{{}}') AS criticidad
+        FROM bancos.facturas_compra fc
+        JOIN bancos.proveedores pr ON pr.proveedor_id = fc.proveedor_id
+        WHERE {where_clause} AND pr.activo
+    """), params=params).one()
+    return (np.array(fila.ids, dtype=np.int64), np.array(fila.centavos, dtype=np.int64),
+            np.array(fila.dias, dtype=np.float64), np.array(fila.descuento, dtype=np.float64),
+            np.array(fila.criticidad, dtype=np.float64))
+
+
+def _valores(dto: OptimizarPagos, centavos: np.ndarray, dias: np.ndarray, descuento: np.ndarray,
+             criticidad: np.ndarray) -> np.ndarray:
+    if dto.objetivo == "monto":
+        return centavos.astype(np.float64)
+    if dto.objetivo == "cantidad":
+        return np.ones(len(centavos), dtype=np.float64)
+    p = dto.pesos
+    # urgencia 0..2: decae con los días que faltan (semanas) y crece con los días vencidos (hasta 90)
+    urgencia = np.where(dias >= 0, 1.0 / (1.0 + dias / 7.0), 1.0 + np.minimum(-dias, 90) / 90.0)
+    ahorro = centavos * descuento / 100.0
+    return centavos * (1.0 + p.urgencia * urgencia + p.criticidad * (criticidad - 1) / 4.0) + p.descuento * ahorro
+
+
+def _rellenar(tomadas: np.ndarray, orden: np.ndarray, centavos: np.ndarray, restante: int, desde: int) -> int:
+    # completa en orden de densidad con lo que todavía cabe
+    for i in orden[desde:]:
+        if not tomadas[i] and centavos[i] <= restante:
+            tomadas[i] = True
+            restante -= int(centavos[i])
+            if restante == 0:
+                break
+    return restante
+
+
+def _dp_nucleo(pesos: np.ndarray, valores: np.ndarray, capacidad: int, resolucion: int) -> np.ndarray:
+    ''' mochila 0/1 exacta sobre el núcleo; devuelve máscara de elegidas '''
+    unidad = max(1, -(-capacidad // resolucion))
+    w = -(-pesos // unidad)            # hacia arriba: la solución escalada es factible en centavos
+    cap = capacidad // unidad
+    dp = np.zeros(cap + 1, dtype=np.float64)
+    tomar = np.zeros((len(w), cap + 1), dtype=bool)
+    for k in range(len(w)):
+        wk = int(w[k])
+        if wk > cap:
+            continue
+        candidato = dp[:cap + 1 - wk] + valores[k]
+        mejora = candidato > dp[wk:]
+        tomar[k, wk:] = mejora
+        dp[wk:] = np.where(mejora, candidato, dp[wk:])
+    elegidas = np.zeros(len(w), dtype=bool)
+    c = cap
+    for k in range(len(w) - 1, -1, -1):
+        if tomar[k, c]:
+            elegidas[k] = True
+            c -= int(w[k])
+    return elegidas
+
+
+def optimizar_pagos(session: Session, dto: OptimizarPagos) -> dict:
+    inicio = perf_counter()
+    verificar_cuenta_activa(session, dto.id_cuenta_bancaria)
+    id_moneda = session.exec(
+        text("SELECT id_tipo_moneda FROM bancos.cuentas_bancarias WHERE id_cuenta_bancaria = :c"),
+        params={"c": dto.id_cuenta_bancaria},
+    ).scalar()
+    saldo = obtener_saldo(session, dto.id_cuenta_bancaria)
+    disponible = saldo if dto.monto_disponible is None else dto.monto_disponible
+    if disponible > saldo:
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, f"El monto disponible excede el saldo de la cuenta ({saldo})")
+    # cuenta sobregirada: no hay con qué pagar (y la DP no admite capacidad negativa)
+    disponible = max(disponible, Decimal("0.00"))
+    presupuesto = int((disponible * 100).to_integral_value())
+    if presupuesto == 0:
+        return {"id_cuenta_bancaria": dto.id_cuenta_bancaria, "monto_disponible": str(disponible),
+                "candidatas": 0, "seleccionadas": [], "total_a_pagar": "0.00", "restante": "0.00"}
+
+    ids, centavos, dias, descuento, criticidad = _candidatas(session, dto, id_moneda)
+    n = len(ids)
+    if n == 0:
+        return {"id_cuenta_bancaria": dto.id_cuenta_bancaria, "monto_disponible": str(disponible),
+                "candidatas": 0, "seleccionadas": [], "total_a_pagar": "0.00", "restante": str(disponible)}
+
+    valores = _valores(dto, centavos, dias, descuento, criticidad)
+
+    # greedy: densidad descendente (a igual densidad, la más chica primero)
+    orden = np.lexsort((centavos, -(valores / centavos)))
+    acumulado = np.cumsum(centavos[orden])
+    corte = int(np.searchsorted(acumulado, presupuesto, side="right"))
+
+    greedy = np.zeros(n, dtype=bool)
+    greedy[orden[:corte]] = True
+    parcial: Optional[tuple[int, int]] = None
+    if dto.permitir_parcial and dto.objetivo != "cantidad":
+        # con pago parcial el greedy fraccionario es óptimo
+        restante = presupuesto - (int(acumulado[corte - 1]) if corte else 0)
+        if corte < n and restante > 0:
+            parcial = (int(orden[corte]), restante)
+        elegidas, algoritmo = greedy, "greedy_fraccionario"
+    else:
+        _rellenar(greedy, orden, centavos, presupuesto - (int(acumulado[corte - 1]) if corte else 0), corte)
+        elegidas, algoritmo = greedy, "greedy"
+        if corte < n:
+            mitad = settings.OPTIMIZADOR_NUCLEO // 2
+            lo, hi = max(0, corte - mitad), min(n, corte + mitad)
+            nucleo = orden[lo:hi]
+            fijas = int(acumulado[lo - 1]) if lo else 0
+            sel = _dp_nucleo(centavos[nucleo], valores[nucleo], presupuesto - fijas, settings.OPTIMIZADOR_RESOLUCION)
+            combinada = np.zeros(n, dtype=bool)
+            combinada[orden[:lo]] = True
+            combinada[nucleo[sel]] = True
+            _rellenar(combinada, orden, centavos, presupuesto - int(centavos[combinada].sum()), hi)
+            if valores[combinada].sum() > valores[greedy].sum():
+                elegidas, algoritmo = combinada, "greedy+dp"
+
+    idx = np.flatnonzero(elegidas)
+    total = int(centavos[idx].sum()) + (parcial[1] if parcial else 0)
+    detalle = _detalle_facturas(session, [int(i) for i in ids[idx]] + ([int(ids[parcial[0]])] if parcial else []))
+    seleccionadas = []
+    for i in idx:
+        seleccionadas.append({**detalle[int(ids[i])], "monto_a_pagar": texto_centavos(int(centavos[i])),
+                              "parcial": False, "valor": round(float(valores[i]), 2)})
+    if parcial:
+        i, monto = parcial
+        seleccionadas.append({**detalle[int(ids[i])], "monto_a_pagar": texto_centavos(monto),
+                              "parcial": True, "valor": round(float(valores[i] * monto / centavos[i]), 2)})
+    seleccionadas.sort(key=lambda f: (f["fecha_vencimiento"] is None, f["fecha_vencimiento"] or date.max, f["factura_id"]))
+
+    return {
+        "id_cuenta_bancaria": dto.id_cuenta_bancaria,
+        "monto_disponible": str(disponible),
+        "objetivo": dto.objetivo,
+        "algoritmo": algoritmo,
+        "candidatas": n,
+        "total_candidatas": texto_centavos(int(centavos.sum())),
+        "seleccionadas": seleccionadas,
+        "cantidad_seleccionadas": len(seleccionadas),
+        "total_a_pagar": texto_centavos(total),
+        "restante": texto_centavos(presupuesto - total),
+        "valor_objetivo": round(float(valores[idx].sum()) + (float(valores[parcial[0]] * parcial[1] / centavos[parcial[0]]) if parcial else 0.0), 2),
+        "duracion_ms": round((perf_counter() - inicio) * 1000, 1),
+    }
+
+
+def _detalle_facturas(session: Session, ids: list[int]) -> dict[int, dict]:
+    filas = session.exec(text("""
+        SELECT fc.factura_id, fc.numero_factura, fc.proveedor_id, pr.nombre AS proveedor, pr.criticidad,
+               fc.fecha_vencimiento, fc.saldo_pendiente, fc.descuento_pronto_pago, fc.fecha_limite_descuento
+        FROM bancos.facturas_compra fc
+        JOIN bancos.proveedores pr ON pr.proveedor_id = fc.proveedor_id
+        WHERE fc.factura_id = ANY(CAST(:ids AS bigint[]))
+    """), params={"ids": ids}).all()
+    return {r.factura_id: dict(r._mapping) for r in filas}
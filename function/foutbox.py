@@ -0,0 +1,194 @@
+import json
+import logging
+import os
+import time
+from typing import Any, Optional, Protocol
+
+import httpx
+from fastapi import HTTPException, status
+from sqlalchemy import text
+from sqlmodel import Session
+
+from connection.data.db import settings
+
+log = logging.getLogger("bancos.outbox")
+
+# Las transacciones que siguen abiertas tienen xid >= xmin del snapshot actual; todo lo que
+# está por debajo ya terminó, así que ningún evento nuevo puede aparecer detrás del cursor.
+_VISIBLES = "id_transaccion < pg_snapshot_xmin(pg_current_snapshot())"
+
+_COLUMNAS = "id_evento, id_transaccion::text AS id_transaccion, tipo, agregado, id_agregado, datos, creado_en"
+
+
+def _a_json(valor: Any) -> str:
+    return json.dumps(valor, default=str, ensure_ascii=False)
+
+
+#---------------- escritura (dentro de la transacción del llamador) ----------------
+
+def registrar_evento(session: Session, tipo: str, agregado: str, id_agregado: Any, datos: dict) -> None:
+    '''
+    Agrega el evento a la transacción abierta; se confirma o se descarta junto con el cambio.
+    No hace commit.
+    '''
+    session.exec(
+        text("""
+            INSERT INTO bancos.eventos_outbox (tipo, agregado, id_agregado, datos)
+            VALUES (:tipo, :agregado, :id, CAST(:datos AS jsonb))
+        """),
+        params={"tipo": tipo, "agregado": agregado, "id": str(id_agregado), "datos": _a_json(datos)},
+    )
+
+
+def registrar_eventos(session: Session, tipo: str, agregado: str, ids: list[Any], datos: list[dict]) -> None:
+    ''' versión en bloque para las operaciones masivas (un solo INSERT con unnest) '''
+    if not ids:
+        return
+    session.exec(
+        text("""
+            INSERT INTO bancos.eventos_outbox (tipo, agregado, id_agregado, datos)
+            SELECT :tipo, :agregado, x.id, x.datos
+            FROM unnest(CAST(:ids AS varchar[]), CAST(:datos AS jsonb[])) AS x(id, datos)
+        """),
+        params={"tipo": tipo, "agregado": agregado, "ids": [str(i) for i in ids],
+                "datos": [_a_json(d) for d in datos]},
+    )
+
+
+#---------------- feed para consumidores que hacen pull ----------------
+
+def _leer_cursor(cursor: Optional[str]) -> tuple[str, int]:
+    if not cursor:
+        return "0", 0
+    try:
+        xid, id_evento = cursor.split(".", 1)
+        if not xid.isdigit():
+            raise ValueError(xid)
+        return xid, int(id_evento)
+    except ValueError as e:
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, "Cursor de eventos inválido") from e
+
+
+def leer_eventos(session: Session, despues: Optional[str] = None, limite: int = 100,
+                 tipos: Optional[list[str]] = None) -> dict:
+    '''
+    Eventos confirmados después del cursor `despues` ("<transacción>.<id_evento>"), en orden de
+    commit por transacción. El cursor devuelto se pasa tal cual en la siguiente llamada.
+    '''
+    xid, id_evento = _leer_cursor(despues)
+    filtros, params = [_VISIBLES, "(id_transaccion, id_evento) > (CAST(CAST(:xid AS text) AS xid8), :id)"], \
+        {"xid": xid, "id": id_evento, "lim": limite}
+    if tipos:
+        filtros.append("tipo = ANY(CAST(:tipos AS varchar[]))"); params["tipos"] = tipos
+
+    where_clause = " AND ".join(filtros)
+    filas = session.exec(text(f"""
+        SELECT {_COLUMNAS}
+        FROM bancos.eventos_outbox
+        WHERE {where_clause}
+        ORDER BY id_transaccion, id_evento
+        LIMIT :lim
+    """), params=params).all()
+
+    eventos = [dict(r._mapping) for r in filas]
+    cursor = f"{eventos[-1]['id_transaccion']}.{eventos[-1]['id_evento']}" if eventos else (despues or "0.0")
+    return {"eventos": eventos, "cursor": cursor, "hay_mas": len(eventos) == limite}
+
+
+#---------------- relay ----------------
+
+class Sink(Protocol):
+    def publicar(self, eventos: list[dict]) -> None: ...
+
+
+class SinkWebhook:
+    ''' POST del lote como JSON; cualquier respuesta que no sea 2xx se reintenta en el siguiente ciclo '''
+
+    def __init__(self, url: str, timeout: float, reintentos: int):
+        if not url:
+            raise RuntimeError("OUTBOX_SINK=webhook requiere OUTBOX_WEBHOOK_URL")
+        self.url = url
+        self.reintentos = reintentos
+        self._cliente = httpx.Client(timeout=timeout)
+
+    def publicar(self, eventos: list[dict]) -> None:
+        cuerpo = _a_json({"eventos": eventos})
+        for intento in range(self.reintentos + 1):
+            try:
+                r = self._cliente.post(self.url, content=cuerpo,
+                                       headers={"Content-Type": "application/json",
+                                                "X-Outbox-Ultimo-Evento": str(eventos[-1]["id_evento"])})
+                r.raise_for_status()
+                return
+            except httpx.HTTPError:
+                if intento == self.reintentos:
+                    raise
+                time.sleep(0.5 * 2 ** intento)
+
+
+class SinkArchivo:
+    ''' NDJSON local; sustituto de una cola para desarrollo y pruebas '''
+
+    def __init__(self, ruta: str):
+        self.ruta = ruta
+
+    def publicar(self, eventos: list[dict]) -> None:
+        with open(self.ruta, "a", encoding="utf-8") as f:
+            for e in eventos:
+                f.write(_a_json(e) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+
+def crear_sink() -> Sink:
+    tipo = settings.OUTBOX_SINK
+    if tipo == "webhook":
+        return SinkWebhook(settings.OUTBOX_WEBHOOK_URL, settings.REQUEST_TIMEOUT, settings.RETRIES)
+    if tipo == "archivo":
+        return SinkArchivo(settings.OUTBOX_ARCHIVO)
+    raise RuntimeError(f"OUTBOX_SINK no soportado: {tipo}")
+
+
+def publicar_pendientes(session: Session, sink: Sink, lote: int) -> int:
+    '''
+    Publica un lote de eventos no publicados y los marca. Entrega "al menos una vez": si el
+    sink falla, nada se marca y el lote se reintenta; los consumidores deduplican por id_evento.
+    '''
+    filas = session.exec(text(f"""
+        SELECT {_COLUMNAS}
+        FROM bancos.eventos_outbox
+        WHERE publicado_en IS NULL AND {_VISIBLES}
+        ORDER BY id_transaccion, id_evento
+        LIMIT :lim
+        FOR UPDATE SKIP LOCKED
+    """), params={"lim": lote}).all()
+    if not filas:
+        session.rollback()
+        return 0
+
+    eventos = [dict(r._mapping) for r in filas]
+    try:
+        sink.publicar(eventos)
+    except Exception:
+        session.rollback()
+        raise
+    session.exec(
+        text("UPDATE bancos.eventos_outbox SET publicado_en = CURRENT_TIMESTAMP WHERE id_evento = ANY(CAST(:ids AS bigint[]))"),
+        params={"ids": [e["id_evento"] for e in eventos]},
+    )
+    session.commit()
+    return len(eventos)
+
+
+def purgar_publicados(session: Session, dias: int) -> int:
+    ''' el feed solo garantiza `dias` de historia; lo publicado más viejo se borra '''
+    res = session.exec(
+        text("""
+            DELETE FROM bancos.eventos_outbox
+            WHERE publicado_en IS NOT NULL
+              AND publicado_en < CURRENT_TIMESTAMP - make_interval(days => :dias)
+        """),
+        params={"dias": dias},
+    )
+    session.commit()
+    return res.rowcount
@@ -1,9 +1,17 @@
 from sqlmodel import Session,select
 from connection.models.modelos import Proveedor, FacturaCompra
 from fastapi import HTTPException, status
-from datetime import date
+from datetime import date, datetime, time, timedelta
 from decimal import Decimal
+from typing import Optional
+import base64
+import hashlib
+import hmac
+import json
+from sqlalchemy import text
 from sqlalchemy.exc import IntegrityError
+from function.fcache import cache_reportes
+from connection.data.db import settings
 
 
 # def crear_proveedor(session: Session, nombre: str, nit: str | None) -> int:
@@ -52,6 +60,7 @@ def crear_factura(session: Session, proveedor_id: int, numero: str,
         session.add(f)
         session.commit()
         session.refresh(f)
+        cache_reportes.invalidar("facturas_compra")
         return f.factura_id
     except IntegrityError as e:
          # Capturar cualquier otro error de unicidad que no se haya prevenido
@@ -70,4 +79,158 @@ def anular_factura(session: Session, factura_id: int,) -> None: # <-- Recibir mo
         
     f.estado = "ANULADA"
     session.add(f) 
-    session.commit()
\ No newline at end of file
+    session.commit()
+    cache_reportes.invalidar("facturas_compra")
+
+
+# Estado de cuenta: facturas (cargo) y pagos (abono, aplicados o a cuenta) del proveedor en una
+# sola secuencia por (fecha, tipo, id), con saldo corrido por moneda (la de la factura; la del
+# pago es la de la cuenta de la que salió) calculado con SUM() OVER en la misma sentencia.
+# Cada rama lee solo `limite` filas desde la posición por su índice (estado_cuenta_proveedor.sql)
+# y el saldo de arranque viaja en el cursor: una página no vuelve a sumar la historia anterior.
+# Solo la primera página con `desde` suma lo previo, y eso sale del índice sin ir a la tabla.
+_ESTADO_CUENTA = text("""
+    WITH facturas AS (
+        SELECT CAST(f.fecha_emision AS timestamp) AS fecha, 'FACTURA' AS tipo, f.factura_id AS id,
+               f.moneda_id, f.numero_factura AS documento, f.factura_id, CAST(f.estado AS text) AS estado,
+               CAST(NULL AS text) AS forma, f.fecha_vencimiento,
+               CASE WHEN f.estado = 'ANULADA' THEN 0 ELSE f.monto_total END AS cargo, CAST(0 AS numeric) AS abono
+        FROM bancos.facturas_compra f
+        WHERE f.proveedor_id = :prov
+          AND (f.fecha_emision, f.factura_id) > (:fac_fecha, :fac_id)
+          AND f.fecha_emision < :fin_fecha
+        ORDER BY f.fecha_emision, f.factura_id
+        LIMIT :limite
+    ), pagos AS (
+        SELECT p.fecha_pago AS fecha, 'PAGO' AS tipo, p.pago_id AS id,
+               c.id_tipo_moneda AS moneda_id, p.referencia_banco AS documento, p.factura_id,
+               CAST(NULL AS text) AS estado, CAST(p.forma AS text) AS forma, CAST(NULL AS date) AS fecha_vencimiento,
+               CAST(0 AS numeric) AS cargo, p.monto_pagado AS abono
+        FROM bancos.pagos_proveedor p
+        JOIN bancos.cuentas_bancarias c ON c.id_cuenta_bancaria = p.id_cuenta_bancaria
+        WHERE p.proveedor_id = :prov
+          AND (p.fecha_pago, p.pago_id) > (:pag_fecha, :pag_id)
+          AND p.fecha_pago < :fin
+        ORDER BY p.fecha_pago, p.pago_id
+        LIMIT :limite
+    ), pagina AS (
+        SELECT * FROM (SELECT * FROM facturas UNION ALL SELECT * FROM pagos) m
+        ORDER BY fecha, tipo, id
+        LIMIT :limite
+    ), inicial AS (
+        -- saldo antes de la página: lo anterior a `desde` (primera página) o lo que trae el cursor
+        SELECT moneda_id, SUM(importe) AS saldo
+        FROM (
+            SELECT moneda_id, CASE WHEN estado = 'ANULADA' THEN 0 ELSE monto_total END AS importe
+            FROM bancos.facturas_compra
+            WHERE proveedor_id = :prov AND fecha_emision < :corte_fecha
+            UNION ALL
+            SELECT c.id_tipo_moneda, -p.monto_pagado
+            FROM bancos.pagos_proveedor p
+            JOIN bancos.cuentas_bancarias c ON c.id_cuenta_bancaria = p.id_cuenta_bancaria
+            WHERE p.proveedor_id = :prov AND p.fecha_pago < :corte
+            UNION ALL
+            SELECT * FROM unnest(CAST(:monedas AS integer[]), CAST(:saldos AS numeric[]))
+        ) x
+        GROUP BY moneda_id
+    )
+    SELECT (SELECT json_object_agg(moneda_id, CAST(saldo AS text)) FROM inicial) AS saldos_iniciales,
+           m.tipo, m.id, m.fecha, m.documento, m.factura_id, m.estado, m.forma, m.fecha_vencimiento,
+           m.moneda_id, m.cargo, m.abono,
+           COALESCE(i.saldo, 0) + SUM(m.cargo - m.abono)
+               OVER (PARTITION BY m.moneda_id ORDER BY m.fecha, m.tipo, m.id) AS saldo
+    FROM bancos.proveedores pr
+    LEFT JOIN pagina m ON true
+    LEFT JOIN inicial i ON i.moneda_id = m.moneda_id
+    WHERE pr.proveedor_id = :prov
+    ORDER BY m.fecha, m.tipo, m.id
+""")
+
+_ID_MAXIMO = 2**63 - 1
+
+
+def _firma_cursor(datos: bytes) -> str:
+    return base64.urlsafe_b64encode(
+        hmac.new(settings.CURSOR_SECRET.encode(), datos, hashlib.sha256).digest()
+    ).decode().rstrip("=")
+
+
+def _cursor_estado_cuenta(proveedor_id: int, ultimo: dict, saldos: dict[str, Decimal]) -> str:
+    # el saldo de arranque de la página siguiente sale del cursor: va firmado (HMAC con
+    # CURSOR_SECRET, no un JWT, para que no sirva como token de la API)
+    datos = json.dumps({"prov": proveedor_id, "fecha": ultimo["fecha"].isoformat(), "tipo": ultimo["tipo"],
+                        "id": ultimo["id"], "saldos": {k: str(v) for k, v in saldos.items()}},
+                       separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(datos).decode().rstrip("=") + "." + _firma_cursor(datos)
+
+
+def _leer_cursor_estado_cuenta(cursor: str, proveedor_id: int) -> tuple[datetime, str, int, dict[str, Decimal]]:
+    try:
+        cuerpo, _, firma = cursor.partition(".")
+        datos = base64.urlsafe_b64decode(cuerpo + "=" * (-len(cuerpo) % 4))
+        if not hmac.compare_digest(firma, _firma_cursor(datos)):
+            raise ValueError
+        c = json.loads(datos)
+        if c["prov"] != proveedor_id or c["tipo"] not in ("FACTURA", "PAGO"):
+            raise ValueError
+        return (datetime.fromisoformat(c["fecha"]), c["tipo"], int(c["id"]),
+                {k: Decimal(v) for k, v in c["saldos"].items()})
+    except (KeyError, TypeError, ValueError, ArithmeticError):
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, "Cursor inválido")
+
+
+def estado_cuenta_proveedor(session: Session, proveedor_id: int, desde: Optional[date] = None,
+                            hasta: Optional[date] = None, limite: int = 200, despues: Optional[str] = None) -> dict:
+    """
+    Facturas y pagos del proveedor en [desde, hasta] (sin `desde`, toda la historia), del más
+    antiguo al más reciente, con saldo corrido por moneda (facturas menos pagos; las anuladas no
+    suman). A igual fecha van primero las facturas. Página siguiente: `despues` = `siguiente`;
+    el saldo sigue desde el de la página anterior.
+    """
+    hasta = hasta or date.today()
+    if desde is not None and hasta < desde:
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, "hasta debe ser mayor o igual que desde")
+    fin = hasta + timedelta(days=1)
+
+    if despues:
+        pos_fecha, pos_tipo, pos_id, saldos = _leer_cursor_estado_cuenta(despues, proveedor_id)
+        corte = date.min
+    else:
+        corte = desde or date.min
+        pos_fecha, pos_tipo, pos_id, saldos = datetime.combine(corte, time.min), None, 0, {}
+    # posición de cada rama: a igual fecha la factura va antes que el pago
+    if pos_tipo == "PAGO":
+        fac, pag = (pos_fecha.date(), _ID_MAXIMO), (pos_fecha, pos_id)
+    else:
+        fac, pag = (pos_fecha.date(), pos_id), (pos_fecha, 0)
+
+    filas = session.exec(_ESTADO_CUENTA, params={
+        "prov": proveedor_id, "limite": limite,
+        "fac_fecha": fac[0], "fac_id": fac[1], "pag_fecha": pag[0], "pag_id": pag[1],
+        "fin_fecha": fin, "fin": datetime.combine(fin, time.min),
+        "corte_fecha": corte, "corte": datetime.combine(corte, time.min),
+        "monedas": [int(k) for k in saldos], "saldos": list(saldos.values()),
+    }).all()
+    if not filas:
+        raise HTTPException(status.HTTP_404_NOT_FOUND, "Proveedor no existe")
+
+    saldo_inicial = {k: Decimal(v) for k, v in (filas[0].saldos_iniciales or {}).items()}
+    movimientos = [
+        {k: v for k, v in f._mapping.items() if k != "saldos_iniciales"}
+        for f in filas if f.id is not None
+    ]
+    saldo_final = dict(saldo_inicial)
+    for m in movimientos:
+        saldo_final[str(m["moneda_id"])] = m["saldo"]
+    siguiente = None
+    if len(movimientos) == limite:
+        siguiente = _cursor_estado_cuenta(proveedor_id, movimientos[-1], saldo_final)
+    return {
+        "proveedor_id": proveedor_id,
+        "desde": str(desde) if desde else None,
+        "hasta": str(hasta),
+        "saldo_inicial": {k: str(v) for k, v in saldo_inicial.items()},
+        "saldo_final": {k: str(v) for k, v in saldo_final.items()},
+        "movimientos": movimientos,
+        "siguiente": siguiente,
+    }
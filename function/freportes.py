@@ -1,94 +1,130 @@
-from typing import Optional,List
-from datetime import date
-from sqlalchemy import text
+from typing import Iterator, Optional,List
+from datetime import date, datetime
 from sqlmodel import Session
 from datetime import timedelta
+from function.fcache import cacheado
+from function.consultas import ConsultaDinamica
 
+# LEFT JOIN a proveedores (proveedor_id es NOT NULL y FK: mismo resultado que JOIN) para que,
+# si `fields` no pide `proveedor`, el planificador quite el join.
 
-def historial_pagos(session:Session, proveedor_id:Optional[int] = None, fecha_inicio: Optional[date] = None, fecha_fin: Optional[date] = None,limite:int = 100 ) -> List[dict]:
-    
-    lista ,params = [],{"limite": limite}
+_HISTORIAL_PAGOS = ConsultaDinamica(
+    "historial_pagos",
+    """
+    SELECT
+        {columnas}
+    FROM bancos.pagos_proveedor p
+    LEFT JOIN bancos.proveedores pr ON pr.proveedor_id = p.proveedor_id
+    {where}
+    ORDER BY p.fecha_pago DESC
+    LIMIT :limite
+    """,
+    filtros={
+        "proveedor": "p.proveedor_id = :prov",
+        "desde": "p.fecha_pago >= :fecha_inicio",
+        "hasta": "p.fecha_pago < :fecha_fin",
+    },
+    columnas={
+        "pago_id": "p.pago_id",
+        "proveedor_id": "p.proveedor_id",
+        "proveedor": "pr.nombre",
+        "factura_id": "p.factura_id",
+        "id_cuenta_bancaria": "p.id_cuenta_bancaria",
+        "monto_pagado": "p.monto_pagado",
+        "fecha_pago": "p.fecha_pago",
+        "forma": "p.forma",
+        "referencia_banco": "p.referencia_banco",
+        "observacion": "p.observacion",
+    },
+)
+COLUMNAS_HISTORIAL = _HISTORIAL_PAGOS.columnas
+
+
+def _filtros_historial(proveedor_id: Optional[int], fecha_inicio: Optional[date], fecha_fin: Optional[date]) -> dict:
+    return {
+        "proveedor": {"prov": proveedor_id} if proveedor_id is not None else None,
+        "desde": {"fecha_inicio": fecha_inicio} if fecha_inicio is not None else None,
+        "hasta": {"fecha_fin": fecha_fin + timedelta(days=1)} if fecha_fin is not None else None,
+    }
+
+
+@cacheado("historial_pagos", tablas=("pagos_proveedor", "proveedores"))
+def historial_pagos(session:Session, proveedor_id:Optional[int] = None, fecha_inicio: Optional[date] = None, fecha_fin: Optional[date] = None,limite:int = 100,
+                    campos: Optional[tuple[str, ...]] = None) -> List[dict]:
     
-    if proveedor_id is not None:
-        lista.append("p.proveedor_id = :prov")
-        params["prov"] = proveedor_id
-        
-    if fecha_inicio is not None:
-        lista.append("p.fecha_pago >= :fecha_inicio")
-        params["fecha_inicio"] = fecha_inicio
-        
-    if fecha_fin is not None:
-        lista.append("p.fecha_pago < :fecha_fin")
-        params["fecha_fin"] = fecha_fin + timedelta(days=1)  
-            
-    where_clause = (" WHERE " + " AND ".join(lista)) if lista else ""
-        
-    query = text(f"""
-                 SELECT 
-                    p.pago_id, 
-                    p.proveedor_id, 
-                    pr.nombre AS proveedor,
-                    p.factura_id,
-                    p.id_cuenta_bancaria, 
-                    p.monto_pagado, 
-                    p.fecha_pago, 
-                    p.forma,        
-                    p.referencia_banco, 
-                    p.observacion
-                FROM bancos.pagos_proveedor p
-                JOIN bancos.proveedores pr ON pr.proveedor_id = p.proveedor_id 
-                {where_clause}
-                ORDER BY p.fecha_pago DESC
-                LIMIT :limite
-                    
-                """) 
-        
-        
-    result = session.exec(query, params).all()
-    return [dict(r._mapping) for r in result]
+    return _HISTORIAL_PAGOS.ejecutar(session, _filtros_historial(proveedor_id, fecha_inicio, fecha_fin), campos=campos, limite=limite)
+
+
+def iterar_historial_pagos(session: Session, proveedor_id: Optional[int] = None, fecha_inicio: Optional[date] = None,
+                           fecha_fin: Optional[date] = None, limite: Optional[int] = None,
+                           campos: Optional[tuple[str, ...]] = None) -> Iterator[dict]:
+    """ historial_pagos fila por fila, sin cache (para NDJSON); sin `limite` trae todo el rango """
+    return _HISTORIAL_PAGOS.iterar(session, _filtros_historial(proveedor_id, fecha_inicio, fecha_fin),
+                                   campos=campos, limite=limite)
    
 
-def facturas_pagadas_por_fecha(session:Session, proveedor_id:Optional[int] = None, fecha_inicio: Optional[date] = None, fecha_fin: Optional[date] = None, limite:int = 100) -> List[dict]:
+_FACTURAS_PAGADAS = ConsultaDinamica(
+    "facturas_pagadas",
+    """
+    SELECT
+        {columnas}
+    FROM bancos.facturas_compra fc
+    LEFT JOIN bancos.proveedores pr ON pr.proveedor_id = fc.proveedor_id
+    {where}
+    ORDER BY fc.fecha_ultimo_pago DESC, fc.factura_id DESC
+    LIMIT :limite
+    """,
+    filtros={
+        "proveedor": "fc.proveedor_id = :prov",
+        "desde": "fc.fecha_ultimo_pago >= :fecha_inicio",
+        "hasta": "fc.fecha_ultimo_pago < :fecha_fin_plus",
+        "despues": "(fc.fecha_ultimo_pago, fc.factura_id) < (:despues_fecha, :despues_id)",
+    },
+    fijos=["fc.estado = 'PAGADA'"],
+    columnas={
+        "factura_id": "fc.factura_id",
+        "numero_factura": "fc.numero_factura",
+        "proveedor_id": "fc.proveedor_id",
+        "proveedor": "pr.nombre",
+        "total_pagado": "fc.total_pagado",
+        "saldo_pendiente": "fc.saldo_pendiente",
+        "fecha_ultimo_pago": "fc.fecha_ultimo_pago",
+    },
+)
+COLUMNAS_FACTURAS_PAGADAS = _FACTURAS_PAGADAS.columnas
+# el cursor de la página siguiente sale de estas, así que van aunque `fields` no las pida
+CURSOR_FACTURAS_PAGADAS = ("factura_id", "fecha_ultimo_pago")
 
-    lista,params = ["f.estado = 'PAGADA'" ],{"limite": limite}
-        
-    if proveedor_id is not None:
-        lista.append("f.proveedor_id = :prov")
-        params["prov"] = proveedor_id
-        
-    list_fecha_ultima = []
-    
-    if fecha_inicio is not None:
-        list_fecha_ultima.append("MAX(pp.fecha_pago) >= :fecha_inicio")
-        params["fecha_inicio"] = fecha_inicio
-    if fecha_fin is not None:
-        
-        list_fecha_ultima.append("MAX(pp.fecha_pago) < :fecha_fin_plus") 
-        params["fecha_fin_plus"] = fecha_fin + timedelta(days=1)
-            
-    where_clause = " WHERE " + " AND ".join(lista) 
-    having_clause = " HAVING " + " AND ".join(list_fecha_ultima) if list_fecha_ultima else ""
-        
-    #fecha ultima de pago  
-    req = text(f"""
-        SELECT 
-            fc.factura_id, 
-            fc.numero_factura, 
-            fc.proveedor_id, 
-            pr.nombre AS proveedor, 
-            SUM(pp.monto_pagado) AS total_pagado, 
-            fc.saldo_pendiente,
-            MAX(pp.fecha_pago) AS fecha_ultimo_pago
-        FROM bancos.facturas_compra fc
-        JOIN bancos.pagos_proveedor pp ON pp.factura_id = fc.factura_id
-        JOIN bancos.proveedores pr ON pr.proveedor_id = fc.proveedor_id
-        {where_clause}
-        GROUP BY fc.factura_id, fc.numero_factura, fc.proveedor_id, pr.nombre,fc.saldo_pendiente
-        {having_clause} 
-        ORDER BY total_pagado DESC
-        LIMIT :limite
-    """)
-    
-    filas = session.exec(req, params).all()
-    return [dict(r._mapping) for r in filas]
-    
\ No newline at end of file
+
+def _filtros_facturas_pagadas(proveedor_id: Optional[int], fecha_inicio: Optional[date], fecha_fin: Optional[date],
+                              despues_fecha: Optional[datetime], despues_id: Optional[int]) -> dict:
+    return {
+        "proveedor": {"prov": proveedor_id} if proveedor_id is not None else None,
+        "desde": {"fecha_inicio": fecha_inicio} if fecha_inicio is not None else None,
+        "hasta": {"fecha_fin_plus": fecha_fin + timedelta(days=1)} if fecha_fin is not None else None,
+        "despues": ({"despues_fecha": despues_fecha, "despues_id": despues_id}
+                    if despues_fecha is not None and despues_id is not None else None),
+    }
+
+
+@cacheado("facturas_pagadas", tablas=("facturas_compra", "proveedores"))
+def facturas_pagadas_por_fecha(session:Session, proveedor_id:Optional[int] = None, fecha_inicio: Optional[date] = None, fecha_fin: Optional[date] = None, limite:int = 100,
+                               despues_fecha: Optional[datetime] = None, despues_id: Optional[int] = None,
+                               campos: Optional[tuple[str, ...]] = None) -> List[dict]:
+    """
+    Facturas PAGADAS cuyo último pago cae en el rango. Usa los acumulados de la factura
+    (fecha_ultimo_pago/total_pagado) así que es un rango sobre idx_facturas_pagadas_ultimo_pago.
+    Paginado por llave: pasar la fecha_ultimo_pago y factura_id de la última fila recibida.
+    """
+
+    return _FACTURAS_PAGADAS.ejecutar(session, _filtros_facturas_pagadas(
+        proveedor_id, fecha_inicio, fecha_fin, despues_fecha, despues_id), campos=campos, limite=limite)
+
+
+def iterar_facturas_pagadas(session: Session, proveedor_id: Optional[int] = None, fecha_inicio: Optional[date] = None,
+                            fecha_fin: Optional[date] = None, limite: Optional[int] = None,
+                            despues_fecha: Optional[datetime] = None, despues_id: Optional[int] = None,
+                            campos: Optional[tuple[str, ...]] = None) -> Iterator[dict]:
+    """ facturas_pagadas_por_fecha fila por fila, sin cache (para NDJSON); sin `limite` trae todo """
+    return _FACTURAS_PAGADAS.iterar(session, _filtros_facturas_pagadas(
+        proveedor_id, fecha_inicio, fecha_fin, despues_fecha, despues_id), campos=campos, limite=limite)
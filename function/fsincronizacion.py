@@ -0,0 +1,313 @@
+import asyncio
+import json
+import time
+from datetime import datetime
+from typing import Callable, Optional
+
+from fastapi import HTTPException, status
+from sqlalchemy import text
+from sqlmodel import Session
+
+from connection.data.db import settings, transaccion
+from function.fcache import cache_reportes
+from services.compras_cliente import ClienteCompras
+
+# Sincronización incremental desde el servicio de compras. Por recurso (proveedores antes que
+# facturas, que los referencian) se piden los cambios posteriores a la marca de agua guardada en
+# bancos.sincronizacion, de a SYNC_COMPRAS_LOTE, y cada página se aplica con un solo
+# INSERT ... SELECT FROM unnest(arreglos) ON CONFLICT: una sentencia por página en vez de las dos
+# consultas + INSERT por factura de crear_factura. La marca avanza en la misma transacción que
+# las filas, así que una corrida cortada sigue desde la última página aplicada. Mientras se
+# aplica una página ya se está pidiendo la siguiente.
+#
+# Lo que es de tesorería no se pisa: en facturas con pagos el saldo se recalcula con lo pagado,
+# no cambia la moneda, no se baja el monto por debajo de lo pagado y una anulada no revive; la
+# criticidad del proveedor solo se toma al crearlo. Las filas sin cambios no se reescriben.
+#
+# Una factura que no se puede aplicar (proveedor aún no sincronizado, datos inválidos o un
+# cambio que chocaría con los pagos) sale de la sentencia con su motivo y se guarda en
+# bancos.sincronizacion_rechazos en la misma transacción: la marca avanza igual, pero la fila
+# no se pierde. Cada corrida reintenta esos rechazos antes de pedir cambios.
+
+_AVANZAR = text("""
+    UPDATE bancos.sincronizacion
+    SET marca = :marca, marca_id = :marca_id, filas = filas + :filas, actualizado_en = CURRENT_TIMESTAMP
+    WHERE recurso = :recurso
+      AND marca IS NOT DISTINCT FROM CAST(:marca_anterior AS timestamp)
+      AND marca_id = :marca_id_anterior
+    RETURNING 1
+""")
+
+_PROVEEDORES = text("""
+    INSERT INTO bancos.proveedores AS p (id_externo, nombre, nit, telefono, correo, activo, criticidad)
+    SELECT t.proveedor_id, left(t.nombre, 150), left(t.nit, 10),
+           CASE WHEN t.telefono ~ '^[0-9]{8}$' THEN t.telefono END,
+           left(t.correo, 120), t.activo, LEAST(GREATEST(COALESCE(t.criticidad, 1), 1), 5)
+    FROM unnest(CAST(:proveedor_id AS bigint[]), CAST(:nombre AS text[]), CAST(:nit AS text[]),
+                CAST(:telefono AS text[]), CAST(:correo AS text[]), CAST(:activo AS boolean[]),
+                CAST(:criticidad AS smallint[]))
+         AS t(proveedor_id, nombre, nit, telefono, correo, activo, criticidad)
+    ON CONFLICT (id_externo) DO UPDATE
+    SET nombre = EXCLUDED.nombre, nit = EXCLUDED.nit, telefono = EXCLUDED.telefono,
+        correo = EXCLUDED.correo, activo = EXCLUDED.activo
+    WHERE (p.nombre, p.nit, p.telefono, p.correo, p.activo)
+          IS DISTINCT FROM (EXCLUDED.nombre, EXCLUDED.nit, EXCLUDED.telefono, EXCLUDED.correo, EXCLUDED.activo)
+    RETURNING (xmax = 0) AS insertada
+""")
+
+# ON CONFLICT por columnas y no ON CONSTRAINT uq_factura_prov_num: ese es el nombre en el
+# modelo, pero bancos_schema.sql declara el UNIQUE sin nombre. `evaluadas` le pone motivo a lo
+# que no se aplica; el WHERE del DO UPDATE repite las reglas de pagos por si la factura cambió
+# entre la lectura y el INSERT (esas quedan como sin cambios, no como rechazo).
+_FACTURAS = text("""
+    WITH t AS (
+        SELECT *
+        FROM unnest(CAST(:factura_id AS bigint[]), CAST(:proveedor_id AS bigint[]),
+                    CAST(:numero_factura AS text[]), CAST(:fecha_emision AS date[]),
+                    CAST(:fecha_vencimiento AS date[]), CAST(:moneda_id AS integer[]),
+                    CAST(:monto_total AS numeric[]), CAST(:descuento_pronto_pago AS numeric[]),
+                    CAST(:fecha_limite_descuento AS date[]), CAST(:anulada AS boolean[]))
+             AS t(factura_id, proveedor_id, numero_factura, fecha_emision, fecha_vencimiento, moneda_id,
+                  monto_total, descuento_pronto_pago, fecha_limite_descuento, anulada)
+    ), evaluadas AS (
+        SELECT t.*, p.proveedor_id AS proveedor_local,
+               CASE
+                   WHEN p.proveedor_id IS NULL THEN 'PROVEEDOR_NO_SINCRONIZADO'
+                   WHEN t.monto_total IS NULL OR t.monto_total < 0 THEN 'MONTO_INVALIDO'
+                   WHEN t.fecha_vencimiento < t.fecha_emision THEN 'VENCE_ANTES_DE_EMITIRSE'
+                   WHEN f.total_pagado > t.monto_total THEN 'MONTO_MENOR_QUE_PAGADO'
+                   WHEN f.total_pagado > 0 AND f.moneda_id <> t.moneda_id THEN 'MONEDA_CON_PAGOS'
+               END AS motivo
+        FROM t
+        LEFT JOIN bancos.proveedores p ON p.id_externo = t.proveedor_id
+        LEFT JOIN bancos.facturas_compra f
+               ON f.proveedor_id = p.proveedor_id AND f.numero_factura = t.numero_factura
+    ), aplicadas AS (
+    INSERT INTO bancos.facturas_compra AS f
+        (proveedor_id, numero_factura, fecha_emision, fecha_vencimiento, moneda_id, monto_total,
+         saldo_pendiente, estado, descuento_pronto_pago, fecha_limite_descuento)
+    SELECT t.proveedor_local, t.numero_factura, t.fecha_emision, t.fecha_vencimiento, t.moneda_id,
+           t.monto_total, t.monto_total,
+           CASE WHEN t.anulada THEN 'ANULADA' ELSE 'PENDIENTE' END::bancos.estado_factura,
+           COALESCE(t.descuento_pronto_pago, 0), t.fecha_limite_descuento
+    FROM evaluadas t
+    WHERE t.motivo IS NULL
+    ON CONFLICT (proveedor_id, numero_factura) DO UPDATE
+    SET fecha_emision = EXCLUDED.fecha_emision,
+        fecha_vencimiento = EXCLUDED.fecha_vencimiento,
+        moneda_id = EXCLUDED.moneda_id,
+        monto_total = EXCLUDED.monto_total,
+        saldo_pendiente = EXCLUDED.monto_total - f.total_pagado,
+        estado = CASE
+            WHEN f.estado = 'ANULADA' OR (EXCLUDED.estado = 'ANULADA' AND f.total_pagado = 0) THEN 'ANULADA'
+            WHEN f.total_pagado = 0 THEN 'PENDIENTE'
+            WHEN f.total_pagado >= EXCLUDED.monto_total THEN 'PAGADA'
+            ELSE 'PARCIAL'
+        END::bancos.estado_factura,
+        descuento_pronto_pago = EXCLUDED.descuento_pronto_pago,
+        fecha_limite_descuento = EXCLUDED.fecha_limite_descuento
+    WHERE f.total_pagado <= EXCLUDED.monto_total
+      AND (f.total_pagado = 0 OR f.moneda_id = EXCLUDED.moneda_id)
+      AND (f.fecha_emision, f.fecha_vencimiento, f.moneda_id, f.monto_total, f.descuento_pronto_pago,
+           f.fecha_limite_descuento, f.estado = 'ANULADA')
+          IS DISTINCT FROM
+          (EXCLUDED.fecha_emision, EXCLUDED.fecha_vencimiento, EXCLUDED.moneda_id, EXCLUDED.monto_total,
+           EXCLUDED.descuento_pronto_pago, EXCLUDED.fecha_limite_descuento, EXCLUDED.estado = 'ANULADA')
+    RETURNING (xmax = 0) AS insertada
+    )
+    SELECT NULL::bigint AS id_externo, insertada, NULL AS motivo FROM aplicadas
+    UNION ALL
+    SELECT factura_id, NULL, motivo FROM evaluadas WHERE motivo IS NOT NULL
+""")
+
+_GUARDAR_RECHAZOS = text("""
+    INSERT INTO bancos.sincronizacion_rechazos AS r (recurso, id_externo, motivo, datos)
+    SELECT :recurso, t.id_externo, t.motivo, t.datos
+    FROM unnest(CAST(:id_externo AS bigint[]), CAST(:motivo AS text[]), CAST(:datos AS jsonb[]))
+         AS t(id_externo, motivo, datos)
+    ON CONFLICT (recurso, id_externo) DO UPDATE
+    SET motivo = EXCLUDED.motivo, datos = EXCLUDED.datos, intentos = r.intentos + 1,
+        actualizado_en = CURRENT_TIMESTAMP
+""")
+
+# los que llegaron y no se rechazaron (aplicados o ya iguales) dejan de estar pendientes
+_RESOLVER_RECHAZOS = text("""
+    DELETE FROM bancos.sincronizacion_rechazos
+    WHERE recurso = :recurso AND id_externo = ANY(CAST(:ids AS bigint[]))
+""")
+
+_RECHAZOS_PENDIENTES = text("""
+    SELECT datos FROM bancos.sincronizacion_rechazos
+    WHERE recurso = :recurso
+    ORDER BY id_externo
+""")
+
+# recurso -> (id en compras, clave de unicidad local, sentencia, campos que se mandan como arreglos)
+_RECURSOS = {
+    "proveedores": ("proveedor_id", ("proveedor_id",), _PROVEEDORES,
+                    ("proveedor_id", "nombre", "nit", "telefono", "correo", "activo", "criticidad")),
+    "facturas": ("factura_id", ("proveedor_id", "numero_factura"), _FACTURAS,
+                 ("factura_id", "proveedor_id", "numero_factura", "fecha_emision", "fecha_vencimiento",
+                  "moneda_id", "monto_total", "descuento_pronto_pago", "fecha_limite_descuento", "anulada")),
+}
+
+
+def _marca(session: Session, recurso: str) -> tuple[Optional[datetime], int]:
+    fila = session.exec(
+        text("SELECT marca, marca_id FROM bancos.sincronizacion WHERE recurso = :r"), params={"r": recurso},
+    ).first()
+    return (fila.marca, fila.marca_id) if fila else (None, 0)
+
+
+def _aplicar(session: Session, recurso: str, items: list[dict]) -> tuple[int, int, list[dict]]:
+    '''
+    Aplica `items` dentro de la transacción abierta y lleva la cuenta de los rechazos:
+    (insertadas, actualizadas, [{id_externo, motivo}] rechazadas).
+    '''
+    id_externo, clave, sentencia, campos = _RECURSOS[recurso]
+    # un mismo registro dos veces en la página haría fallar el ON CONFLICT: queda el último
+    unicos = list({tuple(it[c] for c in clave): it for it in items}.values())
+    filas = session.exec(sentencia, params={c: [it.get(c) for it in unicos] for c in campos}).all()
+    rechazadas = [{id_externo: f.id_externo, "motivo": f.motivo} for f in filas if getattr(f, "motivo", None)]
+    aplicadas = [f for f in filas if not getattr(f, "motivo", None)]
+    insertadas = sum(1 for f in aplicadas if f.insertada)
+
+    if rechazadas:
+        datos = {it[id_externo]: it for it in unicos}
+        session.exec(_GUARDAR_RECHAZOS, params={
+            "recurso": recurso,
+            "id_externo": [r[id_externo] for r in rechazadas],
+            "motivo": [r["motivo"] for r in rechazadas],
+            "datos": [json.dumps(datos[r[id_externo]], default=str) for r in rechazadas],
+        })
+    motivos = {r[id_externo] for r in rechazadas}
+    session.exec(_RESOLVER_RECHAZOS, params={
+        "recurso": recurso, "ids": [it[id_externo] for it in unicos if it[id_externo] not in motivos],
+    })
+    return insertadas, len(aplicadas) - insertadas, rechazadas
+
+
+def _aplicar_pagina(session: Session, recurso: str, items: list[dict], anterior: tuple[Optional[datetime], int],
+                    nueva: tuple[datetime, int]) -> tuple[int, int, list[dict]]:
+    ''' _aplicar, y la marca pasa de `anterior` a `nueva` en la misma transacción '''
+    with transaccion(session):
+        avanzo = session.exec(_AVANZAR, params={
+            "recurso": recurso, "marca": nueva[0], "marca_id": nueva[1], "filas": len(items),
+            "marca_anterior": anterior[0], "marca_id_anterior": anterior[1],
+        }).first()
+        if avanzo is None:
+            raise HTTPException(status.HTTP_409_CONFLICT,
+                                f"Otra sincronización de {recurso} avanzó la marca; volver a ejecutar")
+        return _aplicar(session, recurso, items)
+
+
+def _reintentar_rechazos(session: Session, recurso: str) -> tuple[int, int, list[dict], int]:
+    '''
+    Vuelve a aplicar lo rechazado en corridas anteriores (p. ej. el proveedor ya llegó):
+    _aplicar más la cantidad de registros reintentados.
+    '''
+    with transaccion(session):
+        items = [f.datos for f in session.exec(_RECHAZOS_PENDIENTES, params={"recurso": recurso})]
+        if not items:
+            return 0, 0, [], 0
+        return *_aplicar(session, recurso, items), len(items)
+
+
+async def _sincronizar_recurso(session: Session, cliente: ClienteCompras, recurso: str, lote: int) -> dict:
+    id_externo = _RECURSOS[recurso][0]
+    marca = await asyncio.to_thread(_marca, session, recurso)
+    inicio = time.perf_counter()
+    # antes que las páginas nuevas: si compras mandó una versión más reciente, esa gana
+    insertadas, actualizadas, rechazadas, reintentadas = await asyncio.to_thread(_reintentar_rechazos,
+                                                                                  session, recurso)
+    sin_cambios = reintentadas - insertadas - actualizadas - len(rechazadas)
+    pendientes = {r[id_externo]: r for r in rechazadas}
+    recibidas = paginas = 0
+
+    pedido = asyncio.ensure_future(cliente.cambios(recurso, marca[0], marca[1], lote))
+    while True:
+        items = await pedido
+        if not items:
+            break
+        nueva = (datetime.fromisoformat(items[-1]["actualizado_en"]), items[-1][id_externo])
+        hay_mas = len(items) >= lote
+        if hay_mas:
+            pedido = asyncio.ensure_future(cliente.cambios(recurso, nueva[0], nueva[1], lote))
+        try:
+            ins, act, rechazadas = await asyncio.to_thread(_aplicar_pagina, session, recurso, items, marca, nueva)
+        except BaseException:
+            if hay_mas:
+                pedido.cancel()
+            raise
+        marca = nueva
+        recibidas += len(items)
+        insertadas += ins
+        actualizadas += act
+        sin_cambios += len(items) - ins - act - len(rechazadas)
+        paginas += 1
+        for it in items:
+            pendientes.pop(it[id_externo], None)
+        pendientes.update((r[id_externo], r) for r in rechazadas)
+        if not hay_mas:
+            break
+
+    segundos = time.perf_counter() - inicio
+    return {
+        "recurso": recurso,
+        "recibidas": recibidas,
+        "insertadas": insertadas,
+        "actualizadas": actualizadas,
+        "sin_cambios": sin_cambios,
+        "reintentadas": reintentadas,
+        # quedan en bancos.sincronizacion_rechazos y se vuelven a intentar en la próxima corrida
+        "rechazadas": len(pendientes),
+        "detalle_rechazadas": list(pendientes.values()),
+        "paginas": paginas,
+        "segundos": round(segundos, 3),
+        "filas_por_segundo": round(recibidas / segundos) if recibidas else 0,
+        "marca": marca[0].isoformat() if marca[0] else None,
+        "marca_id": marca[1],
+    }
+
+
+async def _sincronizar(session: Session, recursos: list[str], lote: int, url: Optional[str],
+                       al_avanzar: Optional[Callable[[int, int], None]]) -> list[dict]:
+    # cliente propio: el de services.compras_cliente pertenece al event loop de la API
+    cliente = ClienteCompras(url)
+    detalle = []
+    try:
+        for n, recurso in enumerate(recursos, start=1):
+            detalle.append(await _sincronizar_recurso(session, cliente, recurso, lote))
+            if al_avanzar:
+                al_avanzar(n, len(recursos))
+    finally:
+        await cliente.cerrar()
+    return detalle
+
+
+def sincronizar_compras(session: Session, recursos: Optional[list[str]] = None, lote: Optional[int] = None,
+                        url: Optional[str] = None,
+                        al_avanzar: Optional[Callable[[int, int], None]] = None) -> dict:
+    """
+    Trae de compras los proveedores y facturas modificados desde la última corrida y los aplica
+    en bloque. Corre su propio event loop: llamarla desde el worker o un script, no desde un
+    endpoint async.
+    """
+    lote = lote or settings.SYNC_COMPRAS_LOTE
+    recursos = [r for r in _RECURSOS if r in recursos] if recursos else list(_RECURSOS)
+    if not recursos:
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, f"Recursos válidos: {', '.join(_RECURSOS)}")
+    inicio = time.perf_counter()
+    detalle = asyncio.run(_sincronizar(session, recursos, lote, url, al_avanzar))
+    segundos = time.perf_counter() - inicio
+    if any(d["insertadas"] or d["actualizadas"] for d in detalle):
+        cache_reportes.invalidar("proveedores", "facturas_compra")
+    recibidas = sum(d["recibidas"] for d in detalle)
+    return {
+        "recibidas": recibidas,
+        "aplicadas": sum(d["insertadas"] + d["actualizadas"] for d in detalle),
+        "rechazadas": sum(d["rechazadas"] for d in detalle),
+        "segundos": round(segundos, 3),
+        "filas_por_segundo": round(recibidas / segundos) if recibidas else 0,
+        "detalle": detalle,
+    }
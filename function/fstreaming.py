@@ -0,0 +1,47 @@
+import json
+from typing import Any, Callable, Iterable, Iterator
+
+from fastapi import Request
+from fastapi.encoders import ENCODERS_BY_TYPE
+from sqlalchemy.engine import Engine
+from sqlmodel import Session
+
+# Respuestas NDJSON (una fila JSON por línea). Las filas salen de un cursor del servidor y se
+# mandan de a `lote` líneas por parte, así que ni la BD, ni la API ni el cliente necesitan el
+# resultado completo en memoria. La sesión es propia del generador: la de la dependencia ya se
+# cerró cuando empieza el streaming (igual que en la exportación).
+
+NDJSON = "application/x-ndjson"
+FILAS_PARTE = 1000
+
+
+def _a_json(valor: Any) -> Any:
+    # mismos tipos y formato que las respuestas JSON de FastAPI (Decimal, fechas, UUID...)
+    codificar = ENCODERS_BY_TYPE.get(type(valor))
+    if codificar is None:
+        raise TypeError(f"{type(valor).__name__} no se puede pasar a JSON")
+    return codificar(valor)
+
+
+_codificador = json.JSONEncoder(default=_a_json, ensure_ascii=False, separators=(",", ":"))
+
+
+def pide_ndjson(request: Request, formato: str) -> bool:
+    return formato == "ndjson" or NDJSON in request.headers.get("accept", "")
+
+
+def lineas(filas: Iterable[dict], filas_parte: int = FILAS_PARTE) -> Iterator[bytes]:
+    parte: list[str] = []
+    for fila in filas:
+        parte.append(_codificador.encode(fila))
+        if len(parte) >= filas_parte:
+            yield ("\n".join(parte) + "\n").encode()
+            parte = []
+    if parte:
+        yield ("\n".join(parte) + "\n").encode()
+
+
+def ndjson_desde(eng: Engine, consulta: Callable[[Session], Iterable[dict]]) -> Iterator[bytes]:
+    """ abre su sesión en `eng`, corre `consulta(session)` y devuelve las partes NDJSON """
+    with Session(eng) as session:
+        yield from lineas(consulta(session))
@@ -0,0 +1,260 @@
+from datetime import date, timedelta
+from decimal import Decimal
+from typing import Optional
+
+import numpy as np
+from fastapi import HTTPException, status
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import Session
+
+from connection.data.db import settings
+from connection.models.modelos import TipoCambio, TipoCambioCreate, TipoMoneda
+
+
+def registrar_tipo_cambio(session: Session, dto: TipoCambioCreate) -> dict:
+    if dto.id_moneda_origen == dto.id_moneda_destino:
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, "Moneda origen y destino no pueden ser iguales")
+    for id_moneda in (dto.id_moneda_origen, dto.id_moneda_destino):
+        if not session.get(TipoMoneda, id_moneda):
+            raise HTTPException(status.HTTP_404_NOT_FOUND, f"Tipo de moneda {id_moneda} no existe")
+
+    f = dto.fecha or date.today()
+    tc = session.get(TipoCambio, (dto.id_moneda_origen, dto.id_moneda_destino, f))
+    if tc:
+        tc.tasa = dto.tasa
+    else:
+        tc = TipoCambio(id_moneda_origen=dto.id_moneda_origen, id_moneda_destino=dto.id_moneda_destino, fecha=f, tasa=dto.tasa)
+    try:
+        session.add(tc); session.commit()
+    except IntegrityError as e:
+        session.rollback()
+        raise HTTPException(status.HTTP_409_CONFLICT, "No se pudo registrar el tipo de cambio") from e
+    return {"id_moneda_origen": dto.id_moneda_origen, "id_moneda_destino": dto.id_moneda_destino,
+            "fecha": str(f), "tasa": str(dto.tasa)}
+
+
+def posicion_tesoreria(session: Session, banco_id: Optional[int] = None, moneda_id: Optional[int] = None,
+                       moneda_destino: Optional[str] = None, detalle: bool = False) -> dict:
+    """
+    Posición de caja de todas las cuentas activas agrupada por moneda, leída de saldos_cuenta
+    (saldo mantenido) en una sola consulta. Con `moneda_destino` (código, p.ej. 'GTQ') convierte
+    cada grupo con el último tipo de cambio registrado a la fecha.
+    """
+    filtros, params = ["c.estado = 'ACTIVA'"], {}
+    if banco_id is not None:
+        filtros.append("c.id_banco = :banco"); params["banco"] = banco_id
+    if moneda_id is not None:
+        filtros.append("c.id_tipo_moneda = :moneda"); params["moneda"] = moneda_id
+
+    id_destino = None
+    if moneda_destino:
+        id_destino = session.exec(
+            text("SELECT id_tipo_moneda FROM bancos.tipos_moneda WHERE codigo = :cod"),
+            params={"cod": moneda_destino.upper()},
+        ).scalar()
+        if id_destino is None:
+            raise HTTPException(status.HTTP_404_NOT_FOUND, f"Moneda destino {moneda_destino} no existe")
+    where_clause = " AND ".join(filtros)
+    grupos = session.exec(text(f"""
+        WITH por_moneda AS (
+            SELECT c.id_tipo_moneda,
+                   COUNT(*) AS cuentas,
+                   COALESCE(SUM(s.saldo), 0)::numeric(18,2) AS saldo_total
+            FROM bancos.cuentas_bancarias c
+            LEFT JOIN bancos.saldos_cuenta s ON s.id_cuenta_bancaria = c.id_cuenta_bancaria
+            WHERE {where_clause}
+            GROUP BY c.id_tipo_moneda
+        )
+        SELECT tm.id_tipo_moneda, tm.codigo AS moneda, pm.cuentas, pm.saldo_total,
+               CASE WHEN CAST(:destino AS integer) IS NULL THEN NULL
+                    WHEN tm.id_tipo_moneda = CAST(:destino AS integer) THEN 1::numeric
+                    ELSE tc.tasa END AS tasa,
+               tc.fecha AS fecha_tasa
+        FROM por_moneda pm
+        JOIN bancos.tipos_moneda tm ON tm.id_tipo_moneda = pm.id_tipo_moneda
+        LEFT JOIN LATERAL (
+            SELECT t.tasa, t.fecha
+            FROM bancos.tipos_cambio t
+            WHERE t.id_moneda_origen = pm.id_tipo_moneda
+              AND t.id_moneda_destino = CAST(:destino AS integer)
+              AND t.fecha <= CURRENT_DATE
+            ORDER BY t.fecha DESC
+            LIMIT 1
+        ) tc ON true
+        ORDER BY tm.codigo
+    """), params={**params, "destino": id_destino}).all()
+
+    monedas, sin_tasa, total = [], [], Decimal("0.00")
+    for g in grupos:
+        item = {
+            "id_tipo_moneda": g.id_tipo_moneda,
+            "moneda": g.moneda,
+            "cuentas": g.cuentas,
+            "saldo_total": str(g.saldo_total),
+        }
+        if id_destino is not None:
+            if g.tasa is None:
+                sin_tasa.append(g.moneda)
+                item["tasa"] = None
+                item["saldo_convertido"] = None
+            else:
+                convertido = (g.saldo_total * g.tasa).quantize(Decimal("0.01"))
+                total += convertido
+                item["tasa"] = str(g.tasa)
+                item["fecha_tasa"] = str(g.fecha_tasa) if g.fecha_tasa else None
+                item["saldo_convertido"] = str(convertido)
+        monedas.append(item)
+
+    res = {"monedas": monedas}
+    if id_destino is not None:
+        res["moneda_destino"] = moneda_destino.upper()
+        # sin todas las tasas el total no sería la posición real
+        res["total_convertido"] = None if sin_tasa else str(total)
+        res["monedas_sin_tasa"] = sin_tasa
+
+    if detalle:
+        cuentas = session.exec(text(f"""
+            SELECT c.id_cuenta_bancaria, c.id_banco, b.nombre_banco, c.numero_cuenta,
+                   tm.codigo AS moneda, COALESCE(s.saldo, 0)::numeric(18,2) AS saldo
+            FROM bancos.cuentas_bancarias c
+            JOIN bancos.bancos b ON b.id_banco = c.id_banco
+            JOIN bancos.tipos_moneda tm ON tm.id_tipo_moneda = c.id_tipo_moneda
+            LEFT JOIN bancos.saldos_cuenta s ON s.id_cuenta_bancaria = c.id_cuenta_bancaria
+            WHERE {where_clause}
+            ORDER BY tm.codigo, c.id_cuenta_bancaria
+        """), params=params).all()
+        res["cuentas"] = [dict(r._mapping) for r in cuentas]
+    return res
+
+
+def texto_centavos(valor: int) -> str:
+    signo, valor = ("-", -valor) if valor < 0 else ("", valor)
+    return f"{signo}{valor // 100}.{valor % 100:02d}"
+
+
+def proyectar_flujo(session: Session, dias: int = 30, banco_id: Optional[int] = None,
+                    moneda_id: Optional[int] = None, detalle: bool = False) -> dict:
+    """
+    Proyección diaria de caja a `dias` días, por cuenta y por moneda.
+
+    - Cuenta: parte del saldo en libros más los cheques EMITIDOS aún no cobrados (en libros ya
+      se descontaron, en el banco todavía no) y los descuenta el día en que se espera el cobro
+      (emisión + FORECAST_DIAS_COBRO_CHEQUE).
+    - Moneda: suma de sus cuentas menos las facturas PENDIENTE/PARCIAL en su vencimiento
+      (las facturas no tienen cuenta asignada). Vencidas o sin vencimiento caen en el día 0.
+      Tampoco tienen banco: con `banco_id` se restan todas las facturas abiertas de la moneda
+      de las cuentas de ese banco solamente (el peor caso para el banco, no un prorrateo) y la
+      respuesta lo indica en `aviso`.
+
+    Todo en centavos (int64): los montos por día se reparten en una matriz [fila, día] con
+    np.add.at y la serie es un cumsum, sin recorrer documentos en Python. Los montos salen como
+    texto con dos decimales, también los de `serie`.
+    """
+    hoy = date.today()
+    filtros, params = ["c.estado = 'ACTIVA'"], {"dias": dias}
+    if banco_id is not None:
+        filtros.append("c.id_banco = :banco"); params["banco"] = banco_id
+    if moneda_id is not None:
+        filtros.append("c.id_tipo_moneda = :moneda"); params["moneda"] = moneda_id
+    where_clause = " AND ".join(filtros)
+
+    cuentas = session.exec(text(f"""
+        SELECT c.id_cuenta_bancaria, c.numero_cuenta, c.id_tipo_moneda, tm.codigo AS moneda,
+               ROUND(COALESCE(s.saldo, 0) * 100)::bigint AS saldo_libros
+        FROM bancos.cuentas_bancarias c
+        JOIN bancos.tipos_moneda tm ON tm.id_tipo_moneda = c.id_tipo_moneda
+        LEFT JOIN bancos.saldos_cuenta s ON s.id_cuenta_bancaria = c.id_cuenta_bancaria
+        WHERE {where_clause}
+        ORDER BY c.id_cuenta_bancaria
+    """), params=params).all()
+    if not cuentas:
+        return {"desde": str(hoy), "dias": dias, "monedas": [], "cuentas": [] if detalle else None}
+
+    # cheques y facturas llegan ya agrupados por (fila, índice de día) en centavos: a lo más
+    # cuentas x días filas, no una por documento
+    cheques = session.exec(text(f"""
+        SELECT ch.id_cuenta_bancaria,
+               GREATEST(0, ch.fecha_emision + CAST(:cobro AS integer) - CURRENT_DATE) AS dia,
+               ROUND(SUM(ch.monto) * 100)::bigint AS centavos
+        FROM bancos.cheques ch
+        JOIN bancos.cuentas_bancarias c ON c.id_cuenta_bancaria = ch.id_cuenta_bancaria
+        WHERE ch.estado = 'EMITIDO' AND {where_clause}
+        GROUP BY 1, 2
+    """), params={**params, "cobro": settings.FORECAST_DIAS_COBRO_CHEQUE}).all()
+
+    id_monedas = sorted({c.id_tipo_moneda for c in cuentas})
+    facturas = session.exec(text("""
+        SELECT moneda_id,
+               GREATEST(0, COALESCE(fecha_vencimiento, CURRENT_DATE) - CURRENT_DATE) AS dia,
+               ROUND(SUM(saldo_pendiente) * 100)::bigint AS centavos
+        FROM bancos.facturas_compra
+        WHERE estado IN ('PENDIENTE','PARCIAL')
+          AND saldo_pendiente > 0
+          AND moneda_id = ANY(CAST(:monedas AS integer[]))
+          AND COALESCE(fecha_vencimiento, CURRENT_DATE) < CURRENT_DATE + CAST(:dias AS integer)
+        GROUP BY 1, 2
+    """), params={"monedas": id_monedas, "dias": dias}).all()
+
+    ids_cuenta = np.fromiter((c.id_cuenta_bancaria for c in cuentas), dtype=np.int64, count=len(cuentas))
+    saldo_libros = np.fromiter((c.saldo_libros for c in cuentas), dtype=np.int64, count=len(cuentas))
+    monedas_arr = np.array(id_monedas, dtype=np.int64)
+    moneda_de_cuenta = np.searchsorted(monedas_arr, [c.id_tipo_moneda for c in cuentas])
+
+    # cheques: matriz [cuenta, día] de cobros esperados
+    cobros = np.zeros((len(cuentas), dias), dtype=np.int64)
+    en_transito = np.zeros(len(cuentas), dtype=np.int64)
+    if cheques:
+        ch = np.array(cheques, dtype=np.int64)
+        fila = np.searchsorted(ids_cuenta, ch[:, 0])
+        np.add.at(en_transito, fila, ch[:, 2])
+        dentro = ch[:, 1] < dias
+        np.add.at(cobros, (fila[dentro], ch[dentro, 1]), ch[dentro, 2])
+    serie_cuentas = (saldo_libros + en_transito)[:, None] - np.cumsum(cobros, axis=1)
+
+    # monedas: suma de sus cuentas menos facturas por vencimiento
+    serie_monedas = np.zeros((len(id_monedas), dias), dtype=np.int64)
+    np.add.at(serie_monedas, moneda_de_cuenta, serie_cuentas)
+    pagos = np.zeros((len(id_monedas), dias), dtype=np.int64)
+    if facturas:
+        fc = np.array(facturas, dtype=np.int64)
+        np.add.at(pagos, (np.searchsorted(monedas_arr, fc[:, 0]), fc[:, 1]), fc[:, 2])
+    serie_monedas -= np.cumsum(pagos, axis=1)
+
+    codigos = {c.id_tipo_moneda: c.moneda for c in cuentas}
+    fechas = [str(hoy + timedelta(days=d)) for d in range(dias)]
+    monedas = []
+    for i, id_m in enumerate(id_monedas):
+        serie = serie_monedas[i]
+        negativos = np.flatnonzero(serie < 0)
+        minimo = int(serie.argmin())
+        monedas.append({
+            "id_tipo_moneda": id_m,
+            "moneda": codigos[id_m],
+            "saldo_inicial": texto_centavos(int(saldo_libros[moneda_de_cuenta == i].sum() + en_transito[moneda_de_cuenta == i].sum())),
+            "cheques_en_transito": texto_centavos(int(en_transito[moneda_de_cuenta == i].sum())),
+            "facturas_por_pagar": texto_centavos(int(pagos[i].sum())),
+            "saldo_final": texto_centavos(int(serie[-1])),
+            "saldo_minimo": texto_centavos(int(serie[minimo])),
+            "fecha_saldo_minimo": fechas[minimo],
+            "fecha_primer_deficit": fechas[negativos[0]] if negativos.size else None,
+            "serie": [texto_centavos(v) for v in serie.tolist()],
+        })
+
+    res = {"desde": str(hoy), "dias": dias, "fechas": fechas, "monedas": monedas}
+    if banco_id is not None:
+        res["aviso"] = ("Las facturas no tienen banco: se restan todas las abiertas de cada moneda "
+                        "de las cuentas de este banco")
+    if detalle:
+        res["cuentas"] = [
+            {
+                "id_cuenta_bancaria": c.id_cuenta_bancaria,
+                "numero_cuenta": c.numero_cuenta,
+                "moneda": c.moneda,
+                "saldo_libros": texto_centavos(int(saldo_libros[i])),
+                "cheques_en_transito": texto_centavos(int(en_transito[i])),
+                "serie": [texto_centavos(v) for v in serie_cuentas[i].tolist()],
+            }
+            for i, c in enumerate(cuentas)
+        ]
+    return res
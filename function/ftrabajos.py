@@ -0,0 +1,270 @@
+import json
+import logging
+import threading
+from datetime import date
+from typing import Any, Callable, Optional
+
+from fastapi import HTTPException, status
+from sqlalchemy import text
+from sqlmodel import Session
+
+from connection.data.db import engine, read_engine, settings
+from connection.models.modelos import AuthUsuario, ConciliacionLoteItem, Trabajo
+from function.fconsiliaciones import conciliar_lote
+from function.freportes import historial_pagos, facturas_pagadas_por_fecha
+from function.fhistorico import archivar_movimientos
+from function.fsincronizacion import sincronizar_compras
+
+log = logging.getLogger("bancos.trabajos")
+
+# tipo de trabajo -> handler(parametros, progreso) ; progreso(pct) guarda el avance 0-100
+Handler = Callable[[dict, Callable[[int], None]], Any]
+_HANDLERS: dict[str, Handler] = {}
+# tipos que escriben y no se pueden repetir a ciegas: si el worker deja de latir, el trabajo
+# queda FALLIDO en vez de volver a la cola (el primer worker puede seguir corriendo)
+_NO_REINTENTABLES: set[str] = set()
+# tipo -> roles que lo pueden encolar (vacío: cualquier usuario con token)
+_ROLES: dict[str, tuple[str, ...]] = {}
+
+
+def registrar_tipo(nombre: str, reintentable: bool = True, roles: tuple[str, ...] = ()):
+    def _decorador(fn: Handler) -> Handler:
+        _HANDLERS[nombre] = fn
+        _ROLES[nombre] = roles
+        if not reintentable:
+            _NO_REINTENTABLES.add(nombre)
+        return fn
+    return _decorador
+
+
+def tipos_registrados() -> list[str]:
+    return sorted(_HANDLERS)
+
+
+def roles_de_tipo(tipo: str) -> tuple[str, ...]:
+    return _ROLES.get(tipo, ())
+
+
+def _a_json(valor: Any) -> str:
+    # Decimal y fechas como texto, igual que los endpoints que devuelven str(saldo)
+    return json.dumps(valor, default=str, ensure_ascii=False)
+
+
+#---------------- API de la cola ----------------
+
+def encolar_trabajo(session: Session, tipo: str, parametros: dict, usuario: Optional[str] = None,
+                    usuario_sub: Optional[str] = None) -> int:
+    if tipo not in _HANDLERS:
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, f"Tipo de trabajo no soportado: {tipo}")
+
+    t = Trabajo(tipo=tipo, parametros=parametros, usuario_registro=(usuario[:60] if usuario else None),
+                usuario_sub=(usuario_sub[:60] if usuario_sub else None))
+    session.add(t); session.commit(); session.refresh(t)
+    return t.id_trabajo
+
+
+def obtener_trabajo(session: Session, id_trabajo: int, usuario: AuthUsuario) -> Trabajo:
+    ''' solo quien lo encoló o un ADMIN; a los demás les responde como si no existiera '''
+    t = session.get(Trabajo, id_trabajo)
+    if not t or (usuario.rol != "ADMIN" and (t.usuario_sub is None or t.usuario_sub != usuario.sub)):
+        raise HTTPException(status.HTTP_404_NOT_FOUND, "Trabajo no existe")
+    return t
+
+
+def estado_trabajo(t: Trabajo) -> dict:
+    ''' vista del trabajo sin el resultado (puede ser grande) '''
+    return {
+        "id_trabajo": t.id_trabajo,
+        "tipo": t.tipo,
+        "estado": t.estado,
+        "progreso": t.progreso,
+        "intentos": t.intentos,
+        "error": t.error,
+        "creado_en": t.creado_en,
+        "iniciado_en": t.iniciado_en,
+        "terminado_en": t.terminado_en,
+    }
+
+
+def tomar_trabajo(session: Session) -> Optional[dict]:
+    '''
+    Reclama el siguiente pendiente; SKIP LOCKED deja que varios workers sondeen sin pisarse.
+    `intentos` queda como marca del reclamo: latido, progreso y cierre solo escriben si sigue
+    siendo el mismo (un trabajo reencolado y tomado por otro worker ya tiene otro).
+    '''
+    fila = session.exec(
+        text("""
+            UPDATE bancos.trabajos
+            SET estado = 'EN_PROCESO',
+                intentos = intentos + 1,
+                iniciado_en = CURRENT_TIMESTAMP,
+                actualizado_en = CURRENT_TIMESTAMP
+            WHERE id_trabajo = (
+                SELECT id_trabajo FROM bancos.trabajos
+                WHERE estado = 'PENDIENTE'
+                ORDER BY id_trabajo
+                FOR UPDATE SKIP LOCKED
+                LIMIT 1
+            )
+            RETURNING id_trabajo, tipo, parametros, intentos
+        """)
+    ).first()
+    session.commit()
+    return dict(fila._mapping) if fila else None
+
+
+def reencolar_huerfanos(session: Session) -> int:
+    '''
+    Trabajos EN_PROCESO sin latido (worker caído) vuelven a PENDIENTE, o quedan FALLIDO si
+    agotaron intentos o si su tipo no es reintentable.
+    '''
+    res = session.exec(
+        text("""
+            UPDATE bancos.trabajos
+            SET estado = CASE WHEN intentos >= :max_int OR tipo = ANY(CAST(:no_reint AS text[]))
+                              THEN 'FALLIDO' ELSE 'PENDIENTE' END,
+                error = CASE WHEN intentos >= :max_int THEN 'Worker sin respuesta; se agotaron los intentos'
+                             WHEN tipo = ANY(CAST(:no_reint AS text[]))
+                             THEN 'Worker sin respuesta; este tipo no se repite solo: revisar lo que alcanzó a hacer y volver a encolar'
+                             ELSE error END,
+                terminado_en = CASE WHEN intentos >= :max_int OR tipo = ANY(CAST(:no_reint AS text[]))
+                                    THEN CURRENT_TIMESTAMP ELSE NULL END
+            WHERE estado = 'EN_PROCESO'
+              AND actualizado_en < CURRENT_TIMESTAMP - make_interval(secs => :timeout)
+        """),
+        params={"max_int": settings.TRABAJOS_MAX_INTENTOS, "timeout": settings.TRABAJOS_TIMEOUT,
+                "no_reint": sorted(_NO_REINTENTABLES)},
+    )
+    session.commit()
+    return res.rowcount
+
+
+def _actualizar_progreso(id_trabajo: int, intento: int, pct: int) -> None:
+    # sesión propia: el handler puede tener su transacción abierta
+    with Session(engine) as s:
+        s.exec(
+            text("""
+                UPDATE bancos.trabajos
+                SET progreso = :p, actualizado_en = CURRENT_TIMESTAMP
+                WHERE id_trabajo = :id AND estado = 'EN_PROCESO' AND intentos = :intento
+            """),
+            params={"id": id_trabajo, "intento": intento, "p": max(0, min(100, int(pct)))},
+        )
+        s.commit()
+
+
+def _latir(id_trabajo: int, intento: int, fin: threading.Event) -> None:
+    # el progreso solo se guarda cuando el handler lo reporta; mientras corre, este hilo
+    # renueva actualizado_en para que reencolar_huerfanos no lo tome por caído y lo repita
+    while not fin.wait(settings.TRABAJOS_LATIDO):
+        try:
+            with Session(engine) as s:
+                s.exec(
+                    text("""
+                        UPDATE bancos.trabajos SET actualizado_en = CURRENT_TIMESTAMP
+                        WHERE id_trabajo = :id AND estado = 'EN_PROCESO' AND intentos = :intento
+                    """),
+                    params={"id": id_trabajo, "intento": intento},
+                )
+                s.commit()
+        except Exception:
+            log.exception("Latido del trabajo %s falló", id_trabajo)
+
+
+def _terminar(id_trabajo: int, intento: int, resultado: Any = None, error: Optional[str] = None) -> None:
+    with Session(engine) as s:
+        res = s.exec(
+            text("""
+                UPDATE bancos.trabajos
+                SET estado = :estado,
+                    progreso = CASE WHEN CAST(:completo AS boolean) THEN 100 ELSE progreso END,
+                    resultado = CAST(:resultado AS jsonb),
+                    error = :error,
+                    actualizado_en = CURRENT_TIMESTAMP,
+                    terminado_en = CURRENT_TIMESTAMP
+                WHERE id_trabajo = :id AND estado = 'EN_PROCESO' AND intentos = :intento
+            """),
+            params={
+                "id": id_trabajo,
+                "intento": intento,
+                "estado": "FALLIDO" if error else "COMPLETADO",
+                "completo": error is None,
+                "resultado": None if resultado is None else _a_json(resultado),
+                "error": error,
+            },
+        )
+        s.commit()
+    if res.rowcount == 0:
+        # se reencoló (o quedó FALLIDO) mientras corría: el estado es de quien lo tiene ahora
+        log.warning("Trabajo %s (intento %s) ya no es de este worker; no se guarda su cierre", id_trabajo, intento)
+
+
+def ejecutar_trabajo(trabajo: dict) -> None:
+    id_trabajo, tipo, intento = trabajo["id_trabajo"], trabajo["tipo"], trabajo["intentos"]
+    handler = _HANDLERS.get(tipo)
+    if handler is None:
+        _terminar(id_trabajo, intento, error=f"Tipo de trabajo no soportado: {tipo}")
+        return
+    fin = threading.Event()
+    latido = threading.Thread(target=_latir, args=(id_trabajo, intento, fin), name=f"latido-{id_trabajo}", daemon=True)
+    latido.start()
+    try:
+        resultado = handler(trabajo["parametros"] or {}, lambda pct: _actualizar_progreso(id_trabajo, intento, pct))
+        _terminar(id_trabajo, intento, resultado=resultado)
+    except HTTPException as e:
+        _terminar(id_trabajo, intento, error=str(e.detail))
+    except Exception as e:
+        log.exception("Trabajo %s (%s) falló", id_trabajo, tipo)
+        _terminar(id_trabajo, intento, error=str(e))
+    finally:
+        fin.set()
+        latido.join()
+
+
+#---------------- tipos de trabajo ----------------
+
+def _fecha(v: Optional[str]) -> Optional[date]:
+    return date.fromisoformat(v) if v else None
+
+
+@registrar_tipo("conciliacion_lote", reintentable=False)
+def _trabajo_conciliacion_lote(p: dict, progreso: Callable[[int], None]) -> dict:
+    items = [ConciliacionLoteItem(**i) for i in p.get("items", [])]
+    if not items:
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, "El lote no trae cuentas")
+    return conciliar_lote(
+        items,
+        bandera=bool(p.get("bandera", False)),
+        max_workers=p.get("max_workers"),
+        al_avanzar=lambda hechas, total: progreso(hechas * 100 // total),
+    )
+
+
+@registrar_tipo("historial_pagos")
+def _trabajo_historial_pagos(p: dict, progreso: Callable[[int], None]) -> dict:
+    with Session(read_engine) as s:
+        filas = historial_pagos(s, p.get("proveedor_id"), _fecha(p.get("fecha_inicio")),
+                                _fecha(p.get("fecha_fin")), int(p.get("limite", 100000)))
+    return {"historial_pagos": filas}
+
+
+@registrar_tipo("facturas_pagadas")
+def _trabajo_facturas_pagadas(p: dict, progreso: Callable[[int], None]) -> dict:
+    with Session(read_engine) as s:
+        filas = facturas_pagadas_por_fecha(s, p.get("proveedor_id"), _fecha(p.get("fecha_inicio")),
+                                           _fecha(p.get("fecha_fin")), int(p.get("limite", 100000)))
+    return {"facturas_pagadas": filas}
+
+
+@registrar_tipo("archivar_movimientos", reintentable=False, roles=("ADMIN",))
+def _trabajo_archivar_movimientos(p: dict, progreso: Callable[[int], None]) -> dict:
+    with Session(engine) as s:
+        return archivar_movimientos(s, p.get("id_cuenta"), _fecha(p.get("hasta")), p.get("lote"),
+                                    al_avanzar=lambda hechas, total: progreso(hechas * 100 // total))
+
+
+@registrar_tipo("sincronizar_compras", reintentable=False, roles=("ADMIN",))
+def _trabajo_sincronizar_compras(p: dict, progreso: Callable[[int], None]) -> dict:
+    with Session(engine) as s:
+        return sincronizar_compras(s, p.get("recursos"), p.get("lote"),
+                                   al_avanzar=lambda hechos, total: progreso(hechos * 100 // total))
@@ -0,0 +1,219 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from time import perf_counter
+from typing import Callable, Iterator, Optional
+from uuid import UUID
+
+from fastapi import HTTPException, status
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+from sqlmodel import Session
+
+from connection.data.db import settings
+
+log = logging.getLogger("bancos.verificacion")
+
+# Verificador de integridad del libro. Cada verificación se parte en tramos que no se cruzan y
+# los tramos corren en paralelo, cada uno con su conexión y en una sola sentencia (un snapshot:
+# lo que se escribió en la misma transacción se ve completo). Los tramos recorren su rango por
+# índice, así que el trabajo total es un recorrido de cada tabla aunque haya muchos tramos:
+#   - transferencias: por rango de transferencia_id (uuid4, uniforme); el par OUT/IN está en
+#     dos cuentas distintas, por eso no se parte por cuenta
+#   - movimientos: por grupos de cuentas; CHEQUE_EMITIDO con su fila en cheques (misma cuenta y
+#     monto) y transferencias con transferencia_id
+#   - facturas: por rangos de proveedor; saldo_pendiente = monto_total - pagos y total_pagado =
+#     pagos
+# Los movimientos se leen de movimientos_bancarios y de movimientos_historico.
+
+_MOVIMIENTOS = """
+        SELECT id_movimiento, id_cuenta_bancaria, tipo_mov, monto, referencia_externa, transferencia_id
+        FROM bancos.movimientos_bancarios
+        WHERE {condicion}
+        UNION ALL
+        SELECT id_movimiento, id_cuenta_bancaria, tipo_mov, monto, referencia_externa, transferencia_id
+        FROM bancos.movimientos_historico
+        WHERE {condicion}
+"""
+
+_TRANSFERENCIAS = text("""
+    WITH m AS ({movimientos}),
+    t AS (
+        SELECT transferencia_id,
+               COUNT(*) FILTER (WHERE tipo_mov = 'TRANSFERENCIA_OUT') AS salidas,
+               COUNT(*) FILTER (WHERE tipo_mov = 'TRANSFERENCIA_IN') AS entradas,
+               COUNT(*) FILTER (WHERE tipo_mov NOT IN ('TRANSFERENCIA_OUT', 'TRANSFERENCIA_IN')) AS otros,
+               MAX(monto) FILTER (WHERE tipo_mov = 'TRANSFERENCIA_OUT') AS monto_salida,
+               MAX(monto) FILTER (WHERE tipo_mov = 'TRANSFERENCIA_IN') AS monto_entrada,
+               MAX(id_cuenta_bancaria) FILTER (WHERE tipo_mov = 'TRANSFERENCIA_OUT') AS cuenta_origen,
+               MAX(id_cuenta_bancaria) FILTER (WHERE tipo_mov = 'TRANSFERENCIA_IN') AS cuenta_destino
+        FROM m
+        GROUP BY transferencia_id
+    )
+    SELECT transferencia_id::text AS clave,
+           CASE WHEN salidas <> 1 OR entradas <> 1 THEN format('%s salida(s) y %s entrada(s)', salidas, entradas)
+                WHEN otros > 0 THEN 'movimientos de otro tipo con el mismo transferencia_id'
+                WHEN cuenta_origen = cuenta_destino THEN 'origen y destino son la misma cuenta'
+                ELSE 'el monto de salida y el de entrada no coinciden'
+           END AS problema,
+           salidas, entradas, otros, monto_salida, monto_entrada, cuenta_origen, cuenta_destino
+    FROM t
+    WHERE NOT (salidas = 1 AND entradas = 1 AND otros = 0
+               AND monto_salida = monto_entrada AND cuenta_origen <> cuenta_destino)
+    ORDER BY transferencia_id
+    LIMIT :maximo
+""".format(movimientos=_MOVIMIENTOS.format(
+    condicion="transferencia_id BETWEEN CAST(:desde AS uuid) AND CAST(:hasta AS uuid)")))
+
+_MOVIMIENTOS_CUENTA = text("""
+    WITH m AS ({movimientos})
+    SELECT m.id_movimiento::text AS clave,
+           CASE WHEN m.tipo_mov <> 'CHEQUE_EMITIDO' THEN 'transferencia sin transferencia_id'
+                WHEN ch.id_cheque IS NULL THEN 'CHEQUE_EMITIDO sin su fila en cheques'
+                WHEN ch.id_cuenta_bancaria <> m.id_cuenta_bancaria THEN 'el cheque es de otra cuenta'
+                ELSE 'el monto del movimiento y el del cheque no coinciden'
+           END AS problema,
+           m.id_cuenta_bancaria, m.tipo_mov, m.monto, m.referencia_externa,
+           ch.id_cheque, ch.id_cuenta_bancaria AS cuenta_cheque, ch.monto AS monto_cheque
+    FROM m
+    LEFT JOIN bancos.cheques ch
+      ON m.tipo_mov = 'CHEQUE_EMITIDO'
+     -- CASE: el cast solo se evalúa si la referencia es numérica
+     AND ch.id_cheque = CASE WHEN m.referencia_externa ~ '^[0-9]{{1,18}}$' THEN m.referencia_externa::bigint END
+    WHERE m.tipo_mov <> 'CHEQUE_EMITIDO'
+       OR ch.id_cheque IS NULL
+       OR ch.id_cuenta_bancaria <> m.id_cuenta_bancaria
+       OR ch.monto <> m.monto
+    ORDER BY m.id_movimiento
+    LIMIT :maximo
+""".format(movimientos=_MOVIMIENTOS.format(condicion="""id_cuenta_bancaria = ANY(CAST(:cuentas AS integer[]))
+          AND (tipo_mov = 'CHEQUE_EMITIDO'
+               OR (tipo_mov IN ('TRANSFERENCIA_OUT', 'TRANSFERENCIA_IN') AND transferencia_id IS NULL))""")))
+
+_FACTURAS = text("""
+    SELECT f.factura_id::text AS clave,
+           CASE WHEN f.total_pagado <> COALESCE(p.pagado, 0) THEN 'total_pagado distinto de la suma de pagos'
+                ELSE 'saldo_pendiente distinto de monto_total menos pagos'
+           END AS problema,
+           f.proveedor_id, f.numero_factura, f.estado, f.monto_total, f.saldo_pendiente, f.total_pagado,
+           COALESCE(p.pagado, 0) AS pagos
+    FROM bancos.facturas_compra f
+    LEFT JOIN (
+        SELECT factura_id, SUM(monto_pagado) AS pagado
+        FROM bancos.pagos_proveedor
+        WHERE proveedor_id BETWEEN :desde AND :hasta AND factura_id IS NOT NULL
+        GROUP BY factura_id
+    ) p ON p.factura_id = f.factura_id
+    WHERE f.proveedor_id BETWEEN :desde AND :hasta
+      AND (f.saldo_pendiente <> f.monto_total - COALESCE(p.pagado, 0)
+           OR f.total_pagado <> COALESCE(p.pagado, 0))
+    ORDER BY f.factura_id
+    LIMIT :maximo
+""")
+
+
+#---------------- tramos ----------------
+
+def _tramos_transferencias(session: Session, n: int) -> list[dict]:
+    ''' n rangos contiguos del espacio de uuid (inclusive en los dos extremos) '''
+    total = 1 << 128
+    return [{"desde": str(UUID(int=k * total // n)), "hasta": str(UUID(int=(k + 1) * total // n - 1))}
+            for k in range(n)]
+
+
+def _tramos_cuentas(session: Session, n: int) -> list[dict]:
+    ids = session.exec(text("SELECT id_cuenta_bancaria FROM bancos.cuentas_bancarias ORDER BY 1")).scalars().all()
+    tam = -(-len(ids) // n) if ids else 1
+    return [{"cuentas": ids[i:i + tam]} for i in range(0, len(ids), tam)]
+
+
+def _tramos_proveedores(session: Session, n: int) -> list[dict]:
+    filas = session.exec(text("""
+        SELECT MIN(proveedor_id) AS desde, MAX(proveedor_id) AS hasta
+        FROM (SELECT proveedor_id, ntile(:n) OVER (ORDER BY proveedor_id) AS tramo FROM bancos.proveedores) x
+        GROUP BY tramo
+        ORDER BY desde
+    """), params={"n": n}).all()
+    return [{"desde": f.desde, "hasta": f.hasta} for f in filas]
+
+
+# nombre -> (sentencia, armado de tramos)
+VERIFICACIONES: dict[str, tuple] = {
+    "transferencias": (_TRANSFERENCIAS, _tramos_transferencias),
+    "movimientos": (_MOVIMIENTOS_CUENTA, _tramos_cuentas),
+    "facturas": (_FACTURAS, _tramos_proveedores),
+}
+
+
+def validar_verificaciones(nombres: Optional[list[str]]) -> list[str]:
+    if not nombres:
+        return list(VERIFICACIONES)
+    desconocidas = set(nombres) - set(VERIFICACIONES)
+    if desconocidas:
+        raise HTTPException(status.HTTP_400_BAD_REQUEST,
+                            f"Verificaciones desconocidas: {', '.join(sorted(desconocidas))}. "
+                            f"Disponibles: {', '.join(VERIFICACIONES)}")
+    return [v for v in VERIFICACIONES if v in nombres]
+
+
+def _correr_tramo(eng: Engine, verificacion: str, numero: int, params: dict, maximo: int) -> dict:
+    sentencia = VERIFICACIONES[verificacion][0]
+    t0 = perf_counter()
+    with Session(eng) as s:
+        filas = s.exec(sentencia, params={**params, "maximo": maximo + 1}).all()
+    hallazgos = [
+        {"verificacion": verificacion, "tramo": numero, "clave": f.clave, "problema": f.problema,
+         "detalle": {k: v for k, v in f._mapping.items() if k not in ("clave", "problema")}}
+        for f in filas[:maximo]
+    ]
+    return {"verificacion": verificacion, "tramo": numero, "hallazgos": hallazgos,
+            "truncado": len(filas) > maximo, "duracion_ms": round((perf_counter() - t0) * 1000, 2)}
+
+
+def verificar(eng: Engine, verificaciones: Optional[list[str]] = None, tramos: Optional[int] = None,
+              max_workers: Optional[int] = None, maximo: Optional[int] = None,
+              al_avanzar: Optional[Callable[[int, int], None]] = None) -> Iterator[dict]:
+    """
+    Corre las verificaciones y va devolviendo los hallazgos a medida que termina cada tramo;
+    al final un registro {"resumen": ...} con hallazgos por verificación y tiempos. Un tramo
+    que falla se informa como {"error": ...} y no detiene los demás.
+    """
+    nombres = validar_verificaciones(verificaciones)
+    n = max(1, tramos or settings.VERIFICACION_TRAMOS)
+    maximo = maximo or settings.VERIFICACION_MAX_HALLAZGOS
+    inicio = perf_counter()
+    with Session(eng) as s:
+        trabajo = [(v, k, p) for v in nombres for k, p in enumerate(VERIFICACIONES[v][1](s, n))]
+    workers = max(1, min(max_workers or settings.VERIFICACION_WORKERS, len(trabajo) or 1))
+
+    resumen = {v: {"tramos": 0, "hallazgos": 0, "truncados": 0, "errores": 0, "duracion_ms": 0.0} for v in nombres}
+    pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="verificacion")
+    try:
+        futuros = {pool.submit(_correr_tramo, eng, v, k, p, maximo): (v, k) for v, k, p in trabajo}
+        for hechos, futuro in enumerate(as_completed(futuros), start=1):
+            v, k = futuros[futuro]
+            r = resumen[v]
+            r["tramos"] += 1
+            try:
+                res = futuro.result()
+            except Exception as e:
+                log.exception("Verificación %s, tramo %s falló", v, k)
+                r["errores"] += 1
+                yield {"verificacion": v, "tramo": k, "error": str(e)}
+            else:
+                r["hallazgos"] += len(res["hallazgos"])
+                r["truncados"] += res["truncado"]
+                r["duracion_ms"] = round(r["duracion_ms"] + res["duracion_ms"], 2)
+                yield from res["hallazgos"]
+            if al_avanzar:
+                al_avanzar(hechos, len(futuros))
+    finally:
+        # si el cliente corta el streaming no se siguen lanzando tramos
+        pool.shutdown(wait=True, cancel_futures=True)
+
+    yield {"resumen": {
+        "verificaciones": resumen,
+        "hallazgos": sum(r["hallazgos"] for r in resumen.values()),
+        "tramos": len(trabajo),
+        "workers": workers,
+        "duracion_ms": round((perf_counter() - inicio) * 1000, 2),
+    }}
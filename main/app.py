@@ -1,15 +1,48 @@
 import os
+import asyncio
 import logging
 import uuid
+from contextlib import asynccontextmanager
 from fastapi import FastAPI,Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
+from connection.data.db import engine, read_engine, es_escritura, registrar_escritura, settings
+from services.admision import admision, clasificar, retry_after, Rechazo
+from services.arranque import arranque
+from services.compresion import Compresion
+from services.compras_cliente import compras as cliente_compras
 from routes.bancos import banco
 from routes.reportes import reportes
 from routes.conciliaziones import conc
 from routes.cheques import cheques
+from routes.trabajos import trabajos
+from routes.eventos import eventos
+from routes.busqueda import busqueda
+from routes.exportar import exportar
+from routes.compras import compras
+from routes.verificacion import verificacion
+from routes.facturas import facturas
+from routes.proveedores import proveedores
 
-app = FastAPI(title="bancos Api")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # el calentamiento corre aparte: uvicorn acepta conexiones enseguida y /ready avisa cuándo
+    # mandar tráfico
+    tarea = None
+    if settings.ARRANQUE_CALENTAR:
+        tarea = asyncio.create_task(asyncio.to_thread(arranque.calentar))
+    else:
+        arranque.omitir()
+    yield
+    arranque.detener()
+    if tarea is not None:
+        await tarea
+    await cliente_compras.cerrar()
+    engine.dispose()
+    if read_engine is not engine:
+        read_engine.dispose()
+
+app = FastAPI(title="bancos Api", lifespan=lifespan)
 app.router.redirect_slashes = False
 
 DEBUG = os.getenv("DEBUG", "0") == "1"
@@ -17,6 +50,34 @@ origins = [o.strip() for o in os.getenv("ALLOWED_ORIGINS", "").split(",") if o.s
 if not origins:
     origins = ["http://localhost:5173"]
 
+@app.middleware("http")
+async def control_admision(request: Request, call_next):
+    # va por dentro de CORS: los 429/503 también llevan los encabezados CORS
+    clase = clasificar(request) if settings.ADMISION_ACTIVA else None
+    if clase is None:
+        return await call_next(request)
+    turno = await admision.entrar(request, clase)
+    if isinstance(turno, Rechazo):
+        return JSONResponse({"detail": turno.detalle}, status_code=turno.status,
+                            headers={"Retry-After": retry_after(turno.reintentar)})
+    try:
+        response = await call_next(request)
+    except BaseException:
+        admision.liberar(turno)
+        raise
+    # el cupo se libera cuando termina el cuerpo (exportaciones y NDJSON van en streaming)
+    cuerpo = response.body_iterator
+
+    async def _cuerpo():
+        try:
+            async for parte in cuerpo:
+                yield parte
+        finally:
+            admision.liberar(turno)
+
+    response.body_iterator = _cuerpo()
+    return response
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,  
@@ -27,6 +88,9 @@ app.add_middleware(
     expose_headers=["X-New-Access-Token", "X-New-Access-Expires-In","X-New-Refresh-Token"],
 )
 
+# por fuera de CORS y de la admisión: también comprime los 429/503
+app.add_middleware(Compresion)
+
 logger = logging.getLogger("bancos")
 logging.basicConfig(level=logging.INFO)
 
@@ -35,12 +99,27 @@ async def add_reqid_and_log(request: Request, call_next):
     reqid = request.headers.get("X-Request-ID") or uuid.uuid4().hex
     response = await call_next(request)
     response.headers["X-Request-ID"] = reqid
+    if response.status_code < 400 and es_escritura(request):
+        # las lecturas siguientes de este cliente van al primario (ver get_read_session);
+        # en un hilo porque consulta la posición del WAL al primario
+        await asyncio.to_thread(registrar_escritura, request)
+    origen = getattr(request.state, "origen_lectura", None)
+    if origen:
+        response.headers["X-Leido-De"] = origen
     logger.info("%s %s %s", request.method, request.url.path, response.status_code)
     return response
 
 @app.get("/health")
 def health():
-    return {"ok": True, "service": "bancos"}
+    return {"ok": True, "service": "bancos", "admision": admision.estado()}
+
+@app.get("/ready")
+def ready():
+    # /health dice que el proceso vive; /ready, que ya puede recibir tráfico
+    problema = arranque.problema()
+    if problema:
+        return JSONResponse({"ready": False, "detail": problema, "arranque": arranque.estado()}, status_code=503)
+    return {"ready": True, "arranque": arranque.estado()}
 
 
 @app.exception_handler(Exception)
@@ -53,4 +132,12 @@ async def excepciones_genericas(request: Request, exc: Exception):
 app.include_router(banco)
 app.include_router(reportes)
 app.include_router(conc)
-app.include_router(cheques)
\ No newline at end of file
+app.include_router(cheques)
+app.include_router(trabajos)
+app.include_router(eventos)
+app.include_router(busqueda)
+app.include_router(exportar)
+app.include_router(compras)
+app.include_router(verificacion)
+app.include_router(facturas)
+app.include_router(proveedores)
@@ -0,0 +1,35 @@
+"""
+Archiva al histórico los movimientos conciliados anteriores al último cierre de cada cuenta
+(ver function/fhistorico.py). Pensado para cron; también existe como trabajo
+"archivar_movimientos" para main.worker.
+
+    python -m main.archivar [--cuenta 1] [--hasta 2024-12-31] [--lote 5000]
+"""
+import argparse
+import json
+import sys
+from datetime import date
+
+from sqlmodel import Session
+
+from connection.data.db import engine
+from function.fhistorico import archivar_movimientos
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Archivado de movimientos de periodos cerrados")
+    parser.add_argument("--cuenta", type=int, default=None, help="solo esta cuenta (por defecto todas)")
+    parser.add_argument("--hasta", type=date.fromisoformat, default=None,
+                        help="no archivar después de esta fecha aunque el cierre sea posterior")
+    parser.add_argument("--lote", type=int, default=None)
+    args = parser.parse_args()
+
+    with Session(engine) as s:
+        reporte = archivar_movimientos(s, args.cuenta, args.hasta, args.lote)
+    json.dump(reporte, sys.stdout, indent=2, ensure_ascii=False, default=str)
+    sys.stdout.write("\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,92 @@
+"""
+Latencia de la búsqueda por texto (movimientos, cheques, proveedores) contra la BD de
+POSTGRES_URL: p50/p95 por caso y los índices que usa el plan del segundo paso (el de los
+términos raros). Falla (exit 1) si algún p95 pasa de --umbral ms o si ese plan, en movimientos
+o cheques, no pasa por un índice de trigramas (sin pg_trgm o con el planner eligiendo otro
+camino). No escribe nada; correrlo sobre una copia con volumen real, con un término común
+(lo resuelve el primer paso) y con uno raro.
+
+    python -m main.bench_busqueda --termino pago --cuenta 1 [--n 50] [--umbral 50]
+"""
+import argparse
+import json
+import statistics
+import sys
+import time
+from datetime import date, timedelta
+
+from sqlalchemy import text
+from sqlmodel import Session
+
+from connection.data.db import engine
+from function.fbusqueda import (
+    _CHEQUES, _MOVIMIENTOS, _PROVEEDORES, _patron, buscar_cheques, buscar_movimientos, buscar_proveedores,
+)
+
+
+def _indices(plan: dict) -> set[str]:
+    encontrados = {plan["Index Name"]} if "Index Name" in plan else set()
+    for hijo in plan.get("Plans", []):
+        encontrados |= _indices(hijo)
+    return encontrados
+
+
+def _plan(session: Session, consulta, activos: list[str], params: dict) -> set[str]:
+    sql = str(consulta.sentencia(*activos))
+    plan = session.exec(text("EXPLAIN (FORMAT JSON) " + sql), params=params).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return _indices(plan[0]["Plan"])
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark de la búsqueda por texto")
+    parser.add_argument("--termino", required=True, help="texto a buscar (al menos 3 caracteres)")
+    parser.add_argument("--cuenta", type=int, default=None)
+    parser.add_argument("--n", type=int, default=50)
+    parser.add_argument("--umbral", type=float, default=50.0, help="p95 máximo en ms")
+    args = parser.parse_args()
+    t = args.termino
+    desde = date.today() - timedelta(days=90)
+    patron = _patron(t)
+
+    # (nombre, llamada, (consulta, filtros activos, parámetros) para el EXPLAIN, exige trigramas)
+    casos = [
+        ("movimientos texto", lambda s: buscar_movimientos(s, t),
+         (_MOVIMIENTOS, ["texto"], {"patron": patron, "limite": 50}), True),
+        ("movimientos texto+cuenta+fechas", lambda s: buscar_movimientos(s, t, cuenta_id=args.cuenta, desde=desde),
+         (_MOVIMIENTOS, ["texto", "desde"] + (["cuenta"] if args.cuenta is not None else []),
+          {"patron": patron, "cuenta": args.cuenta, "desde": desde, "limite": 50}), False),
+        ("movimientos referencia+tipo", lambda s: buscar_movimientos(s, t, "referencia", tipos=["DEPOSITO", "RETIRO"]),
+         (_MOVIMIENTOS, ["referencia", "tipos"], {"patron": patron, "tipos": ["DEPOSITO", "RETIRO"], "limite": 50}), True),
+        ("cheques beneficiario", lambda s: buscar_cheques(s, t),
+         (_CHEQUES, [], {"patron": patron, "limite": 50}), True),
+        ("proveedores nombre/nit", lambda s: buscar_proveedores(s, t),
+         (_PROVEEDORES, [], {"patron": patron, "limite": 50}), False),
+    ]
+
+    lento = False
+    with Session(engine) as s:
+        for nombre, fn, (consulta, activos, params), trigramas in casos:
+            for _ in range(3):  # calentamiento
+                fn(s)
+            tiempos = []
+            for _ in range(args.n):
+                inicio = time.perf_counter()
+                fn(s)
+                tiempos.append((time.perf_counter() - inicio) * 1000)
+            tiempos.sort()
+            p95 = tiempos[min(len(tiempos) - 1, int(len(tiempos) * 0.95))]
+            lento |= p95 > args.umbral
+            usados = _plan(s, consulta, activos, params)
+            # con cuenta y fechas el rango ya acota; proveedores es chica: ahí otro plan puede ser el correcto
+            sin_trigramas = trigramas and not any(i.endswith("_trgm") for i in usados)
+            lento |= sin_trigramas
+            indices = ", ".join(sorted(usados)) or "sin índices (seq scan)"
+            aviso = "  <- no usa trigramas" if sin_trigramas else ""
+            print(f"{nombre:<34} p50 {statistics.median(tiempos):7.1f} ms  p95 {p95:7.1f} ms  [{indices}]{aviso}")
+    return 1 if lento else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
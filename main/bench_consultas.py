@@ -0,0 +1,127 @@
+"""
+Costo por llamada de las consultas dinámicas (historial de pagos, facturas pagadas, cheques,
+conciliaciones): SQL armado en cada llamada vs sentencia cacheada, con y sin prepared
+statements de psycopg. El SQL armado con los mismos filtros también sale igual en cada
+llamada, así que psycopg lo prepara igual (por defecto a la 5ª ejecución): la comparación
+que mide el cache de sentencias es armado+prepare vs cacheada+prepare. Usa POSTGRES_URL;
+no escribe nada.
+
+    python -m main.bench_consultas [--n 2000] [--cuenta 1]
+"""
+import argparse
+import statistics
+import time
+from datetime import date, timedelta
+
+from sqlalchemy import create_engine, text
+from sqlmodel import Session
+
+from connection.data.db import DB_URL, _connect_args
+from function.fcheques import consultar_cheques
+from function.fconsiliaciones import _CONCILIACIONES
+from function.freportes import facturas_pagadas_por_fecha, historial_pagos
+
+
+def _armado_historial(session: Session, proveedor_id, fecha_inicio, limite):
+    # como se hacía antes: f-string + text() en cada llamada
+    lista, params = [], {"limite": limite}
+    if proveedor_id is not None:
+        lista.append("p.proveedor_id = :prov"); params["prov"] = proveedor_id
+    if fecha_inicio is not None:
+        lista.append("p.fecha_pago >= :fecha_inicio"); params["fecha_inicio"] = fecha_inicio
+    where_clause = (" WHERE " + " AND ".join(lista)) if lista else ""
+    q = text(f"""
+        SELECT p.pago_id, p.proveedor_id, pr.nombre AS proveedor, p.factura_id, p.id_cuenta_bancaria,
+               p.monto_pagado, p.fecha_pago, p.forma, p.referencia_banco, p.observacion
+        FROM bancos.pagos_proveedor p
+        JOIN bancos.proveedores pr ON pr.proveedor_id = p.proveedor_id
+        {where_clause}
+        ORDER BY p.fecha_pago DESC
+        LIMIT :limite
+    """)
+    return [dict(r._mapping) for r in session.exec(q, params=params).all()]
+
+
+def _armado_cheques(session: Session, cuenta_id, estado):
+    sql, params = "SELECT * FROM bancos.cheques WHERE 1=1", {}
+    if cuenta_id is not None:
+        sql += " AND id_cuenta_bancaria = :c"; params["c"] = cuenta_id
+    if estado is not None:
+        sql += " AND estado = :e"; params["e"] = estado
+    sql += " ORDER BY id_cheque DESC LIMIT 200"
+    return [dict(r._mapping) for r in session.exec(text(sql), params=params).all()]
+
+
+def _medir(variantes: list[tuple[str, object, object]], n: int, rondas: int = 5) -> list[float]:
+    """
+    variantes: (nombre, prepare_threshold, fn). Se miden intercaladas en `rondas` rondas de
+    n/rondas llamadas y se reporta la mediana: con una sola pasada por variante el ruido de la
+    máquina pesa más que la diferencia entre ellas.
+    """
+    abiertas = []
+    for nombre, umbral, fn in variantes:
+        eng = create_engine(DB_URL, connect_args=_connect_args(prepare_threshold=umbral))
+        s = Session(eng)
+        for _ in range(20):  # calentamiento: conexión, caches, preparación
+            fn(s)
+        abiertas.append((eng, s, fn, []))
+    por_ronda = max(1, n // rondas)
+    for _ in range(rondas):
+        for eng, s, fn, tiempos in abiertas:
+            inicio = time.perf_counter()
+            for _ in range(por_ronda):
+                fn(s)
+            tiempos.append((time.perf_counter() - inicio) / por_ronda * 1e6)
+    resultado = []
+    for (nombre, _, _), (eng, s, _, tiempos) in zip(variantes, abiertas):
+        s.close(); eng.dispose()
+        us = statistics.median(tiempos)
+        print(f"  {nombre:<32} {us:9.1f} µs/llamada")
+        resultado.append(us)
+    return resultado
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark de consultas dinámicas")
+    parser.add_argument("--n", type=int, default=2000)
+    parser.add_argument("--cuenta", type=int, default=1)
+    args = parser.parse_args()
+    desde = date.today() - timedelta(days=30)
+
+    # sin el cache de reportes: se mide la consulta, no el cache
+    historial = historial_pagos.__wrapped__
+    facturas = facturas_pagadas_por_fecha.__wrapped__
+
+    casos = [
+        ("historial_pagos",
+         lambda s: _armado_historial(s, 1, desde, 50),
+         lambda s: historial(s, 1, desde, None, 50)),
+        ("listar_cheques",
+         lambda s: _armado_cheques(s, args.cuenta, "EMITIDO"),
+         lambda s: consultar_cheques(s, args.cuenta, "EMITIDO")),
+    ]
+    for nombre, armado, cacheado in casos:
+        print(nombre)
+        base, base_prep, cache, prep = _medir([
+            ("armado por llamada, sin prepare", None, armado),
+            ("armado por llamada + prepare", 0, armado),
+            ("sentencia cacheada, sin prepare", None, cacheado),
+            ("sentencia cacheada + prepare", 0, cacheado),
+        ], args.n)
+        print(f"  cache de sentencias: {100 * (base - cache) / base:5.1f}% sin prepare, "
+              f"{100 * (base_prep - prep) / base_prep:5.1f}% con prepare")
+        print(f"  prepare: {100 * (base - base_prep) / base:5.1f}% armado, {100 * (cache - prep) / cache:5.1f}% cacheada")
+
+    print("facturas_pagadas")
+    _medir([
+        ("sentencia cacheada, sin prepare", None, lambda s: facturas(s, None, desde, None, 50)),
+        ("sentencia cacheada + prepare", 0, lambda s: facturas(s, None, desde, None, 50)),
+    ], args.n)
+    print("listar_conciliaciones")
+    _medir([("sentencia cacheada + prepare", 0,
+             lambda s: _CONCILIACIONES.ejecutar(s, {"desde": {"desde": desde}, "hasta": None}, id=args.cuenta, limit=100))],
+           args.n)
+
+
+if __name__ == "__main__":
+    main()
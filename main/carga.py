@@ -0,0 +1,97 @@
+"""
+Prueba de carga contra una API levantada: clientes concurrentes (cada uno con su propio sub
+en el JWT) mezclando escrituras (depósitos de 0.01), lecturas (saldo) y reportes (búsqueda de
+movimientos). Reporta por clase aceptados / 429 / 503 / errores y p50-p95-p99 de latencia, para
+ver que con el control de admisión las escrituras mantienen la cola acotada.
+
+    python -m main.carga --url http://localhost:8000 --cuenta 1 --clientes 60 --segundos 30 \\
+        [--pct-escrituras 20] [--pct-reportes 30] [--termino prueba]
+
+Firma los tokens con JWT_SECRET (igual que services/seguridad_cliente); escribe movimientos:
+usar una BD de prueba.
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import sys
+import time
+from collections import defaultdict
+
+import httpx
+import jwt
+
+from services.seguridad_cliente import JWT_ALG, JWT_SECRET
+
+
+def _percentil(valores: list[float], p: float) -> float:
+    if not valores:
+        return 0.0
+    valores = sorted(valores)
+    return valores[min(len(valores) - 1, int(len(valores) * p))]
+
+
+async def _cliente(n: int, args, fin: float, resultados: dict) -> None:
+    token = jwt.encode({"sub": f"carga-{n}", "nombre": f"carga {n}", "rol": "ADMIN"}, JWT_SECRET, algorithm=JWT_ALG)
+    headers = {"Authorization": f"Bearer {token}"}
+    async with httpx.AsyncClient(base_url=args.url, headers=headers, timeout=60) as http:
+        while time.monotonic() < fin:
+            r = random.uniform(0, 100)
+            if r < args.pct_escrituras:
+                clase, req = "escritura", http.post("/admin/bancos/movimientos", json={
+                    "id_cuenta_bancaria": args.cuenta, "tipo_mov": "DEPOSITO", "monto": "0.01",
+                    "referencia": f"carga {n}"})
+            elif r < args.pct_escrituras + args.pct_reportes:
+                clase, req = "reporte", http.get("/admin/busqueda/movimientos", params={
+                    "q": args.termino, "limite": 200})
+            else:
+                clase, req = "lectura", http.get(f"/admin/bancos/saldos/{args.cuenta}")
+            inicio = time.monotonic()
+            try:
+                resp = await req
+                codigo = resp.status_code
+            except httpx.HTTPError:
+                codigo = 0
+            dur = (time.monotonic() - inicio) * 1000
+            resultados[clase].append((codigo, dur))
+            if codigo in (429, 503):
+                # un cliente bien portado respeta Retry-After (acotado para que la prueba avance)
+                await asyncio.sleep(min(float(resp.headers.get("Retry-After", "1")), 2.0) * random.uniform(0.5, 1.0))
+
+
+async def _correr(args) -> dict:
+    resultados: dict[str, list] = defaultdict(list)
+    fin = time.monotonic() + args.segundos
+    await asyncio.gather(*(_cliente(n, args, fin, resultados) for n in range(args.clientes)))
+    return resultados
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Prueba de carga de la API")
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--cuenta", type=int, required=True)
+    parser.add_argument("--clientes", type=int, default=50)
+    parser.add_argument("--segundos", type=float, default=30)
+    parser.add_argument("--pct-escrituras", type=float, default=20)
+    parser.add_argument("--pct-reportes", type=float, default=30)
+    parser.add_argument("--termino", default="prueba")
+    args = parser.parse_args()
+
+    resultados = asyncio.run(_correr(args))
+    print(f"{'clase':<10} {'total':>6} {'ok':>6} {'429':>5} {'503':>5} {'otros':>5}   "
+          f"{'p50 ok':>8} {'p95 ok':>8} {'p99 ok':>8} {'max ok':>8}  (ms)")
+    for clase in ("escritura", "lectura", "reporte"):
+        filas = resultados.get(clase, [])
+        ok = [d for c, d in filas if 200 <= c < 300]
+        cuenta = defaultdict(int)
+        for c, _ in filas:
+            cuenta[c] += 1
+        otros = len(filas) - len(ok) - cuenta[429] - cuenta[503]
+        print(f"{clase:<10} {len(filas):>6} {len(ok):>6} {cuenta[429]:>5} {cuenta[503]:>5} {otros:>5}   "
+              f"{statistics.median(ok) if ok else 0:>8.0f} {_percentil(ok, .95):>8.0f} "
+              f"{_percentil(ok, .99):>8.0f} {max(ok) if ok else 0:>8.0f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
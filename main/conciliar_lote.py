@@ -0,0 +1,48 @@
+"""
+Conciliación en lote desde la línea de comandos.
+
+    python -m main.conciliar_lote cierre.csv [--bandera] [--workers 2]
+
+--workers no pasa de CONCILIACION_WORKERS ni de la mitad del pool.
+
+El CSV lleva encabezado: id_cuenta_bancaria,fecha_conciliacion,saldo_banco[,observaciones]
+"""
+import argparse
+import csv
+import json
+import sys
+from datetime import date
+from decimal import Decimal
+
+from connection.models.modelos import ConciliacionLoteItem
+from function.fconsiliaciones import conciliar_lote
+
+
+def leer_items(ruta: str) -> list[ConciliacionLoteItem]:
+    with open(ruta, newline="", encoding="utf-8") as fh:
+        return [
+            ConciliacionLoteItem(
+                id_cuenta_bancaria=int(fila["id_cuenta_bancaria"]),
+                fecha_conciliacion=date.fromisoformat(fila["fecha_conciliacion"]) if fila.get("fecha_conciliacion") else None,
+                saldo_banco=Decimal(fila["saldo_banco"]),
+                observaciones=fila.get("observaciones") or None,
+            )
+            for fila in csv.DictReader(fh)
+        ]
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Conciliación bancaria en lote")
+    parser.add_argument("archivo", help="CSV con las cuentas a conciliar")
+    parser.add_argument("--bandera", action="store_true", help="solo calcula, no marca ni inserta")
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    reporte = conciliar_lote(leer_items(args.archivo), bandera=args.bandera, max_workers=args.workers)
+    json.dump(reporte, sys.stdout, indent=2, ensure_ascii=False, default=str)
+    sys.stdout.write("\n")
+    return 0 if reporte["fallidas"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
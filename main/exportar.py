@@ -0,0 +1,48 @@
+"""
+Exporta movimientos o pagos de un rango de fechas a Parquet o Arrow IPC y reporta el
+rendimiento (filas/s, MB/s) y la memoria máxima del proceso, que no debe crecer con el rango.
+Lee de POSTGRES_READ_URL si está configurada.
+
+    python -m main.exportar movimientos --desde 2025-01-01 --hasta 2025-12-31 --salida movs.parquet
+    python -m main.exportar pagos --desde 2025-01-01 --hasta 2025-03-31 --formato arrow --salida pagos.arrow
+"""
+import argparse
+import os
+import resource
+import sys
+import time
+from datetime import date
+
+from connection.data.db import elegir_engine_lectura, settings
+from function.fexportacion import DATASETS, FORMATOS, escribir, validar_exportacion
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Exportación columnar del libro")
+    parser.add_argument("dataset", choices=DATASETS)
+    parser.add_argument("--desde", type=date.fromisoformat, required=True)
+    parser.add_argument("--hasta", type=date.fromisoformat, required=True)
+    parser.add_argument("--salida", required=True)
+    parser.add_argument("--formato", choices=FORMATOS, default="parquet")
+    parser.add_argument("--compresion", default=settings.EXPORT_COMPRESION)
+    parser.add_argument("--filas-lote", type=int, default=settings.EXPORT_FILAS_LOTE)
+    args = parser.parse_args()
+
+    validar_exportacion(args.dataset, args.desde, args.hasta, args.formato)
+    inicio = time.perf_counter()
+    total = 0
+    for filas in escribir(elegir_engine_lectura(), args.dataset, args.desde, args.hasta, args.salida,
+                          args.formato, args.compresion, args.filas_lote):
+        total += filas
+        print(f"\r{total} filas", end="", file=sys.stderr, flush=True)
+    dur = time.perf_counter() - inicio
+    mb = os.path.getsize(args.salida) / 1e6
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024   # KB en Linux
+    print(file=sys.stderr)
+    print(f"{total} filas -> {args.salida} ({mb:.1f} MB) en {dur:.2f}s: "
+          f"{total / dur if dur else 0:,.0f} filas/s, {mb / dur if dur else 0:.1f} MB/s, memoria máx {rss:.0f} MB")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
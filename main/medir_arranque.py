@@ -0,0 +1,88 @@
+"""
+Mide el arranque en frío de la API: levanta uvicorn en un puerto libre y toma el tiempo hasta
+que responde /health (proceso vivo), hasta que /ready da 200 (calentado) y la latencia del
+primer y del segundo request a un endpoint real. Repite `--veces` y muestra la mediana.
+
+    python -m main.medir_arranque --cuenta 1 [--veces 5] [--sin-calentar]
+
+Usa POSTGRES_URL y JWT_SECRET del entorno, igual que la API.
+"""
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+
+import httpx
+import jwt
+
+from services.seguridad_cliente import JWT_ALG, JWT_SECRET
+
+
+def _puerto_libre() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _esperar(http: httpx.Client, ruta: str, inicio: float, limite: float) -> float:
+    while time.perf_counter() - inicio < limite:
+        try:
+            if http.get(ruta).status_code == 200:
+                return time.perf_counter() - inicio
+        except httpx.TransportError:
+            pass
+        time.sleep(0.01)
+    raise TimeoutError(f"{ruta} no respondió 200 en {limite}s")
+
+
+def medir(cuenta: int, calentar: bool, limite: float) -> dict:
+    puerto = _puerto_libre()
+    entorno = dict(os.environ, ARRANQUE_CALENTAR="1" if calentar else "0")
+    token = jwt.encode({"sub": "medir-arranque", "rol": "ADMIN"}, JWT_SECRET, algorithm=JWT_ALG)
+    inicio = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main.app:app", "--port", str(puerto), "--log-level", "warning"],
+        env=entorno, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        with httpx.Client(base_url=f"http://127.0.0.1:{puerto}", timeout=30,
+                          headers={"Authorization": f"Bearer {token}"}) as http:
+            vivo = _esperar(http, "/health", inicio, limite)
+            listo = _esperar(http, "/ready", inicio, limite)
+            latencias = []
+            for _ in range(2):
+                t = time.perf_counter()
+                r = http.get(f"/admin/bancos/saldos/{cuenta}")
+                r.raise_for_status()
+                latencias.append(time.perf_counter() - t)
+    finally:
+        proc.terminate()
+        proc.wait(10)
+    return {"vivo": vivo, "listo": listo, "primero": latencias[0], "segundo": latencias[1]}
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Tiempo de arranque en frío de la API")
+    parser.add_argument("--cuenta", type=int, required=True, help="cuenta para el request de prueba")
+    parser.add_argument("--veces", type=int, default=5)
+    parser.add_argument("--sin-calentar", action="store_true", help="ARRANQUE_CALENTAR=0 para comparar")
+    parser.add_argument("--limite", type=float, default=60, help="segundos máximos esperando cada paso")
+    args = parser.parse_args()
+
+    corridas = []
+    for n in range(1, args.veces + 1):
+        m = medir(args.cuenta, not args.sin_calentar, args.limite)
+        corridas.append(m)
+        print(f"#{n}: vivo {m['vivo'] * 1000:.0f} ms  listo {m['listo'] * 1000:.0f} ms  "
+              f"primer request {m['primero'] * 1000:.1f} ms  segundo {m['segundo'] * 1000:.1f} ms")
+    mediana = {k: statistics.median(c[k] for c in corridas) for k in corridas[0]}
+    print(f"mediana: vivo {mediana['vivo'] * 1000:.0f} ms  listo {mediana['listo'] * 1000:.0f} ms  "
+          f"primer request {mediana['primero'] * 1000:.1f} ms  segundo {mediana['segundo'] * 1000:.1f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
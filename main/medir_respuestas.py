@@ -0,0 +1,95 @@
+"""
+Mide respuestas grandes: para cada endpoint compara JSON y NDJSON sin comprimir, gzip y br.
+Toma los bytes que viajan por la red, el tiempo al primer byte y total, y el pico de memoria
+(RSS) del proceso de la API durante el request. Levanta su propio uvicorn (Linux: el pico se
+lee de /proc/<pid>/status y se reinicia con clear_refs).
+
+    python -m main.medir_respuestas --cuenta 1 --hasta 2026-12-31 [--limite 100000]
+
+Usa POSTGRES_URL y JWT_SECRET del entorno, igual que la API.
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+import httpx
+import jwt
+
+from main.medir_arranque import _esperar, _puerto_libre
+from services.seguridad_cliente import JWT_ALG, JWT_SECRET
+
+
+def _kb(campo: str, pid: int) -> int:
+    with open(f"/proc/{pid}/status") as f:
+        for linea in f:
+            if linea.startswith(campo + ":"):
+                return int(linea.split()[1])
+    return 0
+
+
+def _medir(http: httpx.Client, pid: int, ruta: str, params: dict, formato: str, codificacion: str) -> dict:
+    with open(f"/proc/{pid}/clear_refs", "w") as f:
+        f.write("5")   # reinicia VmHWM (pico de RSS) al RSS actual
+    base = _kb("VmRSS", pid)
+    inicio = time.perf_counter()
+    primer_byte, bytes_red, filas = None, 0, 0
+    with http.stream("GET", ruta, params={**params, "formato": formato},
+                     headers={"Accept-Encoding": codificacion}) as r:
+        r.raise_for_status()
+        for parte in r.iter_raw():
+            if primer_byte is None:
+                primer_byte = time.perf_counter() - inicio
+            bytes_red += len(parte)
+        codificado = r.headers.get("content-encoding", "identity")
+    total = time.perf_counter() - inicio
+    return {"red": bytes_red, "ttfb": primer_byte or total, "total": total,
+            "pico_mb": (_kb("VmHWM", pid) - base) / 1024, "codificado": codificado}
+
+
+def _caso(ruta: str, params: dict, formato: str, codificacion: str) -> dict:
+    puerto = _puerto_libre()
+    # sin cache de reportes ni admisión: se mide el trabajo completo de cada request
+    entorno = dict(os.environ, REPORT_CACHE_BACKEND="ninguno", ADMISION_ACTIVA="0")
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main.app:app", "--port", str(puerto), "--log-level", "warning"],
+        env=entorno, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    token = jwt.encode({"sub": "medir-respuestas", "rol": "ADMIN"}, JWT_SECRET, algorithm=JWT_ALG)
+    try:
+        with httpx.Client(base_url=f"http://127.0.0.1:{puerto}", timeout=300,
+                          headers={"Authorization": f"Bearer {token}"}) as http:
+            _esperar(http, "/ready", time.perf_counter(), 60)
+            return _medir(http, proc.pid, ruta, params, formato, codificacion)
+    finally:
+        proc.terminate()
+        proc.wait(10)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Bytes en la red y memoria de respuestas grandes")
+    parser.add_argument("--cuenta", type=int, required=True, help="cuenta para partidas-pendientes")
+    parser.add_argument("--hasta", required=True, help="fecha de corte de partidas-pendientes (YYYY-MM-DD)")
+    parser.add_argument("--limite", type=int, default=100000, help="filas de los reportes")
+    args = parser.parse_args()
+
+    casos = [
+        ("/admin/reportes/historial_pagos", {"limite": args.limite}),
+        ("/admin/reportes/facturas_pagadas", {"limite": args.limite}),
+        ("/admin/conciliaciones/partidas-pendientes", {"id_cuenta_bancaria": args.cuenta, "hasta": args.hasta}),
+    ]
+    print(f"{'endpoint':<42} {'formato':<7} {'enc':<8} {'en la red':>12} {'ttfb ms':>8} "
+          f"{'total ms':>9} {'pico MB':>8}")
+    for ruta, params in casos:
+        for formato in ("json", "ndjson"):
+            for codificacion in ("identity", "gzip", "br"):
+                # un proceso nuevo por caso: la memoria que dejó un request anterior taparía el pico
+                m = _caso(ruta, params, formato, codificacion)
+                print(f"{ruta:<42} {formato:<7} {m['codificado']:<8} {m['red']:>12,} "
+                      f"{m['ttfb'] * 1000:>8.0f} {m['total'] * 1000:>9.0f} {m['pico_mb']:>8.1f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,111 @@
+"""
+Prueba el cliente de compras contra el stub (main/stub_compras.py): coalescencia, cache de
+proveedores, pool de conexiones, reintentos y circuito. Termina con código 1 si algo falla.
+
+    uvicorn main.stub_compras:app --port 8100 &
+    python -m main.probar_compras --url http://localhost:8100
+"""
+import argparse
+import asyncio
+import sys
+import time
+
+import httpx
+from fastapi import HTTPException
+
+from connection.data.db import settings
+from services.compras_cliente import Circuito, ClienteCompras
+
+_resultados: list[bool] = []
+
+
+def _chequear(nombre: str, ok: bool, detalle: str) -> None:
+    _resultados.append(ok)
+    print(f"[{'OK' if ok else 'FALLA'}] {nombre}: {detalle}")
+
+
+async def _stub(http: httpx.AsyncClient, **config) -> None:
+    await http.post("/_stub/reiniciar")
+    if config:
+        await http.post("/_stub/config", json=config)
+
+
+async def _contador(http: httpx.AsyncClient, ruta: str) -> int:
+    return (await http.get("/_stub/contador")).json()["rutas"].get(ruta, 0)
+
+
+async def _status(coro) -> int:
+    try:
+        await coro
+        return 200
+    except HTTPException as e:
+        return e.status_code
+
+
+async def _probar(url: str, concurrencia: int) -> None:
+    cliente = ClienteCompras(url)
+    cliente.circuito = Circuito(fallas=3, espera=2.0)
+    async with httpx.AsyncClient(base_url=url) as stub:
+        # coalescencia: N pedidos iguales a la vez -> 1 request al servicio
+        await _stub(stub, latencia=0.2)
+        await asyncio.gather(*(cliente.facturas_proveedor(7) for _ in range(concurrencia)))
+        n = await _contador(stub, "/proveedores/7/facturas")
+        _chequear("coalescencia", n == 1, f"{concurrencia} pedidos simultáneos -> {n} request(s)")
+
+        # cache: la segunda ronda no sale del proceso
+        await _stub(stub, latencia=0.05)
+        await asyncio.gather(*(cliente.proveedor(5) for _ in range(concurrencia)))
+        await asyncio.gather(*(cliente.proveedor(5) for _ in range(concurrencia)))
+        n = await _contador(stub, "/proveedores/5")
+        _chequear("cache de proveedores", n == 1, f"2 rondas de {concurrencia} -> {n} request(s)")
+
+        # pool: muchos distintos en paralelo tardan ~ (n / conexiones) * latencia
+        await _stub(stub, latencia=0.05)
+        ids = list(range(100, 100 + concurrencia * 2))
+        inicio = time.perf_counter()
+        encontrados = await cliente.proveedores(ids)
+        dur = time.perf_counter() - inicio
+        serie = len(ids) * 0.05
+        _chequear("pool de conexiones", len(encontrados) == len(ids) and dur < serie / 2,
+                  f"{len(ids)} proveedores en {dur:.2f}s (en serie serían {serie:.1f}s, http2={cliente.http2})")
+
+        # reintentos: un 503 del servicio se reintenta RETRIES veces y termina en 502
+        await _stub(stub, fallar=True, codigo=503)
+        codigo = await _status(cliente.factura(1))
+        n = await _contador(stub, "/facturas/1")
+        _chequear("reintentos", codigo == 502 and n == settings.RETRIES + 1,
+                  f"{n} intentos (RETRIES={settings.RETRIES}), respuesta {codigo}")
+
+        # circuito: con fallas seguidas se abre y deja de llamar al servicio
+        for i in range(2, 5):
+            await _status(cliente.factura(i))
+        antes = (await stub.get("/_stub/contador")).json()["total"]
+        inicio = time.perf_counter()
+        codigos = [await _status(cliente.factura(9)) for _ in range(20)]
+        dur = time.perf_counter() - inicio
+        despues = (await stub.get("/_stub/contador")).json()["total"]
+        _chequear("circuito abierto", set(codigos) == {503} and despues == antes,
+                  f"estado={cliente.circuito.estado}, 20 llamadas -> {despues - antes} requests, {dur * 1000:.1f} ms")
+
+        # cuando el servicio vuelve, el request de prueba cierra el circuito
+        await _stub(stub)
+        await asyncio.sleep(cliente.circuito.espera + 0.1)
+        codigo = await _status(cliente.factura(9))
+        _chequear("circuito se recupera", codigo == 200 and cliente.circuito.estado == Circuito.CERRADO,
+                  f"respuesta {codigo}, estado={cliente.circuito.estado}")
+        await _stub(stub)
+    print(cliente.estado())
+    await cliente.cerrar()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Prueba el cliente de compras contra el stub")
+    parser.add_argument("--url", default=settings.INVENTORY_URL)
+    parser.add_argument("--concurrencia", type=int, default=50)
+    args = parser.parse_args()
+    asyncio.run(_probar(args.url, args.concurrencia))
+    return 0 if all(_resultados) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
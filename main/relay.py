@@ -0,0 +1,63 @@
+"""
+Relay del outbox (bancos.eventos_outbox): publica los eventos confirmados en el sink
+configurado (OUTBOX_SINK = archivo | webhook).
+
+    python -m main.relay
+
+Entrega al menos una vez y en orden de commit; levantar uno solo para conservar el orden.
+"""
+import logging
+import signal
+import time
+
+from sqlmodel import Session
+
+from connection.data.db import engine, settings
+from function.foutbox import crear_sink, publicar_pendientes, purgar_publicados
+
+logger = logging.getLogger("bancos.relay")
+logging.basicConfig(level=logging.INFO)
+
+_detener = False
+
+
+def _senal(signum, frame):
+    global _detener
+    logger.info("Señal %s recibida, terminando después del lote actual", signum)
+    _detener = True
+
+
+def main() -> None:
+    signal.signal(signal.SIGTERM, _senal)
+    signal.signal(signal.SIGINT, _senal)
+    sink = crear_sink()
+    logger.info("Relay iniciado (sink=%s, lote=%s)", settings.OUTBOX_SINK, settings.OUTBOX_LOTE)
+
+    espera, ultima_purga = settings.OUTBOX_POLL, 0.0
+    while not _detener:
+        try:
+            with Session(engine) as session:
+                if time.monotonic() - ultima_purga > 3600:
+                    n = purgar_publicados(session, settings.OUTBOX_RETENCION_DIAS)
+                    if n:
+                        logger.info("%s eventos publicados purgados", n)
+                    ultima_purga = time.monotonic()
+                inicio = time.perf_counter()
+                n = publicar_pendientes(session, sink, settings.OUTBOX_LOTE)
+        except Exception:
+            # backoff mientras el sink no responde
+            logger.exception("Error publicando eventos")
+            time.sleep(espera)
+            espera = min(espera * 2, 60.0)
+            continue
+
+        espera = settings.OUTBOX_POLL
+        if n:
+            logger.info("%s eventos publicados en %.3fs", n, time.perf_counter() - inicio)
+        # lote lleno: probablemente hay más, no se duerme
+        if n < settings.OUTBOX_LOTE:
+            time.sleep(settings.OUTBOX_POLL)
+
+
+if __name__ == "__main__":
+    main()
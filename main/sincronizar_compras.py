@@ -0,0 +1,33 @@
+"""
+Sincronización incremental de proveedores y facturas desde el servicio de compras (ver
+function/fsincronizacion.py). Pensado para cron; también existe como trabajo
+"sincronizar_compras" para main.worker. Imprime filas recibidas/aplicadas/rechazadas y filas por segundo.
+
+    python -m main.sincronizar_compras [--recursos proveedores facturas] [--lote 2000] [--url http://localhost:8100]
+"""
+import argparse
+import json
+import sys
+
+from sqlmodel import Session
+
+from connection.data.db import engine
+from function.fsincronizacion import sincronizar_compras
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Sincronización incremental desde compras")
+    parser.add_argument("--recursos", nargs="+", choices=["proveedores", "facturas"], default=None)
+    parser.add_argument("--lote", type=int, default=None, help="cambios por página (por defecto SYNC_COMPRAS_LOTE)")
+    parser.add_argument("--url", default=None, help="servicio de compras (por defecto INVENTORY_URL)")
+    args = parser.parse_args()
+
+    with Session(engine) as s:
+        reporte = sincronizar_compras(s, args.recursos, args.lote, args.url)
+    json.dump(reporte, sys.stdout, indent=2, ensure_ascii=False, default=str)
+    sys.stdout.write("\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
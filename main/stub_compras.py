@@ -0,0 +1,176 @@
+"""
+Servicio de compras de mentira para desarrollo y pruebas del cliente (services/compras_cliente.py):
+proveedores y facturas generados en memoria, con latencia y fallas configurables en caliente.
+
+    uvicorn main.stub_compras:app --port 8100
+    STUB_PROVEEDORES=2000 STUB_FACTURAS_POR_PROVEEDOR=20 uvicorn main.stub_compras:app --port 8100
+
+Control: POST /_stub/config {"latencia": 0.05, "fallar": true, "codigo": 503}, GET /_stub/contador,
+POST /_stub/reiniciar, POST /_stub/modificar {"recurso": "facturas", "cantidad": 100} (cambia
+registros al azar para que aparezcan en GET /cambios/{recurso}).
+"""
+import asyncio
+import os
+import random
+from collections import Counter
+from datetime import date, datetime, timedelta
+from typing import Literal, Optional
+
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+N_PROVEEDORES = int(os.getenv("STUB_PROVEEDORES", "1000"))
+FACTURAS_POR_PROVEEDOR = int(os.getenv("STUB_FACTURAS_POR_PROVEEDOR", "10"))
+_INICIO = datetime(2025, 1, 1)
+
+# registros modificados con POST /_stub/modificar: id -> (cuándo, versión)
+_modificados: dict[str, dict[int, tuple[datetime, int]]] = {"proveedores": {}, "facturas": {}}
+
+
+def _actualizado(recurso: str, i: int) -> datetime:
+    mod = _modificados[recurso].get(i)
+    return mod[0] if mod else _INICIO + timedelta(minutes=i)
+
+
+def _version(recurso: str, i: int) -> int:
+    mod = _modificados[recurso].get(i)
+    return mod[1] if mod else 0
+
+
+def _proveedor(i: int) -> dict:
+    version = _version("proveedores", i)
+    return {
+        "proveedor_id": i,
+        "nombre": f"Proveedor {i:05d}" + (f" v{version}" if version else ""),
+        "nit": f"{i:08d}-{i % 10}",
+        "telefono": f"5{i % 10_000_000:07d}",
+        "correo": f"proveedor{i}@compras.test",
+        "activo": i % 17 != 0,
+        "criticidad": 1 + i % 5,
+        "actualizado_en": _actualizado("proveedores", i).isoformat(),
+    }
+
+
+def _factura(i: int) -> dict:
+    proveedor_id = 1 + (i - 1) // FACTURAS_POR_PROVEEDOR
+    emision = date(2025, 1, 1) + timedelta(days=i % 300)
+    return {
+        "factura_id": i,
+        "proveedor_id": proveedor_id,
+        "numero_factura": f"F-{proveedor_id:05d}-{i:07d}",
+        "fecha_emision": emision.isoformat(),
+        "fecha_vencimiento": (emision + timedelta(days=30)).isoformat(),
+        "moneda_id": 1,
+        "monto_total": f"{100 + (i * 37) % 9900 + 10 * _version('facturas', i)}.{i % 100:02d}",
+        "descuento_pronto_pago": "2.00" if i % 4 == 0 else "0.00",
+        "fecha_limite_descuento": (emision + timedelta(days=10)).isoformat() if i % 4 == 0 else None,
+        "anulada": False,
+        "actualizado_en": _actualizado("facturas", i).isoformat(),
+    }
+
+
+_RECURSOS = {
+    "proveedores": (N_PROVEEDORES, _proveedor),
+    "facturas": (N_PROVEEDORES * FACTURAS_POR_PROVEEDOR, _factura),
+}
+
+
+class Config(BaseModel):
+    latencia: Optional[float] = None
+    fallar: Optional[bool] = None
+    codigo: Optional[int] = None
+
+
+class Modificar(BaseModel):
+    recurso: Literal["proveedores", "facturas"]
+    cantidad: int = 100
+
+
+_config = {"latencia": float(os.getenv("STUB_LATENCIA", "0.0")), "fallar": False, "codigo": 503}
+contador: Counter = Counter()
+
+app = FastAPI(title="stub compras")
+
+
+@app.middleware("http")
+async def _simular(request: Request, call_next):
+    if request.url.path.startswith("/_stub"):
+        return await call_next(request)
+    contador[request.url.path] += 1
+    if _config["latencia"]:
+        await asyncio.sleep(_config["latencia"])
+    if _config["fallar"]:
+        return JSONResponse({"detail": "falla simulada"}, status_code=_config["codigo"])
+    return await call_next(request)
+
+
+@app.post("/_stub/config")
+def configurar(cfg: Config):
+    _config.update({k: v for k, v in cfg.model_dump().items() if v is not None})
+    return _config
+
+
+@app.get("/_stub/contador")
+def ver_contador():
+    return {"total": sum(contador.values()), "rutas": dict(contador)}
+
+
+@app.post("/_stub/reiniciar")
+def reiniciar():
+    contador.clear()
+    for mod in _modificados.values():
+        mod.clear()
+    _config.update({"latencia": 0.0, "fallar": False, "codigo": 503})
+    return _config
+
+
+@app.get("/proveedores/{proveedor_id}")
+def proveedor(proveedor_id: int):
+    if not 1 <= proveedor_id <= N_PROVEEDORES:
+        raise HTTPException(404, "no existe")
+    return _proveedor(proveedor_id)
+
+
+@app.get("/proveedores/{proveedor_id}/facturas")
+def facturas_proveedor(proveedor_id: int, estado: Optional[str] = None):
+    if not 1 <= proveedor_id <= N_PROVEEDORES:
+        raise HTTPException(404, "no existe")
+    inicio = (proveedor_id - 1) * FACTURAS_POR_PROVEEDOR + 1
+    return [_factura(i) for i in range(inicio, inicio + FACTURAS_POR_PROVEEDOR)]
+
+
+@app.get("/facturas/{factura_id}")
+def factura(factura_id: int):
+    if not 1 <= factura_id <= N_PROVEEDORES * FACTURAS_POR_PROVEEDOR:
+        raise HTTPException(404, "no existe")
+    return _factura(factura_id)
+
+
+@app.post("/_stub/modificar")
+def modificar(m: Modificar):
+    total, _ = _RECURSOS[m.recurso]
+    ahora = datetime.now()
+    ids = random.sample(range(1, total + 1), min(m.cantidad, total))
+    for i in ids:
+        _modificados[m.recurso][i] = (ahora, _version(m.recurso, i) + 1)
+    return {"recurso": m.recurso, "modificados": len(ids), "actualizado_en": ahora.isoformat()}
+
+
+@app.get("/cambios/{recurso}")
+def cambios(recurso: Literal["proveedores", "facturas"], desde: Optional[datetime] = None,
+            despues_id: int = 0, limite: int = 1000):
+    """ registros con (actualizado_en, id) posterior a (desde, despues_id), en ese orden """
+    total, generar = _RECURSOS[recurso]
+    modificados = _modificados[recurso]
+    posicion = (desde or datetime.min, despues_id)
+    # los no modificados tienen actualizado_en creciente con el id: se arranca en el primero
+    i = max(1, (posicion[0] - _INICIO) // timedelta(minutes=1)) if posicion[0] > _INICIO else 1
+    base = []
+    while len(base) < limite and i <= total:
+        if i not in modificados and (_actualizado(recurso, i), i) > posicion:
+            base.append((_actualizado(recurso, i), i))
+        i += 1
+    otros = sorted((cuando, k) for k, (cuando, _) in modificados.items() if (cuando, k) > posicion)
+    claves = sorted(base + otros[:limite])[:limite]
+    return {"items": [generar(k) for _, k in claves]}
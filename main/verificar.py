@@ -0,0 +1,51 @@
+"""
+Verificador de integridad del libro (ver function/fverificacion.py): transferencias con un
+TRANSFERENCIA_OUT y un TRANSFERENCIA_IN del mismo monto, CHEQUE_EMITIDO con su cheque, y saldo
+y total pagado de cada factura contra sus pagos. Pensado para correr de noche: escribe los
+hallazgos en NDJSON (stdout o --salida), el resumen en stderr, y termina con código 1 si hay
+hallazgos o tramos con error.
+
+    python -m main.verificar [--verificaciones transferencias facturas] [--tramos 32] [--workers 8]
+"""
+import argparse
+import json
+import sys
+
+from connection.data.db import read_engine
+from function.fstreaming import lineas
+from function.fverificacion import VERIFICACIONES, verificar
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Verificador de integridad del libro")
+    parser.add_argument("--verificaciones", nargs="+", choices=list(VERIFICACIONES), default=None)
+    parser.add_argument("--tramos", type=int, default=None, help="tramos por verificación (VERIFICACION_TRAMOS)")
+    parser.add_argument("--workers", type=int, default=None, help="tramos en paralelo (VERIFICACION_WORKERS)")
+    parser.add_argument("--maximo", type=int, default=None, help="hallazgos máximos por tramo")
+    parser.add_argument("--salida", default=None, help="archivo NDJSON (por defecto stdout)")
+    args = parser.parse_args()
+
+    resumen: dict = {}
+
+    def _hallazgos():
+        for h in verificar(read_engine, args.verificaciones, args.tramos, args.workers, args.maximo):
+            if "resumen" in h:
+                resumen.update(h["resumen"])
+            else:
+                yield h
+
+    salida = open(args.salida, "wb") if args.salida else sys.stdout.buffer
+    try:
+        for parte in lineas(_hallazgos()):
+            salida.write(parte)
+    finally:
+        if args.salida:
+            salida.close()
+    json.dump(resumen, sys.stderr, indent=2, ensure_ascii=False)
+    sys.stderr.write("\n")
+    errores = sum(v["errores"] for v in resumen.get("verificaciones", {}).values())
+    return 1 if resumen.get("hallazgos") or errores else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
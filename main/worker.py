@@ -0,0 +1,60 @@
+"""
+Worker de la cola de trabajos (bancos.trabajos).
+
+    python -m main.worker
+
+Se pueden levantar varios; cada uno reclama trabajos con FOR UPDATE SKIP LOCKED.
+"""
+import logging
+import signal
+import time
+
+from sqlmodel import Session
+
+from connection.data.db import engine, settings
+from function.ftrabajos import tomar_trabajo, ejecutar_trabajo, reencolar_huerfanos
+
+logger = logging.getLogger("bancos.worker")
+logging.basicConfig(level=logging.INFO)
+
+_detener = False
+
+
+def _senal(signum, frame):
+    global _detener
+    logger.info("Señal %s recibida, terminando después del trabajo actual", signum)
+    _detener = True
+
+
+def main() -> None:
+    signal.signal(signal.SIGTERM, _senal)
+    signal.signal(signal.SIGINT, _senal)
+    logger.info("Worker iniciado (poll=%ss)", settings.TRABAJOS_POLL)
+
+    ultimo_barrido = 0.0
+    while not _detener:
+        try:
+            with Session(engine) as session:
+                if time.monotonic() - ultimo_barrido > settings.TRABAJOS_TIMEOUT / 2:
+                    n = reencolar_huerfanos(session)
+                    if n:
+                        logger.warning("%s trabajos huérfanos reencolados o cerrados como FALLIDO", n)
+                    ultimo_barrido = time.monotonic()
+                trabajo = tomar_trabajo(session)
+        except Exception:
+            logger.exception("Error consultando la cola")
+            time.sleep(settings.TRABAJOS_POLL)
+            continue
+
+        if trabajo is None:
+            time.sleep(settings.TRABAJOS_POLL)
+            continue
+
+        inicio = time.perf_counter()
+        logger.info("Trabajo %s (%s) tomado", trabajo["id_trabajo"], trabajo["tipo"])
+        ejecutar_trabajo(trabajo)
+        logger.info("Trabajo %s terminado en %.2fs", trabajo["id_trabajo"], time.perf_counter() - inicio)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,24 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from fastapi.responses import StreamingResponse
 from sqlmodel import Session, select
 from typing import Optional, Literal
-from connection.data.db import get_session
+from datetime import date, datetime
+from connection.data.db import elegir_engine_lectura, get_session, get_read_session, settings
 from connection.models.modelos import (
     MovimientoCreate, TransferenciaCreate, PagoProveedorCreate,
-    BancoCreate, CuentaCreate, TipoMoneda, Banco, TipoCuenta, CuentaBancaria, AuthUsuario
+    BancoCreate, CuentaCreate, TipoMoneda, Banco, TipoCuenta, CuentaBancaria, AuthUsuario,
+    TipoCambioCreate, OptimizarPagos
 )
 from function.fbancos import (
     crear_movimiento, transferencia_interna, obtener_saldo,
     pago_a_proveedor, facturas_abiertas_por_proveedor
 )
 from function.fbanco_cuentas import listar_bancos, crear_banco, crear_cuenta, mostrar_catalogo
+from function.fhistorico import extracto_cuenta
+from function.foptimizador import optimizar_pagos
+from function.ftesoreria import posicion_tesoreria, registrar_tipo_cambio, proyectar_flujo
+from function.fstreaming import FILAS_PARTE, NDJSON, ndjson_desde, pide_ndjson
+from function.consultas import campos_pedidos
 from services.seguridad_cliente import get_current_user
 
 banco = APIRouter(
@@ -28,7 +36,7 @@ def api_crear_banco(dto: BancoCreate, session: Session = Depends(get_session)):
 @banco.get("", dependencies=[])
 def api_listar_bancos(
     estado: Optional[Literal["ACTIVO", "INACTIVO"]] = "ACTIVO",
-    session: Session = Depends(get_session),
+    session: Session = Depends(get_read_session),
 ):
     data = listar_bancos(session, estado)
     return {"items": data}
@@ -48,7 +56,7 @@ def api_cambiar_estado_banco(
 
 # -------- Catálogos / Cuentas --------
 @banco.get("/catalogos", dependencies=[])
-def catalogos(session: Session = Depends(get_session)):
+def catalogos(session: Session = Depends(get_read_session)):
     return mostrar_catalogo(session)
 
 @banco.post("/cuentas", status_code=201, dependencies=[])
@@ -69,20 +77,38 @@ def api_crear_cuenta(dto: CuentaCreate, session: Session = Depends(get_session))
 
 @banco.get("/listcuentas", dependencies=[])
 def api_listar_cuentas(
+    request: Request,
     banco_id: Optional[int] = None,
     moneda_id: Optional[int] = None,
     estado: Optional[str] = None,
-    session: Session = Depends(get_session),
+    formato: Literal["json", "ndjson"] = "json",
+    fields: Optional[str] = None,
+    session: Session = Depends(get_read_session),
 ):
-    q = select(CuentaBancaria)
+    """
+    Cuentas bancarias; con `formato=ndjson` van en streaming, una por línea.
+    `fields=id_cuenta_bancaria,numero_cuenta` devuelve (y lee) solo esas columnas.
+    """
+    tabla = CuentaBancaria.__table__
+    campos = campos_pedidos(fields, tuple(tabla.columns.keys()))
+    if campos:
+        q = select(*(tabla.c[c] for c in campos))
+        # execute y no exec: exec devuelve escalares si se pide una sola columna
+        filas_de = lambda s, q: (dict(r._mapping) for r in s.execute(q))
+    else:
+        q = select(CuentaBancaria)
+        filas_de = lambda s, q: (r.model_dump() for r in s.exec(q))
     if banco_id is not None:
         q = q.where(CuentaBancaria.id_banco == banco_id)
     if moneda_id is not None:
         q = q.where(CuentaBancaria.id_tipo_moneda == moneda_id)
     if estado is not None:
         q = q.where(CuentaBancaria.estado == estado)
-    rows = session.exec(q.order_by(CuentaBancaria.id_cuenta_bancaria.desc())).all()
-    return {"items": [r.model_dump() for r in rows]}
+    q = q.order_by(CuentaBancaria.id_cuenta_bancaria.desc())
+    if pide_ndjson(request, formato):
+        filas = lambda s: filas_de(s, q.execution_options(yield_per=FILAS_PARTE))
+        return StreamingResponse(ndjson_desde(elegir_engine_lectura(request), filas), media_type=NDJSON)
+    return {"items": list(filas_de(session, q))}
 
 @banco.patch("/cuentas/{id_cuenta}/estado", dependencies=[])
 def api_cambiar_estado_cuenta(id_cuenta: int, nuevo_estado: str, session: Session = Depends(get_session)):
@@ -97,10 +123,56 @@ def api_cambiar_estado_cuenta(id_cuenta: int, nuevo_estado: str, session: Sessio
 
 # -------- Saldos / Movs / Transfer / Pagos --------
 @banco.get("/saldos/{id_cuenta}", dependencies=[])
-def obtener_saldo_cuenta(id_cuenta: int, session: Session = Depends(get_session)) -> dict:
+def obtener_saldo_cuenta(id_cuenta: int, session: Session = Depends(get_read_session)) -> dict:
     saldo = obtener_saldo(session, id_cuenta)
     return {"id_cuenta": id_cuenta, "saldo": str(saldo)}
 
+@banco.get("/cuentas/{id_cuenta}/extracto", dependencies=[])
+def obtener_extracto(
+    id_cuenta: int,
+    desde: date,
+    hasta: Optional[date] = None,
+    limite: int = Query(200, ge=1, le=1000),
+    despues_fecha: Optional[datetime] = None,
+    despues_id: Optional[int] = None,
+    session: Session = Depends(get_read_session),
+) -> dict:
+    """
+    Extracto de la cuenta con saldo inicial y saldo corrido; si el rango cae en periodos ya
+    archivados los lee del histórico. Siguiente página: `despues_fecha`/`despues_id` de `siguiente`.
+    """
+    return extracto_cuenta(session, id_cuenta, desde, hasta, limite, despues_fecha, despues_id)
+
+@banco.get("/posicion", dependencies=[])
+def obtener_posicion(
+    banco_id: Optional[int] = None,
+    moneda_id: Optional[int] = None,
+    moneda_destino: Optional[str] = None,
+    detalle: bool = False,
+    session: Session = Depends(get_read_session),
+) -> dict:
+    """Posición consolidada de tesorería por moneda (opcionalmente convertida a `moneda_destino`)."""
+    return posicion_tesoreria(session, banco_id, moneda_id, moneda_destino, detalle)
+
+@banco.get("/proyeccion", dependencies=[])
+def obtener_proyeccion(
+    dias: int = Query(30, ge=1, le=settings.FORECAST_MAX_DIAS),
+    banco_id: Optional[int] = None,
+    moneda_id: Optional[int] = None,
+    detalle: bool = False,
+    session: Session = Depends(get_read_session),
+) -> dict:
+    """
+    Proyección diaria de saldos por moneda (y por cuenta con `detalle`): cheques en tránsito
+    por su cobro esperado y facturas abiertas por su vencimiento. Con `banco_id` se restan todas
+    las facturas abiertas de la moneda (no tienen banco), no una parte.
+    """
+    return proyectar_flujo(session, dias, banco_id, moneda_id, detalle)
+
+@banco.post("/tipos-cambio", status_code=201, dependencies=[])
+def api_registrar_tipo_cambio(dto: TipoCambioCreate, session: Session = Depends(get_session)):
+    return registrar_tipo_cambio(session, dto)
+
 @banco.post("/movimientos", status_code=status.HTTP_201_CREATED)
 def crear_movimiento_bancario(
     mov: MovimientoCreate,
@@ -130,6 +202,16 @@ def registrar_pago_proveedor(
     return {"id_pago": id_pago, "detalle": pago}
 
 @banco.get("/proveedor/{proveedor_id}/factura_abiertas", dependencies=[Depends(get_current_user)])
-def obtener_facturas_abiertas(proveedor_id: int, limite: int = 20, session: Session = Depends(get_session)) -> list:
+def obtener_facturas_abiertas(proveedor_id: int, limite: int = 20, session: Session = Depends(get_read_session)) -> list:
     facturas = facturas_abiertas_por_proveedor(session, proveedor_id, limite)
     return {"proveedor_id": proveedor_id, "facturas_abiertas": facturas}
+
+
+@banco.post("/pagos/optimizar", dependencies=[Depends(get_current_user)])
+def api_optimizar_pagos(dto: OptimizarPagos, session: Session = Depends(get_session)) -> dict:
+    """
+    Propone qué facturas abiertas (en la moneda de la cuenta) pagar con el monto disponible,
+    maximizando el objetivo: `prioridad` (urgencia, descuento, criticidad), `monto` o `cantidad`.
+    No registra pagos.
+    """
+    return optimizar_pagos(session, dto)
@@ -0,0 +1,75 @@
+from typing import Literal, Optional
+from datetime import date, datetime
+from decimal import Decimal
+from fastapi import APIRouter, Depends, Query
+from sqlmodel import Session
+from connection.data.db import get_read_session
+from connection.models.modelos import TipoMov
+from function.fbusqueda import buscar_movimientos, buscar_cheques, buscar_proveedores, MIN_TERMINO
+from services.seguridad_cliente import get_current_user
+
+busqueda = APIRouter(
+        prefix="/admin/busqueda",
+        responses={
+            404: {"description": "Not found"},
+            500: {"description": "Internal Server Error"},
+        },
+        tags=["busqueda"] 
+    )
+
+
+@busqueda.get("/movimientos", dependencies=[Depends(get_current_user)])
+def api_buscar_movimientos(
+    q: str = Query(..., min_length=MIN_TERMINO, description="texto contenido en referencia, descripción o referencia externa"),
+    campo: Literal["texto", "referencia", "descripcion", "referencia_externa"] = "texto",
+    cuenta_id: Optional[int] = None,
+    desde: Optional[date] = None,
+    hasta: Optional[date] = None,
+    tipo_mov: Optional[list[TipoMov]] = Query(None),
+    monto_min: Optional[Decimal] = None,
+    monto_max: Optional[Decimal] = None,
+    limite: int = Query(50, ge=1, le=200),
+    despues_fecha: Optional[datetime] = None,
+    despues_id: Optional[int] = None,
+    incluir_historico: bool = Query(False, description="buscar también en los movimientos archivados"),
+    session: Session = Depends(get_read_session),
+):
+    """
+    Busca movimientos por texto, más recientes primero. Para la siguiente página enviar
+    `despues_fecha` y `despues_id` tal como vienen en `siguiente`.
+    """
+    tipos = [t.value for t in tipo_mov] if tipo_mov else None
+    return buscar_movimientos(session, q, campo, cuenta_id, desde, hasta, tipos, monto_min, monto_max,
+                              limite, despues_fecha, despues_id, incluir_historico)
+
+
+@busqueda.get("/cheques", dependencies=[Depends(get_current_user)])
+def api_buscar_cheques(
+    q: str = Query(..., min_length=MIN_TERMINO, description="texto contenido en el beneficiario"),
+    cuenta_id: Optional[int] = None,
+    desde: Optional[date] = None,
+    hasta: Optional[date] = None,
+    estado: Optional[Literal["EMITIDO", "COBRADO", "ANULADO"]] = None,
+    monto_min: Optional[Decimal] = None,
+    monto_max: Optional[Decimal] = None,
+    limite: int = Query(50, ge=1, le=200),
+    despues_fecha: Optional[date] = None,
+    despues_id: Optional[int] = None,
+    session: Session = Depends(get_read_session),
+):
+    """ Busca cheques por beneficiario; paginado igual que /movimientos """
+    return buscar_cheques(session, q, cuenta_id, desde, hasta, estado, monto_min, monto_max,
+                          limite, despues_fecha, despues_id)
+
+
+@busqueda.get("/proveedores", dependencies=[Depends(get_current_user)])
+def api_buscar_proveedores(
+    q: str = Query(..., min_length=MIN_TERMINO, description="texto contenido en el nombre o el NIT"),
+    activo: Optional[bool] = None,
+    limite: int = Query(50, ge=1, le=200),
+    despues_nombre: Optional[str] = None,
+    despues_id: Optional[int] = None,
+    session: Session = Depends(get_read_session),
+):
+    """ Busca proveedores por nombre o NIT, en orden alfabético; la siguiente página con `siguiente` """
+    return buscar_proveedores(session, q, activo, limite, despues_nombre, despues_id)
@@ -1,10 +1,19 @@
-from fastapi import APIRouter, Depends,HTTPException, status
+import asyncio
+import csv
+import io
+from decimal import Decimal, InvalidOperation
+from fastapi import APIRouter, Depends,HTTPException, status, Request
 from sqlmodel import Session
-from sqlalchemy import text
-from connection.data.db import get_session
+from connection.data.db import get_session, get_read_session
 from services.seguridad_cliente import require_roles
-from connection.models.modelos import EmitirCheque, AnularCheque
-from function.fcheques import emitir_cheque, anular_cheque
+from connection.models.modelos import (
+    EmitirCheque, AnularCheque, CobroChequesLote, ChequeCobroItem, ChequeraCreate, EmisionChequesLote
+)
+from function.fcheques import (
+    emitir_cheque, anular_cheque, cobrar_cheque, cobrar_cheques_lote,
+    crear_chequera, listar_chequeras, emitir_cheques_lote, consultar_cheques, COLUMNAS_CHEQUES
+)
+from function.consultas import campos_pedidos
 
 cheques = APIRouter(
         prefix="/admin/cheques",
@@ -25,6 +34,25 @@ def api_emitir(dto: EmitirCheque, session: Session = Depends(get_session)):
     except Exception as e:
         raise HTTPException(status.HTTP_400_BAD_REQUEST, str(e))
 
+@cheques.post("/emitir-lote", status_code=201, dependencies=[])
+def api_emitir_lote(dto: EmisionChequesLote, session: Session = Depends(get_session)):
+    """
+    Emisión masiva (planilla): una validación de saldo y una transacción; los números salen de la chequera.
+    """
+    return emitir_cheques_lote(session, dto)
+
+
+@cheques.post("/chequeras", status_code=201, dependencies=[])
+def api_crear_chequera(dto: ChequeraCreate, session: Session = Depends(get_session)):
+    cid = crear_chequera(session, dto.id_cuenta_bancaria, dto.numero_inicial, dto.numero_final)
+    return {"id_chequera": cid}
+
+
+@cheques.get("/chequeras", dependencies=[])
+def api_listar_chequeras(cuenta_id: int | None = None, session: Session = Depends(get_read_session)):
+    return {"items": listar_chequeras(session, cuenta_id)}
+
+
 @cheques.post("/{id_cheque}/anular", status_code=204, dependencies=[])
 def api_anular(id_cheque: int, dto: AnularCheque, session: Session = Depends(get_session)):
     try: 
@@ -34,16 +62,63 @@ def api_anular(id_cheque: int, dto: AnularCheque, session: Session = Depends(get
         raise HTTPException(status.HTTP_400_BAD_REQUEST, str(e))
     
 
+@cheques.post("/{id_cheque}/cobrar", dependencies=[])
+def api_cobrar(id_cheque: int, session: Session = Depends(get_session)):
+    try:
+        cobrar_cheque(session, id_cheque); return {"cobrado": True}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, str(e))
+
+
+@cheques.post("/cobros", dependencies=[])
+def api_cobrar_lote(dto: CobroChequesLote, session: Session = Depends(get_session)):
+    """
+    Compensación en bloque: lista de (cuenta, número, monto) cobrados según el banco.
+    `fila` en los rechazos es la posición del item en la lista (desde 1).
+    """
+    return cobrar_cheques_lote(session, dto.items)
+
+
+def _cobrar_csv(session: Session, cuerpo: str) -> dict:
+    items, lineas, errores = [], [], []
+    # line_num y no un contador: DictReader salta líneas en blanco y un campo entre comillas
+    # puede ocupar varias
+    lector = csv.DictReader(io.StringIO(cuerpo))
+    for fila in lector:
+        n = lector.line_num
+        try:
+            items.append(ChequeCobroItem(
+                id_cuenta_bancaria=int(fila["id_cuenta_bancaria"]),
+                numero_cheque=(fila["numero_cheque"] or "").strip(),
+                monto=Decimal(fila["monto"]),
+            ))
+            lineas.append(n)
+        except (KeyError, TypeError, ValueError, InvalidOperation) as e:
+            errores.append({"fila": n, "error": str(e)})
+    if not items:
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, {"detail": "Archivo sin filas válidas", "errores": errores})
+    res = cobrar_cheques_lote(session, items, lineas)
+    res["errores_archivo"] = errores
+    return res
+
+
+@cheques.post("/cobros/archivo", dependencies=[])
+async def api_cobrar_archivo(request: Request, session: Session = Depends(get_session)):
+    """
+    Igual que /cobros pero recibe el archivo de compensación como CSV en el cuerpo
+    (encabezado: id_cuenta_bancaria,numero_cheque,monto). `fila` en rechazos y errores es la
+    línea del archivo (el encabezado es la 1; si un registro ocupa varias, la última).
+    """
+    cuerpo = (await request.body()).decode("utf-8-sig")
+    # el parseo y el UPDATE en bloque son síncronos: fuera del event loop
+    return await asyncio.to_thread(_cobrar_csv, session, cuerpo)
+
+
 @cheques.get("/listar", dependencies=[])
-def listar_cheques(cuenta_id: int | None = None, estado: str | None = None, session: Session = Depends(get_session)):
-     
-    sql = "SELECT * FROM bancos.cheques WHERE 1=1"
-    params = {}
-    if cuenta_id is not None:
-        sql += " AND id_cuenta_bancaria = :c"; params["c"] = cuenta_id
-    if estado is not None:
-        sql += " AND estado = :e"; params["e"] = estado
-    sql += " ORDER BY id_cheque DESC LIMIT 200"
-    rows = session.exec(text(sql), params).all()
-    return {"items": [dict(r._mapping) for r in rows]}
+def listar_cheques(cuenta_id: int | None = None, estado: str | None = None, fields: str | None = None,
+                   session: Session = Depends(get_read_session)):
+    """ Últimos 200 cheques; `fields=id_cheque,monto` devuelve (y lee) solo esas columnas """
+    return {"items": consultar_cheques(session, cuenta_id, estado, campos_pedidos(fields, COLUMNAS_CHEQUES))}
    
\ No newline at end of file
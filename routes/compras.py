@@ -0,0 +1,47 @@
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from services.compras_cliente import compras as cliente_compras
+from services.seguridad_cliente import get_current_user
+
+compras = APIRouter(
+        prefix="/admin/compras",
+        responses={
+            404: {"description": "Not found"},
+            500: {"description": "Internal Server Error"},
+            502: {"description": "Servicio de compras con error"},
+            503: {"description": "Servicio de compras no disponible (circuito abierto)"},
+        },
+        tags=["compras"]
+    )
+
+
+@compras.get("/proveedores", dependencies=[Depends(get_current_user)])
+async def api_proveedores_compras(ids: list[int] = Query(...)):
+    """ Varios proveedores del servicio de compras a la vez (los que no existen no vienen) """
+    if len(ids) > 200:
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, "Máximo 200 proveedores por consulta")
+    encontrados = await cliente_compras.proveedores(ids)
+    return {"proveedores": list(encontrados.values())}
+
+
+@compras.get("/proveedores/{proveedor_id}", dependencies=[Depends(get_current_user)])
+async def api_proveedor_compras(proveedor_id: int):
+    """ Proveedor según el servicio de compras (cacheado COMPRAS_CACHE_TTL segundos) """
+    return await cliente_compras.proveedor(proveedor_id)
+
+
+@compras.get("/proveedores/{proveedor_id}/facturas", dependencies=[Depends(get_current_user)])
+async def api_facturas_proveedor_compras(proveedor_id: int, estado: Optional[str] = None):
+    """ Facturas del proveedor en el servicio de compras """
+    return {"facturas": await cliente_compras.facturas_proveedor(proveedor_id, estado)}
+
+
+@compras.get("/facturas/{factura_id}", dependencies=[Depends(get_current_user)])
+async def api_factura_compras(factura_id: int):
+    return await cliente_compras.factura(factura_id)
+
+
+@compras.get("/estado", dependencies=[Depends(get_current_user)])
+def api_estado_compras():
+    """ Circuito, cache y llamadas del cliente de compras en este proceso """
+    return cliente_compras.estado()
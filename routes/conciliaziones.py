@@ -1,10 +1,12 @@
-from fastapi import APIRouter, Depends,HTTPException,status
+from fastapi import APIRouter, Depends,HTTPException,Request,status
+from fastapi.responses import StreamingResponse
 from sqlmodel import Session
-from typing import Optional
-from connection.data.db import get_session
-from services.seguridad_cliente import require_roles
-from connection.models.modelos import ConciliacionCreate
-from function.fconsiliaciones import crear_conciliacion,listar_conciliaciones,listar_partidas_pendientes,_seguimiento_bandera
+from typing import Literal, Optional
+from connection.data.db import elegir_engine_lectura, get_session, get_read_session
+from services.seguridad_cliente import require_roles, usuario_de
+from connection.models.modelos import ConciliacionCreate, ConciliacionLote
+from function.fconsiliaciones import crear_conciliacion,listar_conciliaciones,listar_partidas_pendientes,_seguimiento_bandera,conciliar_lote,iterar_partidas_pendientes
+from function.fstreaming import NDJSON, ndjson_desde, pide_ndjson
 from function.fbancos import verificar_cuenta_activa
 from datetime import date
 
@@ -48,8 +50,17 @@ def crear_conc(dto: ConciliacionCreate,session: Session = Depends(get_session),)
         raise HTTPException(status.HTTP_500_INTERNAL_SERVER_ERROR, f"Error al conciliar: {e}")
 
 
+@conc.post("/lote",dependencies=[],)
+def crear_conc_lote(dto: ConciliacionLote):
+    """
+    Concilia muchas cuentas en una sola llamada (cierre de mes).
+    Cada cuenta va en su propia transacción; el reporte trae el resultado y el tiempo de cada una.
+    """
+    return conciliar_lote(dto.items, bandera=dto.bandera, max_workers=dto.max_workers)
+
+
 @conc.get("",dependencies=[],)
-def listar_conc(id_cuenta_bancaria: int,desde: Optional[date] = None,hasta: Optional[date] = None,limit: int = 100,session: Session = Depends(get_session),):
+def listar_conc(id_cuenta_bancaria: int,desde: Optional[date] = None,hasta: Optional[date] = None,limit: int = 100,session: Session = Depends(get_read_session),):
     
     """
     Lista conciliaciones de una cuenta en un rango de fechas.
@@ -60,12 +71,23 @@ def listar_conc(id_cuenta_bancaria: int,desde: Optional[date] = None,hasta: Opti
 
 
 @conc.get("/partidas-pendientes",dependencies=[],)
-def listar_partidas(id_cuenta_bancaria: int,hasta: date,session: Session = Depends(get_session),
+def listar_partidas(request: Request, id_cuenta_bancaria: int,hasta: date, formato: Literal["json", "ndjson"] = "json",
+                    session: Session = Depends(get_read_session),
 ):
     """
     Lista movimientos no conciliados y cheques emitidos no cobrados
     hasta la fecha dada (inclusive).
+    Con `formato=ndjson` (o Accept: application/x-ndjson) van en streaming, una partida por línea
+    con `partida` = "movimiento" o "cheque" (requiere token).
     """
+    ndjson = pide_ndjson(request, formato)
+    if ndjson:
+        usuario_de(request)
     verificar_cuenta_activa(session, id_cuenta_bancaria)
+    if ndjson:
+        eng = elegir_engine_lectura(request)
+        return StreamingResponse(
+            ndjson_desde(eng, lambda s: iterar_partidas_pendientes(s, id_cuenta_bancaria, hasta)), media_type=NDJSON,
+        )
     data = listar_partidas_pendientes(session, id_cuenta_bancaria, hasta)
     return data
@@ -0,0 +1,29 @@
+from typing import Optional
+from fastapi import APIRouter, Depends, Query
+from sqlmodel import Session
+from connection.data.db import get_session
+from function.foutbox import leer_eventos
+from services.seguridad_cliente import get_current_user
+
+eventos = APIRouter(
+        prefix="/admin/eventos",
+        responses={
+            404: {"description": "Not found"},
+            500: {"description": "Internal Server Error"},
+        },
+        tags=["eventos"] 
+    )
+
+
+@eventos.get("", dependencies=[Depends(get_current_user)])
+def api_eventos(
+    despues: Optional[str] = Query(None, description="cursor devuelto por la llamada anterior"),
+    limite: int = Query(100, ge=1, le=1000),
+    tipo: Optional[list[str]] = Query(None, description="p.ej. pago.registrado, cheque.emitido"),
+    session: Session = Depends(get_session),
+):
+    """
+    Feed de cambios (movimientos, transferencias, pagos y cheques) para consumidores que hacen pull.
+    Se guarda `cursor` y se manda como `despues`; los eventos llegan una sola vez y en orden de commit.
+    """
+    return leer_eventos(session, despues, limite, tipo)
@@ -0,0 +1,42 @@
+from datetime import date
+from typing import Literal
+from fastapi import APIRouter, Depends, Query, Request
+from fastapi.responses import StreamingResponse
+from connection.data.db import engine, elegir_engine_lectura
+from function.fexportacion import exportar_en_partes, validar_exportacion
+from services.seguridad_cliente import get_current_user
+
+exportar = APIRouter(
+        prefix="/admin/exportar",
+        responses={
+            404: {"description": "Not found"},
+            500: {"description": "Internal Server Error"},
+        },
+        tags=["exportar"] 
+    )
+
+_TIPOS = {"parquet": "application/vnd.apache.parquet", "arrow": "application/vnd.apache.arrow.stream"}
+
+
+@exportar.get("/{dataset}", dependencies=[Depends(get_current_user)])
+def api_exportar(
+    request: Request,
+    dataset: Literal["movimientos", "pagos"],
+    desde: date = Query(...),
+    hasta: date = Query(...),
+    formato: Literal["parquet", "arrow"] = "parquet",
+):
+    """
+    Exporta movimientos o pagos del rango (fechas inclusive) como Parquet o Arrow IPC (stream).
+    Movimientos incluye los archivados en el histórico (columna `origen`).
+    La respuesta se va generando por lotes desde un cursor del servidor; puede leer de la réplica.
+    """
+    validar_exportacion(dataset, desde, hasta, formato)
+    eng = elegir_engine_lectura(request)
+    request.state.origen_lectura = "primario" if eng is engine else "replica"
+    nombre = f"{dataset}_{desde.isoformat()}_{hasta.isoformat()}.{formato}"
+    return StreamingResponse(
+        exportar_en_partes(eng, dataset, desde, hasta, formato),
+        media_type=_TIPOS[formato],
+        headers={"Content-Disposition": f'attachment; filename="{nombre}"'},
+    )
@@ -0,0 +1,59 @@
+import asyncio
+import tempfile
+from typing import Literal, Optional
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from sqlmodel import Session
+from connection.data.db import engine, settings
+from function.fimportacion import CAMPOS, importar_facturas
+from services.seguridad_cliente import require_roles
+
+facturas = APIRouter(
+        prefix="/admin/facturas",
+        responses={
+            404: {"description": "Not found"},
+            500: {"description": "Internal Server Error"},
+        },
+        tags=["facturas"]
+    )
+
+_FORMATOS = {"text/csv": "csv", "application/x-ndjson": "ndjson", "application/json": "json"}
+
+
+def _importar(archivo, formato: str, bandera: bool) -> dict:
+    # sesión propia del hilo, abierta con el archivo ya recibido
+    with Session(engine) as session:
+        return importar_facturas(session, archivo, formato, bandera)
+
+
+@facturas.post("/importar", dependencies=[Depends(require_roles("ADMIN"))])
+async def api_importar_facturas(request: Request, formato: Optional[Literal["csv", "ndjson", "json"]] = None,
+                                bandera: bool = False):
+    """
+    Importa facturas de compra en bloque. El cuerpo es el archivo: CSV con encabezado, NDJSON
+    (una factura por línea) o un arreglo JSON; el formato sale de `formato` o del Content-Type.
+    Campos: proveedor_id, numero_factura, moneda_id y monto_total obligatorios; fecha_emision,
+    fecha_vencimiento, descuento_pronto_pago y fecha_limite_descuento opcionales.
+    Se insertan las válidas y se devuelve cada fila rechazada con su motivo.
+    Con `bandera=true` solo valida.
+    """
+    formato = formato or _FORMATOS.get(request.headers.get("content-type", "").split(";")[0].strip())
+    if formato is None:
+        raise HTTPException(status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+                            f"Content-Type {', '.join(_FORMATOS)} o ?formato=; campos: {', '.join(CAMPOS)}")
+
+    # el cuerpo se copia por partes a un temporal (en memoria hasta IMPORTACION_MEMORIA_MB) y
+    # la importación corre en un hilo: no bloquea el event loop ni tiene una conexión tomada
+    # mientras el archivo sube
+    maximo = settings.IMPORTACION_MAX_MB * 1024 * 1024
+    with tempfile.SpooledTemporaryFile(max_size=settings.IMPORTACION_MEMORIA_MB * 1024 * 1024) as archivo:
+        tamano = 0
+        async for parte in request.stream():
+            tamano += len(parte)
+            if tamano > maximo:
+                raise HTTPException(status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                                    f"El archivo pasa de {settings.IMPORTACION_MAX_MB} MB")
+            archivo.write(parte)
+        if not tamano:
+            raise HTTPException(status.HTTP_400_BAD_REQUEST, "Cuerpo vacío")
+        archivo.seek(0)
+        return await asyncio.to_thread(_importar, archivo, formato, bandera)
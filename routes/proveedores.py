@@ -0,0 +1,32 @@
+from typing import Optional
+from datetime import date
+from fastapi import APIRouter, Depends, Query
+from sqlmodel import Session
+from connection.data.db import get_read_session
+from function.fproveedores_facturas import estado_cuenta_proveedor
+from services.seguridad_cliente import get_current_user
+
+proveedores = APIRouter(
+        prefix="/admin/proveedores",
+        responses={
+            404: {"description": "Not found"},
+            500: {"description": "Internal Server Error"},
+        },
+        tags=["proveedores"]
+    )
+
+
+@proveedores.get("/{proveedor_id}/estado-cuenta", dependencies=[Depends(get_current_user)])
+def obtener_estado_cuenta(
+    proveedor_id: int,
+    desde: Optional[date] = None,
+    hasta: Optional[date] = None,
+    limite: int = Query(200, ge=1, le=1000),
+    despues: Optional[str] = Query(None, description="cursor `siguiente` devuelto por la llamada anterior"),
+    session: Session = Depends(get_read_session),
+) -> dict:
+    """
+    Estado de cuenta del proveedor: facturas y pagos (también los abonados a cuenta) en orden de
+    fecha con saldo corrido por moneda. Siguiente página: `despues` = `siguiente`.
+    """
+    return estado_cuenta_proveedor(session, proveedor_id, desde, hasta, limite, despues)
@@ -1,10 +1,17 @@
-from typing import Optional,List
-from datetime import date
+from typing import Literal, Optional,List
+from datetime import date, datetime
 from sqlmodel import Session
-from connection.data.db import get_session
-from fastapi import APIRouter, Depends
-from function.freportes import historial_pagos, facturas_pagadas_por_fecha
-from services.seguridad_cliente import require_roles
+from connection.data.db import elegir_engine_lectura, get_read_session
+from fastapi import APIRouter, Depends, Request
+from fastapi.responses import StreamingResponse
+from function.freportes import (
+    historial_pagos, facturas_pagadas_por_fecha, iterar_historial_pagos, iterar_facturas_pagadas,
+    COLUMNAS_HISTORIAL, COLUMNAS_FACTURAS_PAGADAS, CURSOR_FACTURAS_PAGADAS,
+)
+from function.consultas import campos_pedidos
+from function.fstreaming import NDJSON, ndjson_desde, pide_ndjson
+from function.fcache import cache_reportes
+from services.seguridad_cliente import require_roles, usuario_de
 
 reportes = APIRouter(
         prefix="/admin/reportes",
@@ -16,18 +23,56 @@ reportes = APIRouter(
     )
 
 
+def _ndjson(request: Request, consulta) -> StreamingResponse:
+    # el streaming puede recorrer la tabla completa: solo con token
+    usuario_de(request)
+    eng = elegir_engine_lectura(request)
+    return StreamingResponse(ndjson_desde(eng, consulta), media_type=NDJSON)
+
+
 @reportes.get("/historial_pagos",dependencies=[])
-def obtener_historial_pagos(proveedor_id: Optional[int] = None, fecha_inicio: Optional[date] = None, fecha_fin: Optional[date] = None, limite: int = 100, session: Session = Depends(get_session)):
+def obtener_historial_pagos(request: Request, proveedor_id: Optional[int] = None, fecha_inicio: Optional[date] = None, fecha_fin: Optional[date] = None, limite: Optional[int] = None,
+                            formato: Literal["json", "ndjson"] = "json", fields: Optional[str] = None,
+                            session: Session = Depends(get_read_session)):
     """
-    Obtener el historial de pagos realizados a proveedores
+    Obtener el historial de pagos realizados a proveedores.
+    Con `formato=ndjson` (o Accept: application/x-ndjson) las filas llegan en streaming, una por
+    línea, y sin `limite` se devuelve todo el rango (requiere token); en JSON el límite por
+    defecto es 100.
+    `fields=pago_id,monto_pagado` devuelve (y lee) solo esas columnas.
     """
-    pagos = historial_pagos(session, proveedor_id, fecha_inicio, fecha_fin, limite)
+    campos = campos_pedidos(fields, COLUMNAS_HISTORIAL)
+    if pide_ndjson(request, formato):
+        return _ndjson(request, lambda s: iterar_historial_pagos(s, proveedor_id, fecha_inicio, fecha_fin, limite, campos))
+    pagos = historial_pagos(session, proveedor_id, fecha_inicio, fecha_fin, limite or 100, campos)
     return {"historial_pagos": pagos}
 
 @reportes.get("/facturas_pagadas",dependencies=[])
-def obtener_facturas_pagadas(proveedor_id: Optional[int] = None, fecha_inicio: Optional[date] = None, fecha_fin: Optional[date] = None, limite: int = 100, session: Session = Depends(get_session)):
+def obtener_facturas_pagadas(request: Request, proveedor_id: Optional[int] = None, fecha_inicio: Optional[date] = None, fecha_fin: Optional[date] = None, limite: Optional[int] = None,
+                             despues_fecha: Optional[datetime] = None, despues_id: Optional[int] = None,
+                             formato: Literal["json", "ndjson"] = "json", fields: Optional[str] = None,
+                             session: Session = Depends(get_read_session)):
+    """
+    Obtener una lista de facturas pagadas por proveedores en un rango de fechas (por fecha del último pago, más reciente primero).
+    Para la siguiente página enviar `despues_fecha` y `despues_id` tal como vienen en `siguiente`.
+    Con `formato=ndjson` llegan todas (o hasta `limite`) en streaming, sin páginas (requiere token).
+    `fields` limita las columnas; factura_id y fecha_ultimo_pago van siempre (son el cursor).
+    """
+    campos = campos_pedidos(fields, COLUMNAS_FACTURAS_PAGADAS, siempre=CURSOR_FACTURAS_PAGADAS)
+    if pide_ndjson(request, formato):
+        return _ndjson(request, lambda s: iterar_facturas_pagadas(
+            s, proveedor_id, fecha_inicio, fecha_fin, limite, despues_fecha, despues_id, campos))
+    limite = limite or 100
+    facturas = facturas_pagadas_por_fecha(session, proveedor_id, fecha_inicio, fecha_fin, limite, despues_fecha, despues_id, campos)
+    siguiente = None
+    if len(facturas) == limite:
+        ultima = facturas[-1]
+        siguiente = {"despues_fecha": ultima["fecha_ultimo_pago"], "despues_id": ultima["factura_id"]}
+    return {"facturas_pagadas": facturas, "siguiente": siguiente}
+
+@reportes.get("/cache",dependencies=[])
+def obtener_metricas_cache():
     """
-    Obtener una lista de facturas pagadas por proveedores en un rango de fechas.
+    Hits/misses del cache de reportes (global y por reporte).
     """
-    facturas = facturas_pagadas_por_fecha(session, proveedor_id, fecha_inicio, fecha_fin, limite)
-    return {"facturas_pagadas": facturas}
\ No newline at end of file
+    return cache_reportes.metricas()
\ No newline at end of file
@@ -0,0 +1,57 @@
+from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.responses import JSONResponse
+from sqlmodel import Session
+from connection.data.db import get_session
+from connection.models.modelos import TrabajoCreate, AuthUsuario
+from function.ftrabajos import encolar_trabajo, obtener_trabajo, estado_trabajo, roles_de_tipo, tipos_registrados
+from services.seguridad_cliente import get_current_user, require_roles
+
+trabajos = APIRouter(
+        prefix="/admin/trabajos",
+        responses={
+            404: {"description": "Not found"},
+            500: {"description": "Internal Server Error"},
+        },
+        tags=["trabajos"] 
+    )
+
+
+@trabajos.post("", status_code=status.HTTP_202_ACCEPTED)
+def api_encolar(dto: TrabajoCreate, session: Session = Depends(get_session),
+                usuario: AuthUsuario = Depends(get_current_user)):
+    """
+    Encola un trabajo pesado (conciliación en lote, reportes grandes) para que lo procese `main.worker`.
+    Archivar movimientos y sincronizar compras son solo para ADMIN. El estado y el resultado los
+    ve quien lo encoló (o un ADMIN).
+    """
+    roles = roles_de_tipo(dto.tipo)
+    if roles:
+        require_roles(*roles)(usuario)
+    id_trabajo = encolar_trabajo(session, dto.tipo, dto.parametros, usuario=usuario.nombre or usuario.sub,
+                                 usuario_sub=usuario.sub)
+    return {"id_trabajo": id_trabajo, "estado": "PENDIENTE"}
+
+
+@trabajos.get("/tipos", dependencies=[])
+def api_tipos():
+    return {"tipos": tipos_registrados()}
+
+
+@trabajos.get("/{id_trabajo}")
+def api_estado(id_trabajo: int, session: Session = Depends(get_session),
+               usuario: AuthUsuario = Depends(get_current_user)):
+    return estado_trabajo(obtener_trabajo(session, id_trabajo, usuario))
+
+
+@trabajos.get("/{id_trabajo}/resultado")
+def api_resultado(id_trabajo: int, session: Session = Depends(get_session),
+                  usuario: AuthUsuario = Depends(get_current_user)):
+    t = obtener_trabajo(session, id_trabajo, usuario)
+    if t.estado == "FALLIDO":
+        raise HTTPException(status.HTTP_409_CONFLICT, f"El trabajo falló: {t.error}")
+    if t.estado != "COMPLETADO":
+        raise HTTPException(status.HTTP_409_CONFLICT, f"El trabajo aún no termina ({t.estado}, {t.progreso}%)")
+    return JSONResponse(
+        t.resultado,
+        headers={"Content-Disposition": f'attachment; filename="trabajo_{t.id_trabajo}_{t.tipo}.json"'},
+    )
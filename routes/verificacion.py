@@ -0,0 +1,31 @@
+from typing import Optional
+from fastapi import APIRouter, Depends, Query, Request
+from fastapi.responses import StreamingResponse
+from connection.data.db import engine, elegir_engine_lectura
+from function.fstreaming import NDJSON, lineas
+from function.fverificacion import validar_verificaciones, verificar
+from services.seguridad_cliente import require_roles
+
+verificacion = APIRouter(
+        prefix="/admin/verificacion",
+        responses={
+            404: {"description": "Not found"},
+            500: {"description": "Internal Server Error"},
+        },
+        tags=["verificacion"]
+    )
+
+
+@verificacion.get("", dependencies=[Depends(require_roles("ADMIN"))])
+def api_verificar(request: Request, verificaciones: Optional[list[str]] = Query(None),
+                  tramos: Optional[int] = Query(None, ge=1, le=256), maximo: Optional[int] = Query(None, ge=1)):
+    """
+    Verifica las invariantes del libro (transferencias pareadas, cheques de cada CHEQUE_EMITIDO,
+    saldos de facturas) por tramos en paralelo. Responde NDJSON: un hallazgo por línea a medida
+    que terminan los tramos y al final una línea {"resumen": ...}.
+    """
+    nombres = validar_verificaciones(verificaciones)
+    eng = elegir_engine_lectura(request)
+    request.state.origen_lectura = "primario" if eng is engine else "replica"
+    # pocos hallazgos en un libro sano: cada línea sale apenas termina su tramo
+    return StreamingResponse(lineas(verificar(eng, nombres, tramos, maximo=maximo), filas_parte=1), media_type=NDJSON)
@@ -0,0 +1,216 @@
+# services/admision.py
+import asyncio
+import itertools
+import math
+import re
+import time
+from dataclasses import dataclass, field
+from typing import Optional
+
+import jwt
+from fastapi import Request
+
+from connection.data.db import espera_pool, settings
+from services.seguridad_cliente import JWT_ALG, JWT_SECRET
+
+# Control de admisión antes de tocar la BD. Cada request se clasifica en escritura (mueve
+# dinero), lectura o reporte y pasa por, en orden:
+#   1) espera del pool: si pasa de ADMISION_POOL_UMBRAL se rechazan reportes; al doble, también
+#      lecturas (503). Las escrituras nunca se descartan por esto.
+#   2) tasa por cliente (sub del JWT, o IP): cubeta de tokens; un reporte gasta más (429).
+#   3) concurrencia: cupos totales, por cliente y por ruta; las lecturas no usan los cupos
+#      reservados a escrituras y los reportes tienen su propio tope. Sin cupo se espera en cola
+#      (las escrituras primero) hasta ADMISION_ESPERA_<clase> y luego 503.
+# Todo vive en el event loop del proceso: con varios workers de uvicorn cada uno tiene sus cupos.
+
+ESCRITURA, LECTURA, REPORTE = "escritura", "lectura", "reporte"
+_PRIORIDAD = {ESCRITURA: 0, LECTURA: 1, REPORTE: 2}
+
+_EXENTAS = ("/health", "/ready", "/docs", "/redoc", "/openapi.json")
+_PREFIJOS_REPORTE = ("/admin/reportes", "/admin/exportar", "/admin/busqueda", "/admin/bancos/proyeccion",
+                     "/admin/bancos/posicion", "/admin/bancos/pagos/optimizar", "/admin/verificacion",
+                     "/admin/facturas/importar")
+_SUFIJOS_REPORTE = ("/extracto",)
+_METODOS_LECTURA = {"GET", "HEAD", "OPTIONS"}
+_ID = re.compile(r"/\d+(?=/|$)")
+
+
+def clasificar(request: Request) -> Optional[str]:
+    ruta = request.url.path
+    if ruta in _EXENTAS or request.method == "OPTIONS":
+        return None
+    if ruta.startswith(_PREFIJOS_REPORTE) or ruta.endswith(_SUFIJOS_REPORTE):
+        return REPORTE
+    return LECTURA if request.method in _METODOS_LECTURA else ESCRITURA
+
+
+def cliente(request: Request) -> str:
+    # el sub se lee sin llamar a get_current_user: un token inválido cuenta como su IP y el
+    # endpoint igual lo rechaza
+    auth = request.headers.get("Authorization", "")
+    esquema, _, token = auth.partition(" ")
+    if esquema.lower() == "bearer" and token:
+        try:
+            return "sub:" + str(jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALG]).get("sub"))
+        except jwt.PyJWTError:
+            pass
+    return "ip:" + (request.client.host if request.client else "anonimo")
+
+
+@dataclass
+class Rechazo:
+    status: int
+    detalle: str
+    reintentar: float   # segundos para Retry-After
+
+
+@dataclass
+class Turno:
+    clase: str
+    cliente: str
+    ruta: str
+    liberado: bool = False
+
+
+@dataclass(order=True)
+class _Espera:
+    prioridad: int
+    seq: int
+    turno: Turno = field(compare=False)
+    futuro: asyncio.Future = field(compare=False)
+
+
+class _Cubeta:
+    __slots__ = ("tokens", "t")
+
+    def __init__(self, tokens: float, t: float):
+        self.tokens, self.t = tokens, t
+
+
+class Admision:
+    def __init__(self):
+        self._cubetas: dict[str, _Cubeta] = {}
+        self._en_curso = {ESCRITURA: 0, LECTURA: 0, REPORTE: 0}
+        self._por_cliente: dict[str, int] = {}
+        self._por_ruta: dict[str, int] = {}
+        self._cola: list[_Espera] = []
+        self._seq = itertools.count()
+        self.rechazos = {429: 0, 503: 0}
+
+    #---------------- tasa ----------------
+    def _gastar(self, clave: str, costo: float) -> Optional[float]:
+        ''' descuenta tokens; si no alcanza devuelve los segundos que faltan '''
+        ahora = time.monotonic()
+        c = self._cubetas.get(clave)
+        if c is None:
+            if len(self._cubetas) > 10000:
+                # cubetas llenas = clientes inactivos: se pueden olvidar
+                lleno = settings.ADMISION_RAFAGA / settings.ADMISION_RPS
+                self._cubetas = {k: v for k, v in self._cubetas.items() if ahora - v.t < lleno}
+            c = self._cubetas[clave] = _Cubeta(settings.ADMISION_RAFAGA, ahora)
+        c.tokens = min(settings.ADMISION_RAFAGA, c.tokens + (ahora - c.t) * settings.ADMISION_RPS)
+        c.t = ahora
+        if c.tokens >= costo:
+            c.tokens -= costo
+            return None
+        return (costo - c.tokens) / settings.ADMISION_RPS
+
+    #---------------- concurrencia ----------------
+    def _cabe(self, t: Turno) -> bool:
+        total = sum(self._en_curso.values())
+        tope = settings.ADMISION_MAX_CONCURRENCIA
+        if t.clase != ESCRITURA:
+            tope -= settings.ADMISION_RESERVA_ESCRITURAS
+        if total >= tope:
+            return False
+        if t.clase == REPORTE and self._en_curso[REPORTE] >= settings.ADMISION_MAX_REPORTES:
+            return False
+        return (self._por_cliente.get(t.cliente, 0) < settings.ADMISION_MAX_POR_CLIENTE
+                and self._por_ruta.get(t.ruta, 0) < settings.ADMISION_MAX_POR_RUTA)
+
+    def _ocupar(self, t: Turno) -> None:
+        self._en_curso[t.clase] += 1
+        self._por_cliente[t.cliente] = self._por_cliente.get(t.cliente, 0) + 1
+        self._por_ruta[t.ruta] = self._por_ruta.get(t.ruta, 0) + 1
+
+    def liberar(self, t: Turno) -> None:
+        if t.liberado:
+            return
+        t.liberado = True
+        self._en_curso[t.clase] -= 1
+        for d, k in ((self._por_cliente, t.cliente), (self._por_ruta, t.ruta)):
+            d[k] -= 1
+            if not d[k]:
+                del d[k]
+        self._despertar()
+
+    def _despertar(self) -> None:
+        # en orden de prioridad y llegada; uno que no cabe (p.ej. su cliente está al tope) no
+        # bloquea a los siguientes
+        for e in sorted(self._cola):
+            if not e.futuro.done() and self._cabe(e.turno):
+                self._ocupar(e.turno)
+                e.futuro.set_result(True)
+        self._cola = [e for e in self._cola if not e.futuro.done()]
+
+    async def entrar(self, request: Request, clase: str) -> Turno | Rechazo:
+        espera = espera_pool()
+        umbral = settings.ADMISION_POOL_UMBRAL
+        if (clase == REPORTE and espera > umbral) or (clase == LECTURA and espera > 2 * umbral):
+            return self._rechazar(503, f"Base de datos saturada (espera del pool {espera:.2f}s)", max(1.0, espera * 4))
+
+        quien = cliente(request)
+        falta = self._gastar(quien, settings.ADMISION_COSTO_REPORTE if clase == REPORTE else 1.0)
+        if falta is not None:
+            return self._rechazar(429, "Demasiadas solicitudes", falta)
+
+        t = Turno(clase, quien, f"{request.method} {_ID.sub('/{id}', request.url.path)}")
+        if not self._cola and self._cabe(t):
+            self._ocupar(t)
+            return t
+        e = _Espera(_PRIORIDAD[clase], next(self._seq), t, asyncio.get_running_loop().create_future())
+        self._cola.append(e)
+        self._despertar()
+        if e.futuro.done():
+            return t
+        limite = {ESCRITURA: settings.ADMISION_ESPERA_ESCRITURA, LECTURA: settings.ADMISION_ESPERA_LECTURA,
+                  REPORTE: settings.ADMISION_ESPERA_REPORTE}[clase]
+        if limite <= 0:
+            self._cola = [x for x in self._cola if x is not e]
+            return self._rechazar(503, "Servicio ocupado", 1.0)
+        try:
+            await asyncio.wait_for(asyncio.shield(e.futuro), limite)
+            return t
+        except asyncio.TimeoutError:
+            if e.futuro.done():      # se le dio el cupo justo al vencer
+                return t
+            e.futuro.cancel()
+            self._cola = [x for x in self._cola if x is not e]
+            return self._rechazar(503, "Servicio ocupado", max(1.0, limite))
+        except asyncio.CancelledError:
+            # el cliente se fue mientras esperaba
+            if e.futuro.done() and not e.futuro.cancelled():
+                self.liberar(t)
+            else:
+                e.futuro.cancel()
+                self._cola = [x for x in self._cola if x is not e]
+            raise
+
+    def _rechazar(self, status: int, detalle: str, reintentar: float) -> Rechazo:
+        self.rechazos[status] += 1
+        return Rechazo(status, detalle, reintentar)
+
+    def estado(self) -> dict:
+        return {
+            "en_curso": dict(self._en_curso),
+            "en_cola": len(self._cola),
+            "espera_pool": round(espera_pool(), 4),
+            "rechazos": dict(self.rechazos),
+        }
+
+
+admision = Admision()
+
+
+def retry_after(segundos: float) -> str:
+    return str(max(1, math.ceil(segundos)))
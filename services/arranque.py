@@ -0,0 +1,141 @@
+# services/arranque.py
+import logging
+import threading
+import time
+from contextlib import ExitStack
+from typing import Optional
+
+import jwt
+from sqlalchemy import text
+from sqlalchemy.orm import configure_mappers
+from sqlmodel import Session
+
+from connection.data.db import engine, read_engine, settings
+from connection.models.modelos import CuentaBancaria, FacturaCompra, Proveedor
+from function.fbancos import SALDO_CUENTA
+from function.fcache import cache_reportes
+from services.seguridad_cliente import JWT_ALG, JWT_SECRET
+
+# Calentamiento después de arrancar. Sin esto los primeros requests de cada réplica pagan abrir
+# conexiones (TLS + auth), configurar los mappers del ORM, cargar el catálogo de Postgres en cada
+# backend nuevo y compilar/preparar las sentencias. Corre en un hilo mientras uvicorn ya acepta
+# conexiones: /health (vida) responde de inmediato y /ready (listo para tráfico) da 503 hasta
+# que termine. Si la BD no está, reintenta con espera creciente.
+
+log = logging.getLogger("bancos.arranque")
+
+# tablas de las que todo request lee: el primer plan en cada backend carga su catálogo
+_TABLAS = ("cuentas_bancarias", "saldos_cuenta", "movimientos_bancarios", "cheques", "chequeras",
+           "proveedores", "facturas_compra", "pagos_proveedor", "tipos_moneda", "eventos_outbox")
+# las tablas chicas que consulta cada movimiento quedan en shared_buffers
+_LEER_COMPLETAS = ("cuentas_bancarias", "saldos_cuenta")
+
+
+def _sentencias_calientes(session: Session) -> None:
+    # lo que hace casi cada request que mueve dinero: validar cuenta/proveedor/factura y leer el
+    # saldo. Con ids inexistentes no devuelven nada, pero compilan y planifican igual.
+    session.get(CuentaBancaria, 0)
+    session.get(Proveedor, 0)
+    session.get(FacturaCompra, 0)
+    session.exec(SALDO_CUENTA, params={"id": 0}).first()
+
+
+class Arranque:
+    def __init__(self):
+        self.listo = False
+        self.error: Optional[str] = None
+        self.fases: dict[str, float] = {}
+        self.intentos = 0
+        self._inicio = time.monotonic()
+        self._duracion: Optional[float] = None
+        self._detener = threading.Event()
+
+    def _fase(self, nombre: str, fn, *args) -> None:
+        inicio = time.perf_counter()
+        fn(*args)
+        self.fases[nombre] = round((time.perf_counter() - inicio) * 1000, 1)
+
+    def _jwt(self) -> None:
+        token = jwt.encode({"sub": "arranque"}, JWT_SECRET, algorithm=JWT_ALG)
+        jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALG])
+
+    def _cache(self) -> None:
+        # con redis la primera consulta abre la conexión
+        if cache_reportes.activo:
+            cache_reportes.backend.generacion("cuentas_bancarias")
+
+    def _pool(self, eng, sentencias: bool) -> None:
+        # todas a la vez: abrirlas de a una devolvería siempre la misma al pool
+        n = min(settings.ARRANQUE_CONEXIONES, eng.pool.size())
+        # psycopg prepara en el servidor después de PG_PREPARE_THRESHOLD ejecuciones
+        repetir = (settings.PG_PREPARE_THRESHOLD or 0) + 1
+        if settings.PGBOUNCER_MODE and not settings.PGBOUNCER_PREPARED:
+            repetir = 1
+        with ExitStack() as pila:
+            conexiones = [pila.enter_context(eng.connect()) for _ in range(n)]
+            for cn in conexiones:
+                for tabla in _TABLAS:
+                    cn.execute(text(f"SELECT * FROM bancos.{tabla} LIMIT 0"))
+                for tabla in _LEER_COMPLETAS:
+                    cn.execute(text(f"SELECT * FROM bancos.{tabla}")).all()
+                if sentencias:
+                    with Session(bind=cn) as session:
+                        for _ in range(repetir):
+                            _sentencias_calientes(session)
+                cn.rollback()
+
+    def _calentar(self) -> None:
+        self._fase("mappers", configure_mappers)
+        self._fase("jwt", self._jwt)
+        self._fase("cache_reportes", self._cache)
+        self._fase("pool", self._pool, engine, True)
+        if read_engine is not engine:
+            self._fase("pool_lectura", self._pool, read_engine, True)
+
+    def calentar(self) -> None:
+        """ bloquea hasta calentar (o hasta `detener`); pensado para correr en un hilo """
+        espera = 1.0
+        while not self._detener.is_set():
+            self.intentos += 1
+            try:
+                self._calentar()
+            except Exception as e:
+                self.error = str(e)
+                log.warning("Calentamiento falló (intento %s), reintento en %.0fs: %s", self.intentos, espera, e)
+                self._detener.wait(espera)
+                espera = min(espera * 2, 30.0)
+                continue
+            self.error = None
+            self._duracion = time.monotonic() - self._inicio
+            self.listo = True
+            log.info("Calentamiento listo en %.2fs: %s", self._duracion, self.fases)
+            return
+
+    def omitir(self) -> None:
+        self._duracion = 0.0
+        self.listo = True
+
+    def detener(self) -> None:
+        self._detener.set()
+
+    def problema(self) -> Optional[str]:
+        """ None si la instancia puede recibir tráfico; si no, el motivo """
+        if not self.listo:
+            return f"calentando: {self.error}" if self.error else "calentando"
+        try:
+            with engine.connect() as cn:
+                cn.execute(text("SELECT 1"))
+        except Exception as e:
+            return f"base de datos no disponible: {e}"
+        return None
+
+    def estado(self) -> dict:
+        return {
+            "listo": self.listo,
+            "segundos": round(self._duracion, 3) if self._duracion is not None else None,
+            "intentos": self.intentos,
+            "fases_ms": dict(self.fases),
+        }
+
+
+arranque = Arranque()
@@ -0,0 +1,266 @@
+# services/compras_cliente.py
+import asyncio
+import logging
+import random
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Optional
+
+import httpx
+from fastapi import HTTPException, status
+
+from connection.data.db import settings
+
+# Cliente del servicio de compras (INVENTORY_URL). Un solo httpx.AsyncClient por proceso con
+# su pool de conexiones (HTTP/2 si está el paquete h2: un request por stream sobre la misma
+# conexión). Encima, en este orden:
+#   - cache con TTL para proveedores (cambian poco y se consultan en cada pago)
+#   - coalescencia: requests iguales en vuelo comparten la misma respuesta
+#   - circuito: después de COMPRAS_CIRCUITO_FALLAS fallas seguidas no se llama al servicio por
+#     COMPRAS_CIRCUITO_ESPERA segundos (503 inmediato); luego pasa un request de prueba
+#   - reintentos: RETRIES veces para errores de red/timeout y 502/503/504, con espera creciente
+# Todos los llamados son GET (idempotentes). Rutas del servicio:
+#   GET /proveedores/{id}            GET /proveedores/{id}/facturas
+#   GET /facturas/{id}               GET /cambios/{proveedores|facturas}?desde=&despues_id=&limite=
+
+log = logging.getLogger("bancos.compras")
+
+_REINTENTABLES = {502, 503, 504}
+
+
+class CircuitoAbierto(Exception):
+    def __init__(self, reintentar: float):
+        super().__init__(f"circuito abierto, reintentar en {reintentar:.0f}s")
+        self.reintentar = reintentar
+
+
+class Circuito:
+    CERRADO, ABIERTO, SEMIABIERTO = "cerrado", "abierto", "semiabierto"
+
+    def __init__(self, fallas: int, espera: float):
+        self.fallas_max = fallas
+        self.espera = espera
+        self.estado = self.CERRADO
+        self.fallas = 0
+        self._abierto_en = 0.0
+        self._probando = False
+
+    def permitir(self) -> None:
+        """ lanza CircuitoAbierto si no se debe llamar al servicio """
+        if self.estado == self.CERRADO:
+            return
+        restante = self._abierto_en + self.espera - time.monotonic()
+        if self.estado == self.ABIERTO and restante > 0:
+            raise CircuitoAbierto(restante)
+        # pasó la espera: un solo request de prueba a la vez
+        if self._probando:
+            raise CircuitoAbierto(1.0)
+        self.estado, self._probando = self.SEMIABIERTO, True
+
+    def exito(self) -> None:
+        if self.estado != self.CERRADO:
+            log.info("Servicio de compras respondió: circuito cerrado")
+        self.estado, self.fallas, self._probando = self.CERRADO, 0, False
+
+    def soltar(self) -> None:
+        # el request de prueba se canceló sin resultado: el siguiente vuelve a probar
+        self._probando = False
+
+    def falla(self) -> None:
+        self.fallas += 1
+        self._probando = False
+        if self.estado == self.SEMIABIERTO or self.fallas >= self.fallas_max:
+            if self.estado != self.ABIERTO:
+                log.warning("Servicio de compras: %s fallas seguidas, circuito abierto %.0fs", self.fallas, self.espera)
+            self.estado, self._abierto_en = self.ABIERTO, time.monotonic()
+
+
+class CacheTTL:
+    ''' LRU con vencimiento; solo guarda respuestas exitosas '''
+
+    def __init__(self, ttl: float, maximo: int):
+        self.ttl, self.maximo = ttl, maximo
+        self._datos: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+        self.hits = self.misses = 0
+
+    def obtener(self, clave: str) -> Optional[Any]:
+        item = self._datos.get(clave)
+        if item is None or item[0] < time.monotonic():
+            if item is not None:
+                del self._datos[clave]
+            self.misses += 1
+            return None
+        self._datos.move_to_end(clave)
+        self.hits += 1
+        return item[1]
+
+    def guardar(self, clave: str, valor: Any) -> None:
+        self._datos[clave] = (time.monotonic() + self.ttl, valor)
+        self._datos.move_to_end(clave)
+        while len(self._datos) > self.maximo:
+            self._datos.popitem(last=False)
+
+    def invalidar(self, clave: Optional[str] = None) -> None:
+        if clave is None:
+            self._datos.clear()
+        else:
+            self._datos.pop(clave, None)
+
+
+def _http2() -> bool:
+    if not settings.COMPRAS_HTTP2:
+        return False
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        log.info("Paquete h2 no instalado: el cliente de compras usa HTTP/1.1")
+        return False
+    return True
+
+
+class ClienteCompras:
+    def __init__(self, base_url: Optional[str] = None):
+        self.base_url = (base_url or settings.INVENTORY_URL).rstrip("/")
+        self._http: Optional[httpx.AsyncClient] = None
+        self.http2: Optional[bool] = None
+        self._en_vuelo: dict[str, asyncio.Future] = {}
+        self.circuito = Circuito(settings.COMPRAS_CIRCUITO_FALLAS, settings.COMPRAS_CIRCUITO_ESPERA)
+        self.cache_proveedores = CacheTTL(settings.COMPRAS_CACHE_TTL, settings.COMPRAS_CACHE_MAX)
+        self.llamadas = 0          # requests que salieron hacia el servicio (con reintentos)
+        self.coalescidos = 0
+
+    def _cliente(self) -> httpx.AsyncClient:
+        if self._http is None:
+            self.http2 = _http2()
+            self._http = httpx.AsyncClient(
+                base_url=self.base_url,
+                http2=self.http2,
+                timeout=httpx.Timeout(settings.REQUEST_TIMEOUT),
+                limits=httpx.Limits(max_connections=settings.COMPRAS_MAX_CONEXIONES,
+                                    max_keepalive_connections=settings.COMPRAS_MAX_CONEXIONES),
+                headers={"Accept": "application/json"},
+            )
+        return self._http
+
+    async def cerrar(self) -> None:
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+
+    #---------------- llamada con reintentos y circuito ----------------
+    async def _llamar(self, ruta: str, params: Optional[dict]) -> Optional[Any]:
+        ''' JSON de la respuesta, None si es 404 '''
+        try:
+            self.circuito.permitir()
+        except CircuitoAbierto as e:
+            raise HTTPException(status.HTTP_503_SERVICE_UNAVAILABLE, "Servicio de compras no disponible",
+                                headers={"Retry-After": str(max(1, int(e.reintentar)))}) from e
+        try:
+            return await self._intentos(ruta, params)
+        except asyncio.CancelledError:
+            self.circuito.soltar()
+            raise
+
+    async def _intentos(self, ruta: str, params: Optional[dict]) -> Optional[Any]:
+        error: Optional[str] = None
+        for intento in range(settings.RETRIES + 1):
+            if intento:
+                await asyncio.sleep(min(0.1 * 2 ** intento, 2.0) * random.uniform(0.5, 1.0))
+            self.llamadas += 1
+            try:
+                r = await self._cliente().get(ruta, params=params)
+            except httpx.TransportError as e:   # conexión, timeout, protocolo
+                error = f"{type(e).__name__}: {e}"
+                continue
+            if r.status_code in _REINTENTABLES:
+                error = f"HTTP {r.status_code}"
+                continue
+            # cualquier otra respuesta prueba que el servicio está vivo
+            self.circuito.exito()
+            if r.status_code == 404:
+                return None
+            if r.status_code >= 400:
+                raise HTTPException(status.HTTP_502_BAD_GATEWAY, f"Servicio de compras respondió {r.status_code}")
+            return r.json()
+        self.circuito.falla()
+        log.warning("Servicio de compras falló en %s: %s", ruta, error)
+        raise HTTPException(status.HTTP_502_BAD_GATEWAY, f"Servicio de compras no responde ({error})")
+
+    async def _coalescer(self, clave: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        ''' una sola llamada en vuelo por clave; los demás esperan el mismo resultado '''
+        futuro = self._en_vuelo.get(clave)
+        if futuro is not None:
+            self.coalescidos += 1
+            return await asyncio.shield(futuro)
+        futuro = asyncio.ensure_future(fn())
+        self._en_vuelo[clave] = futuro
+        futuro.add_done_callback(lambda f: (self._en_vuelo.pop(clave, None), f.cancelled() or f.exception()))
+        # shield: si el primero que pidió se cancela, los demás igual reciben la respuesta
+        return await asyncio.shield(futuro)
+
+    async def obtener(self, ruta: str, params: Optional[dict] = None) -> Optional[Any]:
+        clave = ruta + ("?" + str(httpx.QueryParams(params)) if params else "")
+        return await self._coalescer(clave, lambda: self._llamar(ruta, params))
+
+    #---------------- recursos ----------------
+    async def proveedor(self, proveedor_id: int) -> dict:
+        clave = str(proveedor_id)
+        valor = self.cache_proveedores.obtener(clave)
+        if valor is not None:
+            return valor
+        valor = await self.obtener(f"/proveedores/{proveedor_id}")
+        if valor is None:
+            raise HTTPException(status.HTTP_404_NOT_FOUND, "Proveedor no existe en compras")
+        self.cache_proveedores.guardar(clave, valor)
+        return valor
+
+    async def proveedores(self, ids: list[int]) -> dict[int, dict]:
+        """ varios proveedores en paralelo (los que no existen no vienen) """
+        async def _uno(i: int) -> Optional[dict]:
+            try:
+                return await self.proveedor(i)
+            except HTTPException as e:
+                if e.status_code == status.HTTP_404_NOT_FOUND:
+                    return None
+                raise
+        valores = await asyncio.gather(*(_uno(i) for i in dict.fromkeys(ids)))
+        return {i: v for i, v in zip(dict.fromkeys(ids), valores) if v is not None}
+
+    async def facturas_proveedor(self, proveedor_id: int, estado: Optional[str] = None) -> list[dict]:
+        params = {"estado": estado} if estado else None
+        valor = await self.obtener(f"/proveedores/{proveedor_id}/facturas", params)
+        if valor is None:
+            raise HTTPException(status.HTTP_404_NOT_FOUND, "Proveedor no existe en compras")
+        return valor
+
+    async def factura(self, factura_id: int) -> dict:
+        valor = await self.obtener(f"/facturas/{factura_id}")
+        if valor is None:
+            raise HTTPException(status.HTTP_404_NOT_FOUND, "Factura no existe en compras")
+        return valor
+
+    async def cambios(self, recurso: str, desde: Optional[datetime], despues_id: int, limite: int) -> list[dict]:
+        """ registros de `recurso` modificados después de (desde, despues_id), en ese orden """
+        params = {"despues_id": despues_id, "limite": limite}
+        if desde is not None:
+            params["desde"] = desde.isoformat()
+        valor = await self.obtener(f"/cambios/{recurso}", params)
+        if valor is None:
+            raise HTTPException(status.HTTP_502_BAD_GATEWAY, f"Servicio de compras sin cambios de {recurso}")
+        return valor["items"]
+
+    def estado(self) -> dict:
+        c = self.cache_proveedores
+        return {
+            "url": self.base_url,
+            "http2": self.http2,
+            "circuito": {"estado": self.circuito.estado, "fallas": self.circuito.fallas},
+            "cache_proveedores": {"hits": c.hits, "misses": c.misses, "tamanio": len(c._datos)},
+            "llamadas": self.llamadas,
+            "coalescidos": self.coalescidos,
+            "en_vuelo": len(self._en_vuelo),
+        }
+
+
+compras = ClienteCompras()
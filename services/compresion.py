@@ -0,0 +1,123 @@
+# services/compresion.py
+import zlib
+from typing import Optional
+
+from starlette.datastructures import Headers
+from starlette.middleware.gzip import IdentityResponder
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from connection.data.db import settings
+
+# Compresión negociada por Accept-Encoding (br si está el paquete brotli, si no gzip). Usa el
+# IdentityResponder de Starlette (el mismo del GZipMiddleware) para el manejo de encabezados y
+# de respuestas chicas; la diferencia es que cada parte de una respuesta en streaming se
+# comprime con flush, así que el cliente recibe las líneas NDJSON a medida que salen en vez de
+# cuando el compresor junta suficiente. Lo que ya viene comprimido (Parquet/Arrow) pasa igual.
+
+_SIN_COMPRIMIR = ("text/event-stream", "application/vnd.apache.", "image/", "application/zip",
+                  "application/gzip", "application/octet-stream")
+
+
+def _brotli():
+    try:
+        import brotli
+    except ImportError:
+        return None
+    return brotli
+
+
+def _calidad(valor: str) -> float:
+    _, _, params = valor.partition(";")
+    for p in params.split(";"):
+        k, _, v = p.strip().partition("=")
+        if k == "q":
+            try:
+                return float(v)
+            except ValueError:
+                return 0.0
+    return 1.0
+
+
+def negociar(accept_encoding: str, hay_brotli: bool) -> Optional[str]:
+    """ codificación a usar según Accept-Encoding (None = sin comprimir) """
+    ofrecidas = {}
+    for item in accept_encoding.split(","):
+        nombre = item.split(";")[0].strip().lower()
+        if nombre:
+            ofrecidas[nombre] = _calidad(item)
+    comodin = ofrecidas.get("*", 0.0)
+    candidatas = (["br"] if hay_brotli else []) + ["gzip"]
+    mejor, mejor_q = None, 0.0
+    for c in candidatas:
+        q = ofrecidas.get(c, comodin)
+        if q > mejor_q:
+            mejor, mejor_q = c, q
+    return mejor
+
+
+class _Responder(IdentityResponder):
+    def __init__(self, app: ASGIApp, minimum_size: int):
+        super().__init__(app, minimum_size)
+        self._pendiente = b""
+        self._juntando = True
+
+    async def send_with_compression(self, message: Message) -> None:
+        if message["type"] == "http.response.start":
+            await super().send_with_compression(message)
+            tipo = Headers(raw=message["headers"]).get("content-type", "")
+            self.content_type_is_excluded = self.content_type_is_excluded or tipo.startswith(_SIN_COMPRIMIR)
+            return
+        if message["type"] == "http.response.body" and self._juntando and not self.content_type_is_excluded:
+            # los middlewares @app.middleware re-envían todo como streaming: se junta hasta el
+            # mínimo para que una respuesta chica siga yendo sin comprimir
+            cuerpo = self._pendiente + message.get("body", b"")
+            if message.get("more_body", False) and len(cuerpo) < self.minimum_size:
+                self._pendiente = cuerpo
+                return
+            self._juntando, self._pendiente = False, b""
+            message = {**message, "body": cuerpo}
+        await super().send_with_compression(message)
+
+
+class _Gzip(_Responder):
+    content_encoding = "gzip"
+
+    def __init__(self, app: ASGIApp, minimum_size: int, nivel: int):
+        super().__init__(app, minimum_size)
+        self._z = zlib.compressobj(nivel, zlib.DEFLATED, 31)   # 31 = formato gzip
+
+    def apply_compression(self, body: bytes, *, more_body: bool) -> bytes:
+        return self._z.compress(body) + self._z.flush(zlib.Z_SYNC_FLUSH if more_body else zlib.Z_FINISH)
+
+
+class _Brotli(_Responder):
+    content_encoding = "br"
+
+    def __init__(self, app: ASGIApp, minimum_size: int, calidad: int, brotli):
+        super().__init__(app, minimum_size)
+        self._c = brotli.Compressor(quality=calidad)
+
+    def apply_compression(self, body: bytes, *, more_body: bool) -> bytes:
+        salida = self._c.process(body)
+        return salida + (self._c.flush() if more_body else self._c.finish())
+
+
+class Compresion:
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        self._brotli = _brotli()
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not settings.COMPRESION_ACTIVA:
+            await self.app(scope, receive, send)
+            return
+        codificacion = negociar(Headers(scope=scope).get("accept-encoding", ""), self._brotli is not None)
+        minimo = settings.COMPRESION_MINIMO
+        if codificacion == "br":
+            responder = _Brotli(self.app, minimo, settings.COMPRESION_BROTLI_CALIDAD, self._brotli)
+        elif codificacion == "gzip":
+            responder = _Gzip(self.app, minimo, settings.COMPRESION_GZIP_NIVEL)
+        else:
+            await self.app(scope, receive, send)
+            return
+        await responder(scope, receive, send)